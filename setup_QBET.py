@@ -14,6 +14,12 @@ def create_initialized_file(start_folder):
     with open(os.path.join(start_folder, 'Initialized'), 'w') as f:
         f.write('Initialized')
 
+def venv_python(start_folder):
+    """Path of the virtual environment's interpreter; running it directly needs no activate script."""
+    if os.name == "nt":
+        return os.path.join(start_folder, "venv", "Scripts", "python.exe")
+    return os.path.join(start_folder, "venv", "bin", "python")
+
 def main():
     root_directory = os.path.abspath(os.path.dirname(__file__))  # 获取当前文件的绝对路径
     start_folder = os.path.join(root_directory, 'start')  # 将当前目录与'start'文件夹拼接
@@ -81,22 +87,19 @@ def main():
     os.remove(file_name)
     shutil.rmtree(extracted_folder)
 
-    # Step 4.1: Create a virtual environment
+    # Step 4: Create a virtual environment; its interpreter is used directly from here on
     print("Creating virtual environment...")
-    subprocess.run(["python3", "-m", "venv", "venv"], check=True)
-
-    # Step 4.2: Activate the virtual environment
-    activate_script = os.path.join("venv", "Scripts", "activate")
-    subprocess.run(activate_script, shell=True)
+    subprocess.run([sys.executable, "-m", "venv", "venv"], check=True)
+    python = venv_python(start_folder)
 
     # Step 5.1: Install packages from requirements.txt with updated pip, setuptools, and wheel
     print("Updating pip, setuptools, and wheel...")
-    subprocess.run(["pip", "install", "--upgrade", "pip", "setuptools", "wheel"], check=True)
+    subprocess.run([python, "-m", "pip", "install", "--upgrade", "pip", "setuptools", "wheel"], check=True)
 
     # Step 5.2: Install packages from requirements.txt
     print("Installing packages from requirements.txt...")
     try:
-        subprocess.run(["pip", "install", "-r", "requirements.txt"], check=True)
+        subprocess.run([python, "-m", "pip", "install", "-r", "requirements.txt"], check=True)
     except subprocess.CalledProcessError as e:
         print(f"Error occurred while installing requirements: {e}")
         return
@@ -106,13 +109,15 @@ def main():
     print("Initialization complete.")
 
     # Run the main program
-    subprocess.run(["python3", "main.py"], check=True)
+    subprocess.run([python, "main.py"], check=True)
 
 def start(start_folder):
     os.chdir(start_folder)
-    activate_script = os.path.join("venv", "Scripts", "activate")
-    subprocess.run(activate_script, shell=True)
-    subprocess.run(["python3", "main.py"], check=True)
+    python = venv_python(start_folder)
+    if not os.path.isfile(python):
+        print(f"{python} not found; starting main.py with {sys.executable}.")
+        python = sys.executable
+    subprocess.run([python, "main.py"], check=True)
 
 if __name__ == "__main__":
     main()
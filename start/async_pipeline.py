@@ -0,0 +1,248 @@
+"""
+File name:
+  async_pipeline.py
+
+Function:
+  asyncio orchestrator for the headless pipeline: scan -> copy -> crop -> OCR -> question-bank commit.
+  Every stage has a bounded queue and its own concurrency limit, so disk I/O, OCR and writing overlap and
+  a slow stage applies backpressure upstream. Cancelling the run cancels every stage; recognitions already
+  handed to ocr_integration finish on their worker threads. A page that cannot be decoded or cropped is
+  skipped with a "skipped" event, the rest of the run goes on.
+  Pages are normalized (see normalizer.py) on a process pool right before they are cropped.
+  Crops travel to OCR in memory unless temp_files is set.
+
+Dependencies:
+  asyncio
+  image_processor
+  ingest_manifest
+  normalizer
+  crop_engine
+  ocr_integration
+  headless_pipeline
+  qb_store
+  instrumentation
+
+"""
+
+
+# async_pipeline.py
+
+import os
+import asyncio
+import ocr_integration
+from image_processor import scan_images, drop_stale, TARGET_FOLDER
+from ingest_manifest import IngestManifest
+from normalizer import NormalizePool, NORMALIZED_FOLDER
+from crop_engine import crop_regions, crop_region_buffers, crop_path
+from headless_pipeline import find_regions
+from qb_store import QuestionBankStore
+from instrumentation import span, count
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_CROP_WORKERS = 2
+
+# Marks the end of a stage's output
+DONE = object()
+
+def _read_text(path):
+    with open(path, "r", encoding="utf-8") as text_file:
+        return text_file.read()
+
+async def ocr_region(number, session=None, cache=None, image_bytes=None):
+    """
+    Recognize one crop on a worker thread, without blocking the event loop.
+
+    Goes through ocr_integration.recognize_crop when image_bytes is given, else through
+    ocr_integration.run_ocr on temp/<number>/Q.png, so the cache and the engine are used
+    exactly as in the synchronous pipeline.
+
+    Returns:
+        dict: The recognize_crop result: "image_number", "success", "cached", "text" and "error".
+    """
+    if image_bytes is not None:
+        return await asyncio.to_thread(ocr_integration.recognize_crop, number, image_bytes, session, cache)
+    result = await asyncio.to_thread(ocr_integration.run_ocr, number, session, cache)
+    result["text"] = None
+    if result["success"]:
+        try:
+            result["text"] = await asyncio.to_thread(_read_text, result["output_path"])
+        except OSError as e:
+            result["success"], result["error"] = False, str(e)
+    return result
+
+async def _run_stages(coroutines):
+    # Run all stages; the first failure (or an outside cancellation) cancels the others.
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def run_async_pipeline(source, regions, emit, target_folder=TARGET_FOLDER, store=None, session=None, cache=None,
+                             crop_workers=DEFAULT_CROP_WORKERS, ocr_workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                             duplicates="flag", temp_files=False):
+    """
+    Staged, overlapping version of headless_pipeline.run_pipeline.
+
+    Scan and copy run one at a time (the manifest assigns serial numbers in scan order), crop
+    and OCR run crop_workers and ocr_workers at once, and commits are applied in arrival order.
+
+    Args:
+        source (str): Source image or folder.
+        regions (dict): Parsed region spec, see headless_pipeline.load_region_spec.
+        emit (callable): Progress callback, called as emit(event, **fields).
+        target_folder (str): Ingest target folder.
+        store (QuestionBankStore): Where questions and answers are written. Defaults to a store on
+            STORE_FILE_PATH and MARKDOWN_FILE_PATH, opened and closed by this call.
+        session (OCRSession): Optional running OCR engine.
+        cache (OCRCache): Optional OCR result cache.
+        crop_workers (int): Pages normalized and cropped at once.
+        ocr_workers (int): Crops recognized at once. Defaults to the CPU count.
+        queue_size (int): Capacity of each inter-stage queue.
+        duplicates (str): "skip", "flag" or "keep" near-duplicate images.
+        temp_files (bool): Pass crops and text through temp/<n>/ files instead of memory.
+
+    Returns:
+        dict: Summary counts, as run_pipeline.
+    """
+    if store is None:
+        with QuestionBankStore() as store:
+            return await run_async_pipeline(source, regions, emit, target_folder, store, session, cache, crop_workers,
+                                            ocr_workers, queue_size, duplicates, temp_files)
+    ocr_workers = max(1, ocr_workers or ocr_integration.DEFAULT_MAX_WORKERS)
+    crop_workers = max(1, crop_workers)
+    summary = {"images": 0, "pages": 0, "regions": 0, "ocr_failed": 0, "answers": 0}
+
+    os.makedirs(target_folder, exist_ok=True)
+    manifest = IngestManifest(target_folder, duplicates)
+    scan_queue = asyncio.Queue(queue_size)
+    crop_queue = asyncio.Queue(queue_size)
+    ocr_queue = asyncio.Queue(queue_size)
+    commit_queue = asyncio.Queue(queue_size)
+    normalize_pool = NormalizePool(os.path.join(target_folder, NORMALIZED_FOLDER), crop_workers)
+    next_number = [1]
+    live_workers = {"crop": crop_workers, "ocr": ocr_workers}
+
+    async def finish(stage, downstream, downstream_workers):
+        # The last worker of a stage tells every downstream worker to stop.
+        live_workers[stage] -= 1
+        if live_workers[stage] == 0:
+            for _ in range(downstream_workers):
+                await downstream.put(DONE)
+
+    async def scan_stage():
+        paths = scan_images(source, exclude_dirs=(target_folder,))
+        while (path := await asyncio.to_thread(next, paths, None)) is not None:
+            await scan_queue.put(path)
+        await scan_queue.put(DONE)
+
+    async def copy_stage():
+        scanned = []
+        try:
+            while (path := await scan_queue.get()) is not DONE:
+                scanned.append(path)
+                try:
+                    with span("ingest", image=path):
+                        entry, status = await asyncio.to_thread(manifest.ingest, path)
+                except OSError as e:
+                    count("ingest.failed")
+                    emit("error", message=f"Error copying '{path}': {e}")
+                    continue
+                count(f"ingest.{status}")
+                if status == "duplicate":
+                    emit("duplicate", source=path, original=entry["duplicate_of"])
+                    continue
+                image_path = manifest.target_path(entry)
+                summary["images"] += 1
+                emit("ingested", serial=entry["serial"], path=image_path, source=path, count=summary["images"])
+                spec = find_regions(regions, source, path, entry["serial"])
+                if spec and spec["areas"]:
+                    await crop_queue.put((entry["serial"], image_path, entry["sha256"], spec))
+            await asyncio.to_thread(drop_stale, manifest, scanned)
+        finally:
+            await asyncio.to_thread(manifest.save)
+        for _ in range(crop_workers):
+            await crop_queue.put(DONE)
+
+    async def crop_worker():
+        while (item := await crop_queue.get()) is not DONE:
+            serial, image_path, digest, spec = item
+            future = normalize_pool.submit(serial, image_path, digest)
+            await asyncio.wait([asyncio.wrap_future(future)])  # Errors are settled by result() below
+            normalized, error = normalize_pool.result(image_path, future)
+            if error is not None:
+                emit("error", message=f"Cannot normalize '{image_path}', using it as is: {error}")
+            image_path = normalized
+            start_number = next_number[0]
+            next_number[0] += len(spec["areas"])
+            try:
+                if temp_files:
+                    numbers = await asyncio.to_thread(crop_regions, image_path, spec["areas"], spec["scale"], None, start_number)
+                    buffers = [None] * len(numbers)
+                else:
+                    crops = await asyncio.to_thread(crop_region_buffers, image_path, spec["areas"], spec["scale"])
+                    numbers = [start_number + index for index, _ in crops]
+                    buffers = [data for _, data in crops]
+            except (OSError, ValueError) as e:
+                count("crop.failed")
+                emit("skipped", serial=serial, reason=f"cannot crop '{image_path}': {e}")
+                continue
+            page = {"serial": serial, "image_path": image_path, "spec": spec, "first": start_number, "numbers": numbers,
+                    "texts": {}, "remaining": len(numbers)}
+            summary["pages"] += 1
+            summary["regions"] += len(numbers)
+            emit("cropped", serial=serial, regions=numbers)
+            if not numbers:
+                await commit_queue.put(page)
+            for number, image_bytes in zip(numbers, buffers):
+                await ocr_queue.put((page, number, image_bytes))
+        await finish("crop", ocr_queue, ocr_workers)
+
+    async def ocr_worker():
+        while (item := await ocr_queue.get()) is not DONE:
+            page, number, image_bytes = item
+            result = await ocr_region(number, session, cache, image_bytes)
+            if result["success"]:
+                page["texts"][number] = result["text"].strip()
+            else:
+                summary["ocr_failed"] += 1
+            emit("ocr", region=number, success=result["success"], cached=result["cached"], error=result["error"])
+            page["remaining"] -= 1
+            if page["remaining"] == 0:
+                await commit_queue.put(page)
+        await finish("ocr", commit_queue, 1)
+
+    async def commit_stage():
+        while (page := await commit_queue.get()) is not DONE:
+            # Area i of the page is region number first + i, empty areas included (see crop_engine)
+            first, texts = page["first"], page["texts"]
+            if first not in texts:
+                emit("skipped", serial=page["serial"], reason="question OCR failed")
+                continue
+            question = texts[first]
+            for number in page["numbers"]:
+                if number == first or number not in texts:
+                    continue
+                region = number - first + 1
+                if await asyncio.to_thread(store.add, question, texts[number], region in page["spec"]["correct"],
+                                           page["image_path"], 1, region):
+                    summary["answers"] += 1
+            emit("committed", serial=page["serial"], question=question)
+        await asyncio.to_thread(store.flush)
+
+    try:
+        await _run_stages([
+            scan_stage(),
+            copy_stage(),
+            *(crop_worker() for _ in range(crop_workers)),
+            *(ocr_worker() for _ in range(ocr_workers)),
+            commit_stage(),
+        ])
+    finally:
+        normalize_pool.shutdown(wait=False)
+    return summary
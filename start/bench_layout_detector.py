@@ -0,0 +1,124 @@
+"""
+File name:
+  bench_layout_detector.py
+
+Function:
+  Benchmark for layout_detector on synthetic question pages: one question block followed by answer
+  blocks, with known boxes, light noise and blur. Reports pages per second and box recall at IoU >= 0.5.
+
+Dependencies:
+  argparse
+  numpy
+  cv2
+  layout_detector
+
+"""
+
+
+# bench_layout_detector.py
+
+import json
+import time
+import argparse
+import numpy as np # type: ignore
+import cv2 # type: ignore
+from layout_detector import detect_layout
+
+WORDS = ("which", "of", "the", "following", "is", "correct", "answer", "value", "energy", "cell",
+         "protein", "market", "river", "capital", "function", "system", "none", "all", "above")
+IOU_THRESHOLD = 0.5
+
+def synthetic_page(rng, width, height):
+    """
+    Draw a page with a question block and 2-5 answer blocks.
+
+    Returns:
+        tuple: (H x W x 3 uint8 page, list of ground-truth (x0, y0, x1, y1) boxes).
+    """
+    page = np.full((height, width, 3), 255, np.uint8)
+    scale = height / 500 * 0.5
+    thickness = max(1, int(round(scale * 2)))
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    _, line_height = cv2.getTextSize("Ag", font, scale, thickness)[0]
+    line_step = int(line_height * 1.8)  # Baseline to baseline inside a block
+    block_gap = int(line_height * 2.2)   # Extra space between blocks
+
+    boxes = []
+    y = int(line_height * 2)
+    margin = int(width * 0.06)
+    blocks = [int(rng.integers(1, 4))] + [int(rng.integers(1, 3)) for _ in range(int(rng.integers(2, 6)))]
+    for index, line_count in enumerate(blocks):
+        x = margin if index == 0 else margin + int(width * 0.04)
+        box = [width, height, 0, 0]
+        for _ in range(line_count):
+            text = " ".join(rng.choice(WORDS, int(rng.integers(2, 7))))
+            (text_width, text_height), baseline = cv2.getTextSize(text, font, scale, thickness)
+            if y + baseline >= height or x + text_width >= width:
+                break
+            cv2.putText(page, text, (x, y), font, scale, (0, 0, 0), thickness, cv2.LINE_AA)
+            box = [min(box[0], x), min(box[1], y - text_height), max(box[2], x + text_width), max(box[3], y + baseline)]
+            y += line_step
+        if box[2] > box[0]:
+            boxes.append(tuple(box))
+        y += block_gap
+
+    # Scanner noise: specks and a slight blur
+    specks = rng.random((height, width)) < 0.0005
+    page[specks] = 0
+    page = cv2.GaussianBlur(page, (3, 3), 0)
+    return page, boxes
+
+def iou(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+def recall(truth, proposed):
+    # Fraction of ground-truth boxes matched one-to-one by a proposal with IoU >= IOU_THRESHOLD.
+    unused = list(proposed)
+    matched = 0
+    for box in truth:
+        scores = [iou(box, candidate) for candidate in unused]
+        if scores and max(scores) >= IOU_THRESHOLD:
+            unused.pop(int(np.argmax(scores)))
+            matched += 1
+    return matched, len(truth)
+
+def run(pages, width, height, seed):
+    rng = np.random.default_rng(seed)
+    corpus = [synthetic_page(rng, width, height) for _ in range(pages)]
+
+    matched = total = proposed = 0
+    start = time.perf_counter()
+    detections = [detect_layout(page) for page, _ in corpus]
+    elapsed = time.perf_counter() - start
+
+    for (_, truth), boxes in zip(corpus, detections):
+        hits, count = recall(truth, boxes)
+        matched += hits
+        total += count
+        proposed += len(boxes)
+    return {
+        "pages": pages,
+        "size": [width, height],
+        "pages_per_second": round(pages / elapsed, 1),
+        "recall": round(matched / total, 4) if total else None,
+        "precision": round(matched / proposed, 4) if proposed else None,
+        "boxes": total,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark layout_detector on synthetic pages.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--sizes", default="375x500,1500x2000", help="Comma-separated WIDTHxHEIGHT page sizes.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes.split(","):
+        width, height = (int(value) for value in size.lower().split("x"))
+        print(json.dumps(run(args.pages, width, height, args.seed)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+File name:
+  bench_ocr_preprocess.py
+
+Function:
+  Benchmark for ocr_preprocess: OCRs the same synthetic crops (photographed-looking: large, skewed,
+  unevenly lit, noisy, with known text) raw and pre-processed, and reports pre-processing cost, pixel
+  counts, OCR latency and how close each output is to the known text.
+
+Dependencies:
+  argparse
+  difflib
+  numpy
+  cv2
+  ocr_preprocess
+  ocr_integration
+
+"""
+
+
+# bench_ocr_preprocess.py
+
+import os
+import sys
+import json
+import time
+import shlex
+import difflib
+import argparse
+import tempfile
+import contextlib
+import numpy as np # type: ignore
+import cv2 # type: ignore
+import ocr_integration
+import ocr_preprocess
+from crop_engine import crop_path, _write_crop
+
+WORDS = ("which", "of", "the", "following", "is", "correct", "answer", "value", "energy", "cell",
+         "protein", "market", "river", "capital", "function", "system", "none", "all", "above")
+
+def synthetic_crop(rng, scale):
+    """
+    Render one to three lines of text the way a phone photo of a page would show them.
+
+    Returns:
+        tuple: (H x W x 3 uint8 crop, the text).
+    """
+    lines = [" ".join(rng.choice(WORDS, int(rng.integers(3, 7)))) for _ in range(int(rng.integers(1, 4)))]
+    font, font_scale, thickness = cv2.FONT_HERSHEY_SIMPLEX, 1.0 * scale, max(1, int(2 * scale))
+    line_height = int(40 * scale)
+    width = max(cv2.getTextSize(line, font, font_scale, thickness)[0][0] for line in lines) + int(60 * scale)
+    height = line_height * len(lines) + int(40 * scale)
+    crop = np.full((height, width), 255, np.uint8)
+    for index, line in enumerate(lines):
+        cv2.putText(crop, line, (int(30 * scale), int(30 * scale) + line_height * (index + 1) - int(10 * scale)),
+                    font, font_scale, 0, thickness, cv2.LINE_AA)
+
+    crop = ocr_preprocess.rotate(crop, float(rng.uniform(-4, 4)))
+    # Uneven lighting and sensor noise
+    gradient = np.linspace(0, float(rng.uniform(40, 90)), crop.shape[1], dtype=np.float32)
+    noisy = crop.astype(np.float32) - gradient[None, :] + rng.normal(0, 12, crop.shape).astype(np.float32)
+    crop = np.clip(noisy, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR), "\n".join(lines)
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, " ".join(a.lower().split()), " ".join(b.lower().split())).ratio()
+
+def run_ocr_batch(numbers, session, workers):
+    start = time.perf_counter()
+    results = ocr_integration.batch_run_ocr(numbers, max_workers=workers, session=session)
+    elapsed = time.perf_counter() - start
+    texts = []
+    for number, result in zip(numbers, results):
+        text = ""
+        if result["success"]:
+            with open(result["output_path"], "r", encoding="utf-8") as text_file:
+                text = text_file.read()
+        texts.append(text)
+    return elapsed, texts, sum(1 for result in results if not result["success"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR on raw and pre-processed crops.")
+    parser.add_argument("--crops", type=int, default=50)
+    parser.add_argument("--scale", type=float, default=3.0, help="Size of the synthetic crops (3 ~ phone photo).")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--ocr-command", default=None, help="OCR executable and leading arguments (default: umi-ocr).")
+    parser.add_argument("--session", action="store_true", help="Use one long-lived OCR engine over its HTTP API.")
+    parser.add_argument("--port", type=int, default=ocr_integration.DEFAULT_OCR_PORT)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.ocr_command:
+        ocr_integration.OCR_COMMAND = shlex.split(args.ocr_command)
+    rng = np.random.default_rng(args.seed)
+    corpus = [synthetic_crop(rng, args.scale) for _ in range(args.crops)]
+
+    with tempfile.TemporaryDirectory(prefix="qbet-bench-") as temp_dir:
+        ocr_integration.TEMP_DIR = temp_dir
+        raw_numbers = list(range(1, args.crops + 1))
+        processed_numbers = list(range(args.crops + 1, 2 * args.crops + 1))
+
+        for number, (crop, _) in zip(raw_numbers, corpus):
+            _write_crop(crop_path(number), crop)
+        start = time.perf_counter()
+        processed = [ocr_preprocess.preprocess(crop) for crop, _ in corpus]
+        preprocess_seconds = time.perf_counter() - start
+        for number, crop in zip(processed_numbers, processed):
+            _write_crop(crop_path(number), crop)
+
+        # The OCR modules report progress on stdout; keep it for the JSON report
+        with contextlib.redirect_stdout(sys.stderr), contextlib.ExitStack() as stack:
+            session = stack.enter_context(ocr_integration.OCRSession(port=args.port)) if args.session else None
+            raw_seconds, raw_texts, raw_failed = run_ocr_batch(raw_numbers, session, args.workers)
+            processed_seconds, processed_texts, processed_failed = run_ocr_batch(processed_numbers, session, args.workers)
+
+        truth = [text for _, text in corpus]
+        report = {
+            "crops": args.crops,
+            "preprocess_ms_per_crop": round(preprocess_seconds / args.crops * 1000, 2),
+            "pixels_raw": int(sum(crop.shape[0] * crop.shape[1] for crop, _ in corpus)),
+            "pixels_preprocessed": int(sum(crop.shape[0] * crop.shape[1] for crop in processed)),
+            "bytes_raw": sum(os.path.getsize(crop_path(number)) for number in raw_numbers),
+            "bytes_preprocessed": sum(os.path.getsize(crop_path(number)) for number in processed_numbers),
+            "raw": {"ocr_seconds": round(raw_seconds, 3), "failed": raw_failed,
+                    "similarity": round(float(np.mean([similarity(t, o) for t, o in zip(truth, raw_texts)])), 4)},
+            "preprocessed": {"ocr_seconds": round(processed_seconds, 3), "failed": processed_failed,
+                             "similarity": round(float(np.mean([similarity(t, o) for t, o in zip(truth, processed_texts)])), 4)},
+            "agreement": round(float(np.mean([similarity(a, b) for a, b in zip(raw_texts, processed_texts)])), 4),
+        }
+    print(json.dumps(report, indent=1))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+File name:
+  bench_suite.py
+
+Function:
+  End-to-end benchmark: generates a synthetic corpus of question pages and times ingest, preview
+  loading, cropping, OCR dispatch and question-bank writing at several corpus sizes, with the stub
+  engine from ocr_stub_engine.py standing in for umi-ocr. Results are written as JSON so runs can be
+  compared (e.g. before and after a change).
+
+Dependencies:
+  argparse
+  numpy
+  cv2
+  PIL
+  image_processor
+  normalizer
+  output_generator
+  selection_tool
+  preview_cache
+  crop_engine
+  ocr_integration
+  ocr_stub_engine
+  markdown_updater
+  qb_store
+  instrumentation
+
+"""
+
+
+# bench_suite.py
+
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import numpy as np # type: ignore
+import cv2 # type: ignore
+import ocr_integration
+import preview_cache
+import markdown_updater
+import instrumentation
+from bench_layout_detector import synthetic_page
+from image_processor import process_images
+from normalizer import STAMP_SUFFIX
+from output_generator import OutputGenerator
+from crop_engine import crop_regions, crop_region_buffers
+from preview_cache import PreviewCache
+from qb_store import QuestionBankStore
+from ocr_stub_engine import stub_cli_command, stub_stdin_command, start_stub_server
+
+DEFAULT_SCALES = "10,100,500"
+# Pages per scale that go through preview loading, cropping and OCR; ingest always sees the whole corpus
+DEFAULT_SAMPLE = 50
+# Areas cropped from each sampled page: a question and three answers, as (x0, y0, x1, y1) fractions
+AREAS = ((0.05, 0.02, 0.95, 0.2), (0.08, 0.25, 0.9, 0.35), (0.08, 0.4, 0.9, 0.5), (0.08, 0.55, 0.9, 0.65))
+
+def generate_corpus(folder, count, width, height, image_format, seed):
+    # Distinct synthetic pages, so none of them is skipped as a near duplicate.
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for index in range(count):
+        page, _ = synthetic_page(rng, width, height)
+        cv2.imwrite(os.path.join(folder, f"page_{index:06d}.{image_format}"), page)
+
+class Timer:
+    # Collects named wall-clock timings, in seconds.
+    def __init__(self):
+        self.timings = {}
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - start, 4)
+
+def load_image(image_path):
+    # SelectionTool.load_image without the widget around it (it only needs image_path and preview).
+    from selection_tool import SelectionTool
+    tool = types.SimpleNamespace(image_path=image_path, preview=None)
+    SelectionTool.load_image(tool)
+    return tool
+
+def tk_available():
+    try:
+        import tkinter
+        root = tkinter.Tk()
+    except Exception:
+        return False
+    root.destroy()  # Only probing for a display; the preview benchmark opens its own root
+    return True
+
+def run_scale(count, args, workdir):
+    """
+    Time every stage on a corpus of count pages.
+
+    Returns:
+        dict: {"pages": count, "timings": {stage: seconds}, ...}.
+    """
+    source = os.path.join(workdir, "corpus")
+    generate_corpus(source, count, args.width, args.height, args.format, args.seed)
+    timer = Timer()
+    result = {"pages": count}
+    instrumentation.reset()
+
+    # Ingest, cold and warm (everything unchanged), into <workdir>/input
+    os.chdir(workdir)
+    with timer("process_images_cold"):
+        process_images(source)
+    with timer("process_images_warm"):
+        process_images(source)
+
+    generator = OutputGenerator(os.path.join(workdir, "generator"))
+    with timer("generate_sorted_images_cold"):
+        generator.generate_sorted_images(source)
+    with timer("generate_sorted_images_warm"):
+        generator.generate_sorted_images(source)
+
+    # Previews of a sample of the normalized pages, with an empty and then a warm preview cache
+    normalized = os.path.join(workdir, "input", "normalized")
+    pages = [name for name in os.listdir(normalized) if not name.endswith(STAMP_SUFFIX)]
+    sample = sorted(pages, key=lambda name: int(name.split(".")[0]))[:args.sample]
+    sample = [os.path.join(normalized, name) for name in sample]
+    result["sampled_pages"] = len(sample)
+    preview_cache._default_cache = PreviewCache(cache_dir=os.path.join(workdir, "previews"))
+    if args.tk:
+        import tkinter
+        root = tkinter.Tk()  # Default root for the PhotoImages
+        root.withdraw()
+        try:
+            with timer("load_image_cold"):
+                previews = [load_image(path) for path in sample]
+            with timer("load_image_warm"):
+                for path in sample:
+                    load_image(path)
+            scale_factors = [tool.scale_factor for tool in previews]
+        finally:
+            root.destroy()
+    else:
+        with timer("load_preview_cold"):
+            previews = [preview_cache.load_preview(path) for path in sample]
+        with timer("load_preview_warm"):
+            for path in sample:
+                preview_cache.load_preview(path)
+        scale_factors = [scale for _, scale in previews]
+
+    # Crop the same areas from every sampled page
+    ocr_integration.TEMP_DIR = os.path.join(workdir, "temp")
+    page_areas = []
+    for path, scale in zip(sample, scale_factors):
+        preview_width, preview_height = args.width * scale, args.height * scale
+        page_areas.append((path, scale, [(x0 * preview_width, y0 * preview_height, x1 * preview_width, y1 * preview_height)
+                                         for x0, y0, x1, y1 in AREAS]))
+    numbers = []
+    with timer("crop_regions"):
+        for path, scale, areas in page_areas:
+            numbers += crop_regions(path, areas, scale, start_number=len(numbers) + 1, max_workers=args.workers)
+    result["regions"] = len(numbers)
+    buffers = []
+    with timer("crop_region_buffers"):
+        for path, scale, areas in page_areas:
+            buffers += [data for _, data in crop_region_buffers(path, areas, scale, max_workers=args.workers)]
+    crops = list(enumerate(buffers, 1))
+
+    # OCR dispatch through temp files and in memory: one stub process per crop, then one long-lived stub engine over HTTP
+    ocr_integration.OCR_COMMAND = stub_cli_command(args.latency)
+    ocr_integration.OCR_STDIN_COMMAND = stub_stdin_command(args.latency)
+    with timer("batch_run_ocr_command"):
+        results = ocr_integration.batch_run_ocr(numbers, max_workers=args.workers)
+    with timer("batch_recognize_stdin"):
+        results += ocr_integration.batch_recognize(crops, max_workers=args.workers)
+    server = start_stub_server(latency=args.latency)
+    try:
+        with ocr_integration.OCRSession(port=server.server_address[1], keepalive_interval=0) as session:
+            with timer("batch_run_ocr_session"):
+                results += ocr_integration.batch_run_ocr(numbers, max_workers=args.workers, session=session)
+            with timer("batch_recognize_session"):
+                results += ocr_integration.batch_recognize(crops, max_workers=args.workers, session=session)
+    finally:
+        server.shutdown()
+        server.server_close()
+    result["ocr_failed"] = sum(1 for r in results if not r["success"])
+
+    # Question bank: one question per page, one answer per remaining crop
+    markdown_updater._default_writer = QuestionBankStore(os.path.join(workdir, "output", "QB.sqlite3"),
+                                                         os.path.join(workdir, "output", "QB.md"))
+    answers = [(page, f"Question {page} of the benchmark?", f"Answer {answer}")
+               for page in range(count) for answer in range(len(AREAS) - 1)]
+    with timer("update_markdown_file"):
+        for page, question, answer in answers:
+            markdown_updater.update_markdown_file(page, question, answer, is_correct=answer.endswith("1"))
+        markdown_updater.flush_markdown_file()
+    markdown_updater._default_writer.close()
+    markdown_updater._default_writer = None
+    result["answers"] = len(answers)
+
+    result["timings"] = timer.timings
+    result["instrumentation"] = instrumentation.summary()
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the QBET pipeline stages on a synthetic corpus.")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="Comma-separated corpus sizes.")
+    parser.add_argument("--width", type=int, default=1500)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument("--format", default="jpg", choices=("jpg", "png"), help="Corpus image format.")
+    parser.add_argument("--sample", type=int, default=DEFAULT_SAMPLE, help="Pages per scale that are previewed, cropped and OCRed.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub OCR seconds per crop.")
+    parser.add_argument("--workers", type=int, default=None, help="Crop and OCR concurrency (default: CPU count).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="JSON file the results are written to.")
+    parser.add_argument("--keep", action="store_true", help="Keep the working folders.")
+    args = parser.parse_args()
+    args.output = os.path.abspath(args.output)
+
+    with contextlib.redirect_stdout(sys.stderr):
+        args.tk = tk_available()
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+        "results": [],
+    }
+
+    cwd = os.getcwd()
+    for count in (int(value) for value in args.scales.split(",")):
+        workdir = tempfile.mkdtemp(prefix=f"qbet-bench-{count}-")
+        try:
+            # The pipeline reports progress on stdout; keep it for the summary lines
+            with contextlib.redirect_stdout(sys.stderr):
+                result = run_scale(count, args, workdir)
+        finally:
+            os.chdir(cwd)
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+        report["results"].append(result)
+        print(json.dumps(result))
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=1)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
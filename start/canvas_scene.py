@@ -0,0 +1,99 @@
+"""
+File name:
+  canvas_scene.py
+
+Function:
+  Tagged canvas scene for drawing selections: one background image, one rubber-band rectangle moved
+  in place while dragging, and one canvas item per selected area, added or removed individually.
+
+Dependencies:
+  tkinter
+
+"""
+
+
+# canvas_scene.py
+
+BACKGROUND_TAG = "background"
+SELECTION_TAG = "selection"
+RUBBER_BAND_TAG = "rubber_band"
+
+# Motion events are coalesced to one redraw per display frame (~60 Hz)
+FRAME_INTERVAL_MS = 16
+
+class SelectionScene:
+    def __init__(self, canvas, image_tk, outline="red", width=2):
+        self.canvas = canvas
+        self.outline = outline
+        self.width = width
+        self.start_x = self.start_y = 0
+        self.region_items = []  # Canvas item per selected area, in selection order
+        self._pending_motion = None
+        self._motion_job = None
+
+        self.background = canvas.create_image(0, 0, anchor="nw", image=image_tk, tags=BACKGROUND_TAG)
+        self.rubber_band = canvas.create_rectangle(0, 0, 0, 0, outline=outline, state="hidden", tags=RUBBER_BAND_TAG)
+        # A redraw still scheduled when the canvas goes away would hit a deleted widget
+        canvas.bind("<Destroy>", lambda event: self.cancel_motion(), add="+")
+
+    def set_background(self, image_tk):
+        # Swap the background image without touching the selections.
+        self.canvas.itemconfigure(self.background, image=image_tk)
+
+    def begin(self, x, y):
+        # Start a new rubber band at the press position.
+        self.start_x, self.start_y = x, y
+        self.canvas.coords(self.rubber_band, x, y, x, y)
+        self.canvas.itemconfigure(self.rubber_band, state="normal")
+        self.canvas.tag_raise(self.rubber_band)
+
+    def drag(self, x, y):
+        # Remember the latest pointer position; the rubber band is moved at most once per frame.
+        self._pending_motion = (x, y)
+        if self._motion_job is None:
+            self._motion_job = self.canvas.after(FRAME_INTERVAL_MS, self._flush_motion)
+
+    def _flush_motion(self):
+        self._motion_job = None
+        if self._pending_motion is not None:
+            self.canvas.coords(self.rubber_band, self.start_x, self.start_y, *self._pending_motion)
+            self._pending_motion = None
+
+    def cancel_motion(self):
+        # Drop a scheduled rubber-band redraw, if any.
+        if self._motion_job is not None:
+            self.canvas.after_cancel(self._motion_job)
+            self._motion_job = None
+        self._pending_motion = None
+
+    def end(self, x, y):
+        """
+        Finish the drag and turn the rubber band into a selection.
+
+        Returns:
+            tuple: The selected area (x0, y0, x1, y1) in canvas coordinates.
+        """
+        self.cancel_motion()
+        self.canvas.itemconfigure(self.rubber_band, state="hidden")
+        area = (self.start_x, self.start_y, x, y)
+        self.add(area)
+        return area
+
+    def add(self, area):
+        # Draw one more selected area.
+        item = self.canvas.create_rectangle(area, outline=self.outline, width=self.width, tags=SELECTION_TAG)
+        self.region_items.append(item)
+        return item
+
+    def pop(self):
+        # Remove the most recent selected area.
+        if self.region_items:
+            self.canvas.delete(self.region_items.pop())
+
+    def remove(self, index):
+        # Remove one selected area, e.g. a wrong proposal picked by the operator.
+        self.canvas.delete(self.region_items.pop(index))
+
+    def clear(self):
+        self.canvas.delete(SELECTION_TAG)
+        self.region_items = []
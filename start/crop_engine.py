@@ -0,0 +1,186 @@
+"""
+File name:
+  crop_engine.py
+
+Function:
+  Crops all selected areas of one image into temp/<n>/Q.png for OCR. The source is decoded once at full
+  resolution; every area is mapped back from preview coordinates and cut as a view of that one buffer.
+  Crops are cleaned up for OCR on the way (see ocr_preprocess.py). Decoding and cropping are timed as
+  "decode" and "crop" spans (see instrumentation.py). crop_region_buffers returns the encoded crops in
+  memory instead, for OCR engines that take image bytes directly; the temp files are then optional.
+
+Dependencies:
+  os
+  numpy
+  cv2
+  PIL
+  concurrent.futures
+  ocr_preprocess
+  instrumentation
+  lazy_import
+
+"""
+
+
+# crop_engine.py
+
+import os
+import math
+from concurrent.futures import ThreadPoolExecutor
+import ocr_integration
+import ocr_preprocess
+from lazy_import import lazy_module
+from instrumentation import get_logger, span, count
+
+np = lazy_module("numpy")
+cv2 = lazy_module("cv2")
+Image = lazy_module("PIL.Image")
+
+CROP_FILENAME = "Q.png"
+CROP_ENCODING = ".png"  # Same bytes as the Q.png files, so both paths share OCR cache entries
+
+log = get_logger("crop")
+
+def decode_source(image_path):
+    """
+    Decode an image at full resolution into a BGR array.
+
+    EXIF orientation is ignored, so the pixels line up with the PIL-decoded preview the
+    areas were drawn on. Formats OpenCV cannot read (GIF, HEIC) go through PIL.
+
+    Args:
+        image_path (str): The source image.
+
+    Returns:
+        numpy.ndarray: An H x W x 3 uint8 array.
+    """
+    with span("decode", image=image_path):
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is None:
+            with Image.open(image_path) as pil_image:
+                image = cv2.cvtColor(np.asarray(pil_image.convert("RGB")), cv2.COLOR_RGB2BGR)
+    return image
+
+def to_source_box(area, scale_factor, source_size):
+    """
+    Map a selected area from preview to source pixel coordinates.
+
+    Args:
+        area (tuple): (x0, y0, x1, y1) as drawn, in any corner order.
+        scale_factor (float): Preview size divided by source size.
+        source_size (tuple): (width, height) of the source image.
+
+    Returns:
+        tuple: (x0, y0, x1, y1) clamped to the image, or None if the area is empty.
+    """
+    width, height = source_size
+    x0, x1 = sorted((area[0], area[2]))
+    y0, y1 = sorted((area[1], area[3]))
+    x0 = min(max(int(math.floor(x0 / scale_factor)), 0), width)
+    y0 = min(max(int(math.floor(y0 / scale_factor)), 0), height)
+    x1 = min(max(int(math.ceil(x1 / scale_factor)), 0), width)
+    y1 = min(max(int(math.ceil(y1 / scale_factor)), 0), height)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1, y1
+
+def crop_path(region_number, temp_dir=None):
+    return os.path.join(temp_dir or ocr_integration.TEMP_DIR, str(region_number), CROP_FILENAME)
+
+def encode_crop(crop, preprocess_options=None):
+    # Pre-process (if enabled) and encode one crop.
+    if preprocess_options is not None:
+        with span("preprocess"):
+            crop = ocr_preprocess.preprocess(crop, preprocess_options)
+    ok, buffer = cv2.imencode(CROP_ENCODING, crop)
+    if not ok:
+        raise ValueError(f"Could not encode a {crop.shape} crop as {CROP_ENCODING}")
+    return buffer.tobytes()
+
+def _write_crop(path, crop, preprocess_options=None):
+    data = encode_crop(crop, preprocess_options)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as crop_file:
+        crop_file.write(data)
+
+def crop_regions(image_path, areas, scale_factor=1.0, temp_dir=None, start_number=1, max_workers=None,
+                 preprocess_options=None):
+    """
+    Crop every selected area of an image into temp/<n>/Q.png.
+
+    Args:
+        image_path (str): The source image.
+        areas (list of tuple): Selected areas in preview coordinates.
+        scale_factor (float): Preview size divided by source size, as returned by load_preview.
+        temp_dir (str): Root of the numbered crop folders. Defaults to ocr_integration.TEMP_DIR.
+        start_number (int): Number of the folder for the first area; area i goes to start_number + i.
+        max_workers (int): Number of crops encoded and written at once.
+        preprocess_options (dict): OCR pre-processing options. Defaults to ocr_preprocess.PREPROCESS_OPTIONS.
+
+    Returns:
+        list of int: The region numbers written, ready for batch_run_ocr. Empty areas are skipped and
+        leave their number unused, so a number always maps back to its area.
+    """
+    with span("crop", image=image_path, areas=len(areas)):
+        numbers = _crop_regions(image_path, areas, scale_factor, temp_dir, start_number, max_workers, preprocess_options)
+    count("crop.regions", len(numbers))
+    return numbers
+
+def crop_region_buffers(image_path, areas, scale_factor=1.0, max_workers=None, preprocess_options=None):
+    """
+    Crop every selected area of an image into encoded PNG buffers, without touching temp/.
+
+    Args:
+        image_path (str): The source image.
+        areas (list of tuple): Selected areas in preview coordinates.
+        scale_factor (float): Preview size divided by source size, as returned by load_preview.
+        max_workers (int): Number of crops encoded at once.
+        preprocess_options (dict): OCR pre-processing options. Defaults to ocr_preprocess.PREPROCESS_OPTIONS.
+
+    Returns:
+        list of tuple: (area index, encoded crop) per non-empty area, in order. Empty areas are skipped,
+        so the index is what tells which area a crop came from.
+    """
+    with span("crop", image=image_path, areas=len(areas)):
+        indexes, crops, preprocess_options = _cut_areas(image_path, areas, scale_factor, preprocess_options)
+        with ThreadPoolExecutor(max_workers=max_workers or ocr_integration.DEFAULT_MAX_WORKERS, thread_name_prefix="crop") as executor:
+            buffers = list(zip(indexes, executor.map(encode_crop, crops, [preprocess_options] * len(crops))))
+    count("crop.regions", len(buffers))
+    return buffers
+
+def _cut_areas(image_path, areas, scale_factor, preprocess_options):
+    # Decode once and slice out every non-empty area; returns their area indexes, the crops and the options
+    # to encode them with.
+    image = decode_source(image_path)  # The only decode for all areas
+    height, width = image.shape[:2]
+    if preprocess_options is None:
+        preprocess_options = ocr_preprocess.PREPROCESS_OPTIONS
+    if preprocess_options.get("enabled", True):
+        image = ocr_preprocess.to_gray(image)  # Once for the whole page instead of per crop
+    else:
+        preprocess_options = None
+
+    indexes, crops = [], []
+    for index, area in enumerate(areas):
+        box = to_source_box(area, scale_factor, (width, height))
+        if box is None:
+            log.debug("Skipping empty area %s of '%s'", area, image_path)
+            continue
+        x0, y0, x1, y1 = box
+        # Slicing returns a view into the decoded buffer, not a copy
+        indexes.append(index)
+        crops.append(image[y0:y1, x0:x1])
+    return indexes, crops, preprocess_options
+
+def _crop_regions(image_path, areas, scale_factor, temp_dir, start_number, max_workers, preprocess_options):
+    indexes, crops, preprocess_options = _cut_areas(image_path, areas, scale_factor, preprocess_options)
+    jobs = [(start_number + index, crop) for index, crop in zip(indexes, crops)]
+
+    # Pre-processing and encoding release the GIL, so the crops are prepared in parallel
+    with ThreadPoolExecutor(max_workers=max_workers or ocr_integration.DEFAULT_MAX_WORKERS, thread_name_prefix="crop") as executor:
+        futures = [executor.submit(_write_crop, crop_path(number, temp_dir), crop, preprocess_options) for number, crop in jobs]
+        for future in futures:
+            future.result()
+
+    log.debug("Cropped %d areas of '%s' into '%s'", len(jobs), image_path, temp_dir or ocr_integration.TEMP_DIR)
+    return [number for number, _ in jobs]
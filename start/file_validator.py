@@ -4,10 +4,15 @@ File name:
 
 Function:
   Validates if the necessary dependencies and folders are present in the project structure.
+  A successful package check is remembered in cache/validated.json, keyed by the interpreter, the
+  installed site-packages and requirements.txt, so later starts skip it until one of those changes.
 
 Dependencies:
   os
   sys
+  json
+  site
+  hashlib
   tkinter
   importlib
 
@@ -18,6 +23,9 @@ Dependencies:
 
 import os
 import sys
+import json
+import site
+import hashlib
 import subprocess
 import tkinter as tk
 from tkinter import messagebox
@@ -26,6 +34,9 @@ from importlib import util
 # Required directories and files
 REQUIRED_DIRS = ["output", "input", "temp"]
 REQUIRED_PACKAGES = ["PIL", "cv2", "numpy"]
+REQUIREMENTS_FILE = "requirements.txt"
+# Written after a successful package check, next to the other caches; see validation_key()
+STAMP_FILE = os.path.join(os.path.dirname(__file__), '..', 'cache', 'validated.json')
 
 def check_directories():
     # Ensure that essential directories exist. Create if missing.
@@ -46,6 +57,37 @@ def check_packages():
             missing_packages.append(package)
     return missing_packages
 
+def validation_key():
+    # Changes with the interpreter, with any install or uninstall in site-packages and with requirements.txt.
+    digest = hashlib.sha256()
+    digest.update(f"{sys.executable}\0{sys.version}\0{','.join(REQUIRED_PACKAGES)}".encode())
+    for folder in [*site.getsitepackages(), site.getusersitepackages()]:
+        try:
+            digest.update(f"\0{folder}:{os.stat(folder).st_mtime_ns}".encode())
+        except OSError:
+            pass
+    try:
+        with open(REQUIREMENTS_FILE, "rb") as requirements:
+            digest.update(requirements.read())
+    except OSError:
+        pass
+    return digest.hexdigest()
+
+def is_validated(key):
+    try:
+        with open(STAMP_FILE, "r", encoding="utf-8") as stamp:
+            return json.load(stamp).get("key") == key
+    except (OSError, ValueError, AttributeError):
+        return False
+
+def write_stamp(key):
+    try:
+        os.makedirs(os.path.dirname(STAMP_FILE), exist_ok=True)
+        with open(STAMP_FILE, "w", encoding="utf-8") as stamp:
+            json.dump({"key": key, "python": sys.executable}, stamp)
+    except OSError as e:
+        print(f"Cannot write {STAMP_FILE}: {e}")
+
 def install_packages(packages):
     # Automatically install missing packages using pip.
     try:
@@ -56,30 +98,50 @@ def install_packages(packages):
         print(f"Failed to install some packages: {', '.join(packages)}")
         return False
 
-def validate_setup():
-    # Validates the environment setup and installs missing dependencies if needed.
+def show_message(parent, kind, title, message):
+    # Use the application's root window if there is one; a hidden root only exists for the message.
+    if parent is not None:
+        getattr(messagebox, kind)(title, message, parent=parent)
+        return
+    root = tk.Tk()
+    root.withdraw()  # Hide the root window
+    getattr(messagebox, kind)(title, message, parent=root)
+    root.destroy()
+
+def validate_setup(parent=None):
+    """
+    Validates the environment setup and installs missing dependencies if needed.
+
+    Args:
+        parent (tk.Misc): Window that owns the message boxes, e.g. the application root.
+
+    Returns:
+        bool: False if required packages are missing and could not be installed.
+    """
     missing_dirs = check_directories()
-    missing_packages = check_packages()
 
     # Create missing directories
     if missing_dirs:
         create_directories(missing_dirs)
         # Show a message box if directories were missing
-        root = tk.Tk()
-        root.withdraw()  # Hide the root window
-        messagebox.showinfo("Directory Check", f"Created missing directories: {', '.join(missing_dirs)}")
+        show_message(parent, "showinfo", "Directory Check", f"Created missing directories: {', '.join(missing_dirs)}")
+
+    key = validation_key()
+    if is_validated(key):
+        return True
+    missing_packages = check_packages()
 
     # Install missing packages
     if missing_packages:
         print(f"Missing packages detected: {', '.join(missing_packages)}")
         if not install_packages(missing_packages):
-            root = tk.Tk()
-            root.withdraw()  # Hide the root window
-            messagebox.showerror("Dependency Check", "Failed to install some packages. Please try manually.")
+            show_message(parent, "showerror", "Dependency Check", "Failed to install some packages. Please try manually.")
             return False  # Indicate that setup is not complete
+        key = validation_key()  # pip changed site-packages
     else:
         print("All dependencies and folders are in place.")
 
+    write_stamp(key)
     return True  # Indicate successful setup
 
 if __name__ == "__main__":
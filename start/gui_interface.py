@@ -4,10 +4,16 @@ File name:
 
 Function:
   Contains functions for building the GUI, defining buttons, and layout for each interface view.
+  Interface2 wraps a SelectionTool (boxes drawn on a canvas_scene.SelectionScene); given a JobScheduler,
+  its box detection and Interface3's re-indexing of QB.md run on a worker thread instead of the Tk thread.
 
 Dependencies:
   tkinter
-  PIL
+  browse_handler
+  selection_tool
+  qb_viewer
+  job_scheduler
+  lazy_import
 
 """
 
@@ -15,9 +21,10 @@ Dependencies:
 # gui_interface.py
 
 import tkinter as tk
-from tkinter import Canvas
-from PIL import Image, ImageTk # type: ignore
 from browse_handler import BrowseHandler
+from selection_tool import SelectionTool
+from qb_viewer import LineIndex
+from job_scheduler import INTERACTIVE
 
 class Interface1(tk.Frame):
     def __init__(self, root, start_processing_callback):
@@ -38,7 +45,6 @@ class Interface1(tk.Frame):
         self.next_button.config(state=tk.DISABLED)
         
         self.status_label = None
-        self.dot_count = 0  # Counter for loading animation
 
     def browse_file(self):
         browse_handler = BrowseHandler(self.path_label, self.set_selected_path)
@@ -54,22 +60,13 @@ class Interface1(tk.Frame):
             self.start_processing_callback(self.selected_path.get())
             self.display_initializing()
 
-    def update_text_animation(self):
-        #Animate the 'Initializing' text with dots.
-        self.dot_count = (self.dot_count + 1) % 7  # Loop from 0 to 6
-        dots = '.' * self.dot_count
-        self.status_label.config(text=f"Initializing{dots}")
-        self.after(500, self.update_text_animation)  # Update every 500ms
-
     def display_initializing(self):
-        #Display the initializing state.
+        #Display the initializing state; progress is shown in MainApp's status bar.
         for widget in self.winfo_children():
             widget.destroy()
     
-        self.dot_count = 0  # Reset counter
-        self.status_label = tk.Label(self, text="Initializing")  # Initial text
+        self.status_label = tk.Label(self, text="Ingesting images...")
         self.status_label.pack(pady=10)
-        self.update_text_animation()  # Start the text animation
 
     def show_next_button(self, num_images):
         #Display the next button with the number of images selected.
@@ -86,137 +83,115 @@ class Interface1(tk.Frame):
         self.pack_forget()  # Hide this frame
 
 class Interface2(tk.Frame):
-    def __init__(self, root, image_path, next_callback, back_callback, selection_callback):
+    def __init__(self, root, image_path, selection_callback, next_callback=None, back_callback=None, preview=None,
+                 scheduler=None):
         super().__init__(root)
-        self.next_callback = next_callback
-        self.back_callback = back_callback
         self.selection_callback = selection_callback
 
-        # Instruction label
         tk.Label(self, text="Select the area you want to crop.").pack(pady=10)
 
-        # Load image and resize to keep aspect ratio
-        original_image = Image.open(image_path)
-        max_height = 500
-        width, height = original_image.size
-
-        # Calculate the new size while maintaining aspect ratio
-        if height > max_height:
-            scale_factor = max_height / height
-            new_width = int(width * scale_factor)
-            new_height = max_height
-        else:
-            new_width = width
-            new_height = height
-
-        # Resize the image using LANCZOS filter
-        self.image = original_image.resize((new_width, new_height), Image.LANCZOS)
-        self.image_tk = ImageTk.PhotoImage(self.image)
-
-        # Canvas for displaying the image
-        self.canvas = tk.Canvas(self, width=new_width, height=new_height)
-        self.canvas.pack()
-
-        # Load image into the canvas
-        self.canvas.create_image(0, 0, anchor="nw", image=self.image_tk)
-
-        # Mouse event bindings
-        self.canvas.bind("<ButtonPress-1>", self.start_selection)
-        self.canvas.bind("<B1-Motion>", self.update_selection)
-        self.canvas.bind("<ButtonRelease-1>", self.end_selection)
-
-        # Initialize selection coordinates
-        self.start_x = self.start_y = 0
-        self.rect = None
-        self.selected_areas = []  # Store multiple selected areas
-
-        # Next and Back buttons
-        self.select_button = tk.Button(self, text="Select answers", command=self.on_select_answers)
-        self.select_button.pack(pady=10)
-        self.select_button.pack_forget()  # Initially hide the button
-
-        self.next_button = tk.Button(self, text="Next", command=self.on_next)
-        self.next_button.pack(side=tk.RIGHT, padx=5, pady=10)
-        self.back_button = tk.Button(self, text="Back", command=self.on_back)
-        self.back_button.pack(side=tk.LEFT, padx=5, pady=10)
-
-        # Control-Z binding
-        self.master.bind("<Control-z>", self.undo_selection)
-
-    def start_selection(self, event):
-        #Start selection rectangle.
-        self.start_x, self.start_y = event.x, event.y
-        if self.rect:
-            self.canvas.delete(self.rect)
-
-    def update_selection(self, event):
-        #Update selection rectangle as mouse moves.
-        cur_x, cur_y = event.x, event.y
-        if self.rect:
-            self.canvas.delete(self.rect)
-        self.rect = self.canvas.create_rectangle(self.start_x, self.start_y, cur_x, cur_y, outline="red")
-
-    def end_selection(self, event):
-        # Finalize selection and store the selected area.
-        end_x, end_y = event.x, event.y
-        selected_area = (self.start_x, self.start_y, end_x, end_y)  # Store selected area
-        self.selected_areas.append(selected_area)  # Append to selected areas
-        self.select_button.pack()  # Show button if at least one area is selected
-        self.update_canvas()
-
-    def undo_selection(self, event=None):
-        #Undo the last selection.
-        if self.selected_areas:
-            self.selected_areas.pop()  # Remove the last selection
-            self.canvas.delete("all")  # Clear canvas
-            self.canvas.create_image(0, 0, anchor="nw", image=self.image_tk)  # Redraw image
-            self.select_button.pack_forget()  # Hide button if no selection left
-            self.update_canvas()  # Update canvas to redraw remaining selections
-
-    def update_canvas(self):
-        #Redraw all selected areas on the canvas.
-        for area in self.selected_areas:
-            self.canvas.create_rectangle(area, outline="red")
-
-    def on_select_answers(self):
-        #Handle the action for selecting answers.
-        # Process the selected areas and call the callback
-        print(f"Selected areas: {self.selected_areas}")
-        self.selection_callback(self.selected_areas)  # Call the callback function
+        self.selection_tool = SelectionTool(self, image_path, self.on_selection_made, preview, scheduler=scheduler)
+        self.selection_tool.pack(fill="both", expand=True)
 
-    def on_next(self):
-        # Callback for next button.
-        self.next_callback()
+        if next_callback is not None:
+            tk.Button(self, text="Next", command=next_callback).pack(side=tk.RIGHT, padx=5, pady=10)
+        if back_callback is not None:
+            tk.Button(self, text="Back", command=back_callback).pack(side=tk.LEFT, padx=5, pady=10)
 
-    def on_back(self):
-        # Callback for back button.
-        self.back_callback()
+    def on_selection_made(self, selected_areas):
+        self.selection_callback(selected_areas)
 
 class Interface3(tk.Frame):
-    def __init__(self, root, next_callback):
+    def __init__(self, root, next_callback, qb_md_path="output/QB.md", scheduler=None):
         super().__init__(root)
         self.next_callback = next_callback
+        self.scheduler = scheduler
+        self.refreshing = False  # The line index is being rebuilt on a worker; leave it alone until then
         tk.Label(self, text="OCR Result Display: QB.md").pack(pady=10)
-        self.qb_content = tk.Text(self, height=15, width=50, state=tk.DISABLED)
-        self.qb_content.pack(pady=5)
+
+        # Only the visible window of QB.md is ever inserted into the Text widget
+        self.visible_lines = 15
+        self.first_line = 0
+        self.line_index = LineIndex(qb_md_path)
+        viewer = tk.Frame(self)
+        viewer.pack(pady=5)
+        self.qb_content = tk.Text(viewer, height=self.visible_lines, width=50, state=tk.DISABLED, wrap=tk.NONE)
+        self.qb_content.pack(side=tk.LEFT)
+        self.scrollbar = tk.Scrollbar(viewer, command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.qb_content.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.qb_content.bind("<Button-4>", lambda event: self.scroll_to(self.first_line - 3))
+        self.qb_content.bind("<Button-5>", lambda event: self.scroll_to(self.first_line + 3))
+
         self.refresh_button = tk.Button(self, text="Refresh", command=self.refresh_content)
         self.refresh_button.pack(pady=5)
         self.next_button = tk.Button(self, text="Next", command=self.on_next)
         self.next_button.pack(pady=10)
 
     def refresh_content(self):
-        # Refresh QB.md content display.
+        # Refresh QB.md content display; only bytes added since the last refresh are indexed.
+        if self.refreshing:
+            return
+        at_end = self.first_line + self.visible_lines >= self.line_index.line_count
+        if self.scheduler is None:
+            self.show_refreshed(self.line_index.refresh(), at_end)
+            return
+        self.refreshing = True
+        self.refresh_button.config(state=tk.DISABLED)
+        self.scheduler.submit(self.line_index.refresh, priority=INTERACTIVE,
+                              on_done=lambda mode: self.show_refreshed(mode, at_end),
+                              on_error=lambda error: self.show_refreshed("missing", at_end))
+
+    def show_refreshed(self, mode, at_end):
+        if self.refreshing:
+            self.refreshing = False
+            if not self.winfo_exists():
+                return
+            self.refresh_button.config(state=tk.NORMAL)
+        if mode == "missing":
+            self.show_text("QB.md not found. Please check output directory.")
+            self.scrollbar.set(0.0, 1.0)
+            return
+        if mode == "reloaded":
+            self.first_line = 0
+        elif mode == "appended" and at_end:
+            self.first_line = max(0, self.line_index.line_count - self.visible_lines)  # Follow new content
+        self.render_window()
+
+    def show_text(self, text):
         self.qb_content.config(state=tk.NORMAL)
         self.qb_content.delete("1.0", tk.END)
-        
-        try:
-            with open("output/QB.md", "r") as file:
-                self.qb_content.insert(tk.END, file.read())
-        except FileNotFoundError:
-            self.qb_content.insert(tk.END, "QB.md not found. Please check output directory.")
-        
+        self.qb_content.insert(tk.END, text)
         self.qb_content.config(state=tk.DISABLED)
 
+    def render_window(self):
+        # Replace the Text contents with the visible lines and sync the scrollbar.
+        lines = self.line_index.lines(self.first_line, self.visible_lines)
+        self.show_text("\n".join(lines))
+        total = max(self.line_index.line_count, 1)
+        self.scrollbar.set(self.first_line / total, min(1.0, (self.first_line + self.visible_lines) / total))
+
+    def scroll_to(self, first_line):
+        if self.refreshing:
+            return
+        last_start = max(0, self.line_index.line_count - self.visible_lines)
+        first_line = max(0, min(int(first_line), last_start))
+        if first_line != self.first_line:
+            self.first_line = first_line
+            self.render_window()
+
+    def on_scroll(self, action, amount, unit=None):
+        # Scrollbar protocol: ("moveto", fraction) or ("scroll", n, "units" | "pages").
+        if action == "moveto":
+            self.scroll_to(float(amount) * self.line_index.line_count)
+        elif action == "scroll":
+            step = self.visible_lines if unit == "pages" else 1
+            self.scroll_to(self.first_line + int(amount) * step)
+
+    def on_mouse_wheel(self, event):
+        self.scroll_to(self.first_line - 3 * (1 if event.delta > 0 else -1))
+        return "break"
+
     def on_next(self):
         # Handle the Next button click to go back to Interface 2.
         self.next_callback()
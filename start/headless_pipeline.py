@@ -0,0 +1,284 @@
+"""
+File name:
+  headless_pipeline.py
+
+Function:
+  Command-line batch pipeline that runs without tkinter: ingest, region cropping from a JSON/YAML
+  region spec, OCR and question-bank output, with one JSON progress event per line on stdout.
+  Crops are handed to OCR in memory; --temp-files writes them to temp/<n>/Q.png (and the text to Q.txt) instead.
+
+Dependencies:
+  argparse
+  json
+  yaml (optional, for YAML region specs)
+  image_processor
+  crop_engine
+  ocr_preprocess
+  ocr_integration
+  ocr_cache
+  qb_store
+  instrumentation
+
+"""
+
+
+# headless_pipeline.py
+
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import contextlib
+import ocr_integration
+import ocr_preprocess
+import instrumentation
+from image_processor import iter_process_images, TARGET_FOLDER
+from crop_engine import crop_regions, crop_region_buffers
+from ocr_cache import OCRCache
+from qb_store import QuestionBankStore, STORE_FILE_PATH
+from markdown_updater import MARKDOWN_FILE_PATH
+from temp_cleanup import clean_temp_folder
+
+# Region spec example (JSON or YAML):
+#
+#   {
+#     "scale": 1.0,
+#     "images": {
+#       "page_001.jpg": [[40, 120, 980, 260], [60, 300, 900, 360], [60, 380, 900, 440]],
+#       "7": {"areas": [[...], [...]], "scale": 0.1667, "correct": [3]}
+#     }
+#   }
+#
+# Keys are source paths relative to the source folder, source file names, or serial numbers.
+# The first area of an image is the question, the others are its answers. "scale" is the
+# coordinate scale the areas were drawn at (preview size / image size; 1.0 = image pixels), where
+# the image is the normalized copy: upright and at most NORMALIZED_MAX_DIMENSION pixels on a side.
+# "correct" lists the region numbers (1 = question, 2 = first answer, ...) of correct answers.
+
+def load_region_spec(path):
+    """
+    Read a region spec file.
+
+    Args:
+        path (str): A .json, .yaml or .yml file.
+
+    Returns:
+        dict: key -> {"areas": [...], "scale": float, "correct": [int, ...]}.
+    """
+    with open(path, "r", encoding="utf-8") as spec_file:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml # type: ignore
+            except ImportError:
+                raise SystemExit("PyYAML is required for YAML region specs (pip install pyyaml), or use JSON.")
+            spec = yaml.safe_load(spec_file)
+        else:
+            spec = json.load(spec_file)
+
+    default_scale = float(spec.get("scale", 1.0))
+    regions = {}
+    for key, value in spec.get("images", {}).items():
+        if isinstance(value, dict):
+            regions[str(key)] = {
+                "areas": [tuple(area) for area in value.get("areas", [])],
+                "scale": float(value.get("scale", default_scale)),
+                "correct": [int(number) for number in value.get("correct", [])],
+            }
+        else:
+            regions[str(key)] = {"areas": [tuple(area) for area in value], "scale": default_scale, "correct": []}
+    return regions
+
+def find_regions(regions, source_root, source_path, serial):
+    # Look up an ingested image in the spec by relative path, file name, then serial number.
+    relative = os.path.relpath(source_path, source_root) if os.path.isdir(source_root) else os.path.basename(source_path)
+    for key in (relative.replace(os.sep, "/"), os.path.basename(source_path), str(serial)):
+        if key in regions:
+            return regions[key]
+    return None
+
+class ProgressEmitter:
+    # Writes one JSON object per line; "t" is seconds since the pipeline started.
+    def __init__(self, stream):
+        self.stream = stream
+        self.started = time.monotonic()
+
+    def __call__(self, event, **fields):
+        record = {"event": event, "t": round(time.monotonic() - self.started, 3), **fields}
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+
+def read_text(region_number):
+    path = os.path.join(ocr_integration.TEMP_DIR, str(region_number), "Q.txt")
+    with open(path, "r", encoding="utf-8") as text_file:
+        return text_file.read().strip()
+
+def run_pipeline(source, regions, emit, target_folder=TARGET_FOLDER, store=None,
+                 session=None, cache=None, max_workers=None, duplicates="flag", temp_files=False):
+    """
+    Run ingest, cropping, OCR and question-bank output for every image in the spec.
+
+    Args:
+        source (str): Source image or folder.
+        regions (dict): Parsed region spec, see load_region_spec.
+        emit (callable): Progress callback, called as emit(event, **fields).
+        target_folder (str): Ingest target folder.
+        store (QuestionBankStore): Where questions and answers are written. Defaults to a store on
+            STORE_FILE_PATH and MARKDOWN_FILE_PATH, opened and closed by this call.
+        session (OCRSession): Optional running OCR engine.
+        cache (OCRCache): Optional OCR result cache.
+        max_workers (int): OCR and crop concurrency.
+        duplicates (str): "skip", "flag" or "keep" near-duplicate images.
+        temp_files (bool): Go through temp/<n>/Q.png and Q.txt instead of handing crops to OCR in memory.
+
+    Returns:
+        dict: Summary counts.
+    """
+    if store is None:
+        with QuestionBankStore() as store:
+            return run_pipeline(source, regions, emit, target_folder, store, session, cache, max_workers,
+                                duplicates, temp_files)
+    summary = {"images": 0, "pages": 0, "regions": 0, "ocr_failed": 0, "answers": 0}
+
+    # Ingest and crop page by page; the OCR pool pulls each page's crops as soon as they are cut and
+    # only as fast as it recognizes them, so at most max_in_flight crops are held at once.
+    # Regions are numbered across the whole batch, area i of a page as its start + i; empty areas leave
+    # a gap, so answers keep the region number the spec's "correct" refers to.
+    pages = []
+
+    def cropped_regions():
+        next_number = 1
+        for serial, image_path, source_path in iter_process_images(source, target_folder, duplicates):
+            summary["images"] += 1
+            emit("ingested", serial=serial, path=image_path, source=source_path, count=summary["images"])
+            spec = find_regions(regions, source, source_path, serial)
+            if not spec or not spec["areas"]:
+                continue
+            if temp_files:
+                numbers = crop_regions(image_path, spec["areas"], spec["scale"], start_number=next_number,
+                                       max_workers=max_workers)
+                crops = [(number, None) for number in numbers]
+            else:
+                buffers = crop_region_buffers(image_path, spec["areas"], spec["scale"], max_workers=max_workers)
+                crops = [(next_number + index, data) for index, data in buffers]
+                numbers = [number for number, _ in crops]
+            pages.append((serial, image_path, next_number, numbers, spec))
+            next_number += len(spec["areas"])
+            summary["pages"] += 1
+            summary["regions"] += len(numbers)
+            emit("cropped", serial=serial, regions=numbers)
+            yield from crops
+
+    done = [0]
+
+    def on_result(result):
+        done[0] += 1
+        emit("ocr", region=result["image_number"], success=result["success"], cached=result["cached"],
+             error=result["error"], done=done[0], total=summary["regions"])  # Regions cropped so far
+
+    if temp_files:
+        results = ocr_integration.batch_run_ocr((number for number, _ in cropped_regions()), max_workers=max_workers,
+                                                session=session, cache=cache, on_result=on_result)
+        texts = {result["image_number"]: read_text(result["image_number"]) for result in results if result["success"]}
+    else:
+        results = ocr_integration.batch_recognize(cropped_regions(), max_workers=max_workers, session=session,
+                                                  cache=cache, on_result=on_result)
+        texts = {result["image_number"]: result["text"].strip() for result in results if result["success"]}
+    summary["ocr_failed"] = len(results) - len(texts)
+
+    # First area of a page is the question, the rest are its answers
+    for serial, image_path, first, numbers, spec in pages:
+        if first not in texts:
+            emit("skipped", serial=serial, reason="question OCR failed")
+            continue
+        question = texts[first]
+        for number in numbers:
+            if number == first or number not in texts:
+                continue
+            region = number - first + 1
+            if store.add(question, texts[number], region in spec["correct"], source_image=image_path,
+                         region=1, answer_region=region):
+                summary["answers"] += 1
+        emit("committed", serial=serial, question=question)
+    store.flush()
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the QBET pipeline without a GUI.")
+    parser.add_argument("source", help="Image file or folder to ingest (searched recursively).")
+    parser.add_argument("regions", help="JSON or YAML region spec.")
+    parser.add_argument("--input-dir", default=TARGET_FOLDER, help="Ingest target folder.")
+    parser.add_argument("--temp-dir", default=ocr_integration.TEMP_DIR, help="Folder for temp/<n>/Q.png crops.")
+    parser.add_argument("--output", default=MARKDOWN_FILE_PATH, help="QB.md to generate.")
+    parser.add_argument("--db", default=STORE_FILE_PATH, help="Question bank database.")
+    parser.add_argument("--workers", type=int, default=None, help="OCR and crop concurrency (default: CPU count).")
+    parser.add_argument("--ocr-command", default=None, help="OCR executable and leading arguments (default: umi-ocr).")
+    parser.add_argument("--ocr-stdin-command", default=None,
+                        help="OCR command reading an image on stdin and printing its text; used for in-memory crops.")
+    parser.add_argument("--temp-files", action="store_true",
+                        help="Write crops to temp/<n>/Q.png and OCR text to Q.txt instead of passing them in memory.")
+    parser.add_argument("--session", action="store_true", help="Use one long-lived OCR engine over its HTTP API.")
+    parser.add_argument("--port", type=int, default=ocr_integration.DEFAULT_OCR_PORT, help="OCR engine HTTP port.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the OCR result cache.")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send the raw crops to OCR.")
+    parser.add_argument("--keep-temp", action="store_true", help="Do not clear the temp folder first.")
+    parser.add_argument("--duplicates", choices=("skip", "flag", "keep"), default="flag",
+                        help="Look-alike images: flag them (default), skip close copies, or keep them silently.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Overlap ingest, cropping, OCR and output in an asyncio staged pipeline.")
+    parser.add_argument("--queue-size", type=int, default=None, help="Capacity of each stage queue with --async.")
+    parser.add_argument("--log-level", default=None, choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="Level of the log on stderr (default: $QBET_LOG_LEVEL or WARNING).")
+    parser.add_argument("--trace", default=None, help="Write a Chrome trace of the stage timings to this JSON file.")
+    args = parser.parse_args(argv)
+
+    instrumentation.configure_logging(args.log_level, sys.stderr)
+    if args.trace:
+        instrumentation.start_trace()
+
+    # Progress events own stdout; the modules' own messages go to stderr
+    emit = ProgressEmitter(sys.stdout)
+    with contextlib.redirect_stdout(sys.stderr):
+        if not os.path.exists(args.source):
+            emit("error", message=f"Source path '{args.source}' does not exist.")
+            return 2
+        regions = load_region_spec(args.regions)
+        ocr_integration.TEMP_DIR = args.temp_dir
+        if args.ocr_command:
+            ocr_integration.OCR_COMMAND = shlex.split(args.ocr_command)
+        if args.ocr_stdin_command:
+            ocr_integration.OCR_STDIN_COMMAND = shlex.split(args.ocr_stdin_command)
+        if args.no_preprocess:
+            ocr_preprocess.PREPROCESS_OPTIONS = ocr_preprocess.options_with(enabled=False)
+        if args.temp_files and not args.keep_temp:
+            clean_temp_folder(args.temp_dir)
+        cache = None if args.no_cache else OCRCache()
+
+        emit("start", source=args.source, images_in_spec=len(regions))
+        with contextlib.ExitStack() as stack:
+            session = None
+            if args.session:
+                session = stack.enter_context(ocr_integration.OCRSession(port=args.port))
+            store = stack.enter_context(QuestionBankStore(args.db, args.output))
+            try:
+                if args.use_async:
+                    import asyncio
+                    from async_pipeline import run_async_pipeline, DEFAULT_QUEUE_SIZE
+                    summary = asyncio.run(run_async_pipeline(
+                        args.source, regions, emit, args.input_dir, store, session, cache,
+                        ocr_workers=args.workers, queue_size=args.queue_size or DEFAULT_QUEUE_SIZE,
+                        duplicates=args.duplicates, temp_files=args.temp_files))
+                else:
+                    summary = run_pipeline(args.source, regions, emit, args.input_dir, store, session, cache,
+                                           args.workers, args.duplicates, args.temp_files)
+            except Exception as e:
+                emit("error", message=str(e))
+                return 1
+        if args.trace:
+            instrumentation.export_trace(args.trace)
+        emit("done", **summary, cache=cache.stats() if cache else None, timings=instrumentation.summary())
+    return 0 if not summary["ocr_failed"] else 3
+
+if __name__ == "__main__":
+    sys.exit(main())
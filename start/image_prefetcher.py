@@ -0,0 +1,171 @@
+"""
+File name:
+  image_prefetcher.py
+
+Function:
+  Decodes and scales upcoming images in the background while the operator works on the current one,
+  and keeps the ready previews in a memory-bounded LRU so moving to the next image is instant.
+  Decoding runs on its own threads, or as PREFETCH jobs of a JobScheduler when one is given.
+
+Dependencies:
+  threading
+  collections
+  preview_cache
+  job_scheduler
+  instrumentation
+
+"""
+
+
+# image_prefetcher.py
+
+import threading
+from collections import OrderedDict
+from preview_cache import load_preview
+from job_scheduler import PREFETCH
+from instrumentation import get_logger
+
+PREFETCH_LOOK_AHEAD = 3
+PREFETCH_LOOK_BEHIND = 1
+PREFETCH_MEMORY_BUDGET = 256 * 1024 * 1024  # bytes of decoded preview pixels
+
+log = get_logger("preview")
+
+def preview_nbytes(preview):
+    # Approximate memory held by a decoded preview.
+    image, _ = preview
+    return image.width * image.height * len(image.getbands())
+
+class ImagePrefetcher:
+    """
+    Background loader for the previews around the current image.
+
+    prefetch() replaces the wanted set with the next look_ahead images (and the previous
+    look_behind ones); stale requests are dropped before they are decoded. get() returns a
+    ready preview at once, or loads it on the calling thread if it is not ready yet; ready()
+    never blocks. With a scheduler, no threads of its own are started.
+    """
+
+    def __init__(self, loader=load_preview, look_ahead=PREFETCH_LOOK_AHEAD, look_behind=PREFETCH_LOOK_BEHIND,
+                 memory_budget=PREFETCH_MEMORY_BUDGET, workers=1, scheduler=None):
+        self.loader = loader
+        self.look_ahead = look_ahead
+        self.look_behind = look_behind
+        self.memory_budget = memory_budget
+        self.hits = 0
+        self.misses = 0
+        self._ready = OrderedDict()  # image path -> (preview, scale factor), least recently used first
+        self._ready_bytes = 0
+        self._wanted = []  # paths still to decode, most urgent first
+        self._loading = set()
+        self._closed = False
+        self._condition = threading.Condition()
+        self.scheduler = scheduler
+        self._queued_jobs = 0  # Scheduler jobs submitted but not finished
+        self._threads = [] if scheduler is not None else [
+            threading.Thread(target=self._worker, name=f"prefetch-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def prefetch(self, image_paths, current_index):
+        """
+        Queue the neighbours of the current image for decoding.
+
+        Args:
+            image_paths (list of str): All images, in navigation order.
+            current_index (int): Index of the image on screen.
+        """
+        ahead = image_paths[current_index + 1:current_index + 1 + self.look_ahead]
+        behind = image_paths[max(0, current_index - self.look_behind):current_index]
+        with self._condition:
+            self._wanted = [path for path in ahead + behind[::-1] if path not in self._ready and path not in self._loading]
+            self._condition.notify_all()
+            # One job per wanted preview; each job takes whatever is most urgent when it starts
+            new_jobs = max(0, len(self._wanted) - self._queued_jobs) if self.scheduler is not None else 0
+            self._queued_jobs += new_jobs
+        for _ in range(new_jobs):
+            self.scheduler.submit(self._prefetch_job, priority=PREFETCH)
+
+    def ready(self, image_path):
+        # The preview if it is already decoded, else None; never waits.
+        with self._condition:
+            preview = self._ready.get(image_path)
+            if preview is not None:
+                self._ready.move_to_end(image_path)
+                self.hits += 1
+            return preview
+
+    def get(self, image_path):
+        """
+        Return the preview of an image, waiting for or doing the decode if needed.
+
+        Args:
+            image_path (str): The image to show.
+
+        Returns:
+            tuple: (PIL.Image preview, scale factor), as returned by the loader.
+        """
+        with self._condition:
+            if image_path in self._wanted:
+                self._wanted.remove(image_path)
+            while image_path in self._loading:
+                self._condition.wait()
+            preview = self._ready.get(image_path)
+            if preview is not None:
+                self._ready.move_to_end(image_path)
+                self.hits += 1
+                return preview
+            self.misses += 1
+        preview = self.loader(image_path)
+        self._store(image_path, preview)
+        return preview
+
+    def _store(self, image_path, preview):
+        with self._condition:
+            if image_path in self._ready:
+                self._ready_bytes -= preview_nbytes(self._ready.pop(image_path))
+            self._ready[image_path] = preview
+            self._ready_bytes += preview_nbytes(preview)
+            # Evict least recently used previews, never the one just stored
+            while self._ready_bytes > self.memory_budget and len(self._ready) > 1:
+                _, evicted = self._ready.popitem(last=False)
+                self._ready_bytes -= preview_nbytes(evicted)
+
+    def _load_next(self):
+        # Decode the most urgent wanted preview, if any.
+        with self._condition:
+            if not self._wanted or self._closed:
+                return
+            image_path = self._wanted.pop(0)
+            self._loading.add(image_path)
+        try:
+            self._store(image_path, self.loader(image_path))
+        except Exception as e:
+            log.warning("Prefetch of '%s' failed: %s", image_path, e)
+        finally:
+            with self._condition:
+                self._loading.discard(image_path)
+                self._condition.notify_all()
+
+    def _prefetch_job(self):
+        try:
+            self._load_next()
+        finally:
+            with self._condition:
+                self._queued_jobs -= 1
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._wanted and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+            self._load_next()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._wanted = []
+            self._condition.notify_all()
@@ -4,11 +4,22 @@ File name:
 
 Function:
   Processes selected images, performs file copying, renaming, and moves images into /input.
+  Only new or changed files are copied; see ingest_manifest.py. Images are yielded one by one
+  as they are ready, so the first one can be shown while the rest are still being copied.
+  Near duplicates of an image already ingested are skipped (or flagged) on the way, and every image
+  is normalized once (orientation, format, size) on a process pool; see normalizer.py.
+  Per-file messages go to the "qbet.ingest" logger, and each image is timed as an "ingest" span.
+  Callers can follow a run through progress events and stop it with a CancellationToken; see ingest_progress.py.
+  After a run that was not cancelled, copies of images no longer in the selected folder are removed from /input.
 
 Dependencies:
   os
-  shutil
-  tkinter
+  queue
+  threading
+  ingest_manifest
+  ingest_progress
+  normalizer
+  instrumentation
 
 """
 
@@ -16,58 +27,201 @@ Dependencies:
 # image_processor.py
 
 import os
-import shutil
-from tkinter import messagebox
+import queue
+import threading
+from ingest_manifest import IngestManifest
+from ingest_progress import IngestProgress
+from normalizer import iter_normalized, register_heif, remove_normalized, NORMALIZED_FOLDER
+from instrumentation import get_logger, span, count
 
-def process_images(selected_path):
-    target_folder = "input"
-    valid_extensions = {'.jpg', '.jpeg', '.png', '.heic', '.gif'}
-    image_files = []
+TARGET_FOLDER = "input"
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.heic', '.gif')
 
-    # Check if the selected path is a file or a directory
-    if not os.path.exists(selected_path):
-        print(f"Source path '{selected_path}' does not exist.")
-        messagebox.showerror("Error", "Source path does not exist.")
-        return None
+# Save the manifest every this many ingested images, so an interrupted run keeps its progress
+MANIFEST_SAVE_INTERVAL = 200
+
+log = get_logger("ingest")
+
+def scan_images(selected_path, exclude_dirs=(TARGET_FOLDER,)):
+    """
+    Yield the image files under selected_path without listing the whole tree first.
 
-    # If it's a file, just add it to the list if it has a valid extension
+    Directories are walked depth-first with os.scandir; entries are sorted by name within
+    each directory so the order is stable between runs. Hidden directories and the
+    folders in exclude_dirs are skipped.
+
+    Args:
+        selected_path (str): An image file or a folder to search recursively.
+        exclude_dirs (tuple of str): Folders never descended into, e.g. the ingest target.
+
+    Yields:
+        str: Path of each image with a valid extension.
+    """
     if os.path.isfile(selected_path):
-        if any(selected_path.lower().endswith(ext) for ext in valid_extensions):
-            image_files.append(os.path.basename(selected_path))
-    else:  # If it's a directory, filter images in the folder by valid extensions
-        for filename in os.listdir(selected_path):
-            if any(filename.lower().endswith(ext) for ext in valid_extensions):
-                image_files.append(filename)
-
-    if not image_files:
-        print(f"No valid image files found in '{selected_path}'.")
-        messagebox.showerror("Error", "No valid image files found.")
-        return None
+        if selected_path.lower().endswith(VALID_EXTENSIONS):
+            yield selected_path
+        return
 
-    print(f"Found {len(image_files)} valid image files in '{selected_path}': {image_files}")
+    excluded = {os.path.abspath(path) for path in exclude_dirs}
+    stack = [selected_path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            log.warning("Cannot scan '%s': %s", directory, e)
+            continue
 
-    # Copy and rename images to the target folder
-    os.makedirs(target_folder, exist_ok=True)
-    print(f"Copying and renaming images to '{target_folder}'...")
-
-    processed_images = []  # List to hold processed images
-
-    for index, filename in enumerate(sorted(image_files), start=1):
-        if os.path.isfile(selected_path):  # If it's a single file
-            source_path = selected_path
-            extension = os.path.splitext(filename)[1]  # Get the original extension
-            target_name = f"{index}{extension}"  # Keep the original format
-            target_path = os.path.join(target_folder, target_name)
-        else:  # If it's a directory
-            source_path = os.path.join(selected_path, filename)
-            extension = os.path.splitext(filename)[1]  # Get the original extension
-            target_name = f"{index}{extension}"  # Keep the original format
-            target_path = os.path.join(target_folder, target_name)
-        print(f"Attempting to copy from '{source_path}' to '{target_path}'")
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.name.startswith(".") and os.path.abspath(entry.path) not in excluded:
+                        subdirs.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(VALID_EXTENSIONS):
+                    yield entry.path
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+
+def _scan_ahead(selected_path, exclude_dirs, progress, cancel):
+    # Walk the tree on its own thread, so the total count and size are known long before the copying ends.
+    found = queue.Queue()
+    stop = threading.Event()
+
+    def scan():
         try:
-            shutil.copy2(source_path, target_path)
-            print(f"Copied '{source_path}' to '{target_path}'")
-            processed_images.append(target_name)  # Store the processed image name
-        except Exception as e:
-            print(f"Error copying '{source_path}' to '{target_path}': {e}")
-    return len(image_files)  # Return the list of processed image names
+            for path in scan_images(selected_path, exclude_dirs):
+                if stop.is_set() or (cancel is not None and cancel.cancelled):
+                    return
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0
+                progress.found(size)
+                found.put((path, size))
+            progress.scan_finished()
+        finally:
+            found.put(None)
+
+    threading.Thread(target=scan, name="ingest-scan", daemon=True).start()
+    try:
+        while (item := found.get()) is not None:
+            yield item
+    finally:
+        stop.set()
+
+def iter_process_images(selected_path, target_folder=TARGET_FOLDER, duplicates="flag", normalize=True,
+                        on_progress=None, cancel=None):
+    """
+    Ingest images into target_folder, yielding each one as soon as it is in place.
+
+    Args:
+        selected_path (str): An image file or a folder to search recursively.
+        target_folder (str): The folder the numbered copies are placed in.
+        duplicates (str): "skip", "flag" or "keep" near-duplicate images, see IngestManifest.
+        normalize (bool): Yield the normalized copy in target_folder/normalized instead of the ingested one.
+        on_progress (callable): Called with progress event dicts (see IngestProgress), from the ingest thread.
+        cancel (CancellationToken): Stops the run before the next file once cancelled.
+
+    Yields:
+        tuple: (serial number, path of the image to work with, source path). The image to work with is
+        the normalized copy, or the ingested one if normalize is False or it could not be normalized.
+        Duplicates skipped by the manifest are not yielded.
+    """
+    register_heif()  # Duplicate detection decodes the originals, HEIC included
+    progress = IngestProgress(on_progress) if on_progress is not None else None
+    images = _iter_ingest(selected_path, target_folder, duplicates, progress, cancel)
+    if normalize:
+        yield from iter_normalized(images, os.path.join(target_folder, NORMALIZED_FOLDER))
+    else:
+        yield from (image[:3] for image in images)
+
+def _iter_ingest(selected_path, target_folder, duplicates, progress=None, cancel=None):
+    # Yields (serial, ingested path, source path, sha256 of the ingested file) per ingested image, the
+    # input of iter_normalized; the manifest already knows the hash, so it is not read again there.
+    os.makedirs(target_folder, exist_ok=True)
+    manifest = IngestManifest(target_folder, duplicates)
+    if progress is not None:
+        sources = _scan_ahead(selected_path, (target_folder,), progress, cancel)
+    else:
+        sources = ((path, None) for path in scan_images(selected_path, exclude_dirs=(target_folder,)))
+    ingested = 0
+    scanned = []  # Every source found, ingested or not; the rest of the target folder is dropped at the end
+    state = "failed"
+    try:
+        for source_path, size in sources:
+            if cancel is not None and cancel.cancelled:
+                break
+            scanned.append(source_path)
+            try:
+                # New files get the next free serial number, known files keep theirs
+                with span("ingest", image=source_path):
+                    entry, status = manifest.ingest(source_path)
+            except OSError as e:
+                count("ingest.failed")
+                log.warning("Error copying '%s' into '%s': %s", source_path, target_folder, e)
+                if progress is not None:
+                    progress.handled("failed", size)
+                continue
+            count(f"ingest.{status}")
+            if progress is not None:
+                progress.handled(status, size)
+            if status == "duplicate":
+                log.info("Skipped '%s': duplicate of '%s'", source_path, entry["duplicate_of"])
+                continue
+            if entry.get("duplicate_of"):
+                log.info("'%s' looks like a duplicate of '%s'", source_path, entry["duplicate_of"])
+            if status != "unchanged":
+                log.debug("Copied '%s' to '%s' (%s)", source_path, manifest.target_path(entry), entry["method"])
+            ingested += 1
+            if ingested % MANIFEST_SAVE_INTERVAL == 0:
+                manifest.save()
+            yield entry["serial"], manifest.target_path(entry), source_path, entry["sha256"]
+        if cancel is None or not cancel.cancelled:
+            drop_stale(manifest, scanned)
+            state = "done"
+    finally:
+        manifest.save()
+        if cancel is not None and cancel.cancelled:
+            state = "cancelled"
+            log.info("Ingest of '%s' cancelled after %d images.", selected_path, ingested)
+        if progress is not None:
+            progress.finish(state)
+
+def drop_stale(manifest, scanned):
+    """
+    Drop images ingested from other folders (or deleted since) from the target folder and its
+    normalized copies, like the old wipe of /input.
+
+    Args:
+        manifest (IngestManifest): The manifest of the target folder.
+        scanned (list of str): Every source path found in this run, ingested or not.
+    """
+    removed = manifest.retain(scanned)
+    normalized_folder = os.path.join(manifest.target_folder, NORMALIZED_FOLDER)
+    for entry in removed:
+        remove_normalized(entry["serial"], normalized_folder)
+    if removed:
+        count("ingest.removed", len(removed))
+        log.info("Removed %d images that are no longer in the selected folder.", len(removed))
+
+def process_images(selected_path, on_progress=None, cancel=None):
+    # Errors are reported through the return value; callers decide how to show them (no GUI here).
+    if not os.path.exists(selected_path):
+        log.warning("Source path '%s' does not exist.", selected_path)
+        return None
+
+    log.info("Copying and renaming images from '%s' to '%s'...", selected_path, TARGET_FOLDER)
+    image_count = sum(1 for _ in iter_process_images(selected_path, on_progress=on_progress, cancel=cancel))
+    if cancel is not None and cancel.cancelled:
+        log.info("Cancelled; %d images in '%s' are up to date.", image_count, TARGET_FOLDER)
+        return image_count
+
+    if not image_count:
+        log.warning("No valid image files found in '%s'.", selected_path)
+        return None
+
+    log.info("%d images in '%s' are up to date.", image_count, TARGET_FOLDER)
+    return image_count  # Return the number of processed images
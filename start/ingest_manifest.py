@@ -0,0 +1,290 @@
+"""
+File name:
+  ingest_manifest.py
+
+Function:
+  Keeps a persisted manifest of ingested source images (path, size, mtime, content hash, serial number)
+  so that /input is only updated for new or changed files and serial numbers stay stable across runs.
+  Each entry also keeps a perceptual hash, so near-duplicate pages are flagged (by default) or skipped
+  before they reach the selection screen.
+
+Dependencies:
+  os
+  json
+  hashlib
+  shutil
+  perceptual_hash
+  instrumentation
+
+"""
+
+
+# ingest_manifest.py
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+from perceptual_hash import dhash_file, HashIndex, HASH_SIZE, DUPLICATE_DISTANCE, SKIP_DISTANCE
+from instrumentation import get_logger
+
+MANIFEST_NAME = ".ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+# What to do with a new image that looks like one already ingested in this run:
+# "flag" ingests it but records the original, "skip" leaves it out of the target folder if it is within
+# SKIP_DISTANCE (flagging it otherwise), "keep" ignores duplicates. Pages that share a layout can hash
+# alike, so only "skip" ever drops an image.
+DUPLICATE_POLICIES = ("skip", "flag", "keep")
+
+# ioctl request for cloning a file on Linux filesystems that support reflinks (btrfs, xfs)
+FICLONE = 0x40049409
+
+log = get_logger("ingest")
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """
+    Hash a file's contents.
+
+    Args:
+        path (str): The file to hash.
+        chunk_size (int): Read size in bytes.
+
+    Returns:
+        str: The hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as source_file:
+        for chunk in iter(lambda: source_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _reflink(source_path, target_path):
+    import fcntl
+    with open(source_path, "rb") as source_file, open(target_path, "wb") as target_file:
+        fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+    shutil.copystat(source_path, target_path)
+
+def link_or_copy(source_path, target_path):
+    """
+    Place source_path at target_path as cheaply as the filesystem allows.
+
+    Tries a hardlink first, then a reflink (copy-on-write clone), then a regular copy.
+
+    Args:
+        source_path (str): The file to ingest.
+        target_path (str): Where it should appear; an existing file is replaced.
+
+    Returns:
+        str: "hardlink", "reflink" or "copy".
+    """
+    if os.path.lexists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+        return "hardlink"
+    except OSError:
+        pass
+    if sys.platform.startswith("linux"):
+        try:
+            _reflink(source_path, target_path)
+            return "reflink"
+        except OSError:
+            # Not supported by this filesystem or across devices; fall back to a copy
+            if os.path.exists(target_path):
+                os.remove(target_path)
+    shutil.copy2(source_path, target_path)
+    return "copy"
+
+class IngestManifest:
+    """
+    Maps each source image (by absolute path) to its copy in the target folder.
+
+    Every entry records the source size, mtime, SHA-256, dHash and its serial number. A file is
+    re-hashed only when its size or mtime changed, and re-copied only when its content did.
+    A serial number, once assigned, is never given to another source.
+
+    New or changed images whose dHash is within max_distance of an image already ingested in
+    this run record the original in "duplicate_of". With the "skip" policy, those within
+    skip_distance are not copied and get no serial number.
+    """
+
+    def __init__(self, target_folder, duplicates="flag", max_distance=DUPLICATE_DISTANCE, skip_distance=SKIP_DISTANCE):
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"duplicates must be one of {DUPLICATE_POLICIES}, not {duplicates!r}")
+        self.target_folder = target_folder
+        self.duplicates = duplicates
+        self.max_distance = max_distance
+        self.skip_distance = min(skip_distance, max_distance)
+        self.path = os.path.join(target_folder, MANIFEST_NAME)
+        self.entries = {}
+        self._load()
+        self._last_serial = max((entry.get("serial") or 0 for entry in self.entries.values()), default=0)
+        self._by_hash = {entry["sha256"]: source for source, entry in self.entries.items()}
+        # Perceptual hashes of the originals ingested in this run
+        self._seen = set()
+        self._phashes = HashIndex(max_distance=max_distance)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                data = json.load(manifest_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable ingest manifest '%s': %s", self.path, e)
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self.entries = data.get("entries", {})
+
+    def save(self):
+        # Write the manifest atomically next to the images it describes.
+        os.makedirs(self.target_folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.target_folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+                json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, tmp_file, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def next_serial(self):
+        self._last_serial += 1
+        return self._last_serial
+
+    def _find_moved(self, digest):
+        # A source that disappeared but whose content reappears elsewhere keeps its serial number.
+        source = self._by_hash.get(digest)
+        if source is not None and source in self.entries and not os.path.exists(source):
+            return source
+        return None
+
+    def _perceptual_hash(self, source):
+        try:
+            return f"{dhash_file(source):0{HASH_SIZE * HASH_SIZE // 4}x}"
+        except (OSError, ValueError) as e:
+            # Not decodable here (e.g. HEIC without a plugin); such images are never treated as duplicates
+            log.warning("Cannot compute perceptual hash of '%s': %s", source, e)
+            return None
+
+    def _remember(self, source, entry):
+        # Mark source as ingested in this run, so later look-alikes are found as its duplicates.
+        if "dhash" not in entry:
+            entry["dhash"] = self._perceptual_hash(source)
+        if source not in self._seen:
+            self._seen.add(source)
+            if entry["dhash"] and not entry.get("duplicate_of"):
+                self._phashes.add(int(entry["dhash"], 16), source)
+
+    def find_duplicate(self, dhash, source, max_distance=None):
+        """
+        Find an image ingested in this run that looks like the one being ingested.
+
+        Args:
+            dhash (str): Hex perceptual hash of the new image, or None.
+            source (str): Absolute path of the new image, never reported as its own duplicate.
+            max_distance (int): At most the manifest's max_distance; defaults to it.
+
+        Returns:
+            str: Absolute source path of the original, or None.
+        """
+        if not dhash or self.duplicates == "keep":
+            return None
+        for _, original in self._phashes.search(int(dhash, 16), max_distance):
+            if original != source:
+                return original
+        return None
+
+    def target_path(self, entry):
+        return os.path.join(self.target_folder, entry["target"]) if entry.get("target") else None
+
+    def ingest(self, source_path):
+        """
+        Bring one source image into the target folder if it is new or changed.
+
+        Args:
+            source_path (str): The source image.
+
+        Returns:
+            tuple: (entry dict, status) where status is "new", "changed", "unchanged" or
+            "duplicate" (skipped; entry["duplicate_of"] names the original).
+        """
+        source = os.path.abspath(source_path)
+        stat = os.stat(source)
+        entry = self.entries.get(source)
+        target = self.target_path(entry) if entry else None
+        target_present = target is not None and os.path.exists(target)
+        same_stat = entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+        if same_stat and target_present:
+            self._remember(source, entry)
+            return entry, "unchanged"
+        if same_stat and entry.get("duplicate_of") in self._seen and self.duplicates == "skip":
+            return entry, "duplicate"
+
+        digest = hash_file(source)
+        if entry and target_present and entry["sha256"] == digest:
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            self._remember(source, entry)
+            return entry, "unchanged"
+
+        status = "changed" if entry else "new"
+        if entry is None:
+            moved_from = self._find_moved(digest)
+            entry = self.entries.pop(moved_from) if moved_from else {}
+
+        dhash = entry["dhash"] if entry.get("sha256") == digest and "dhash" in entry else self._perceptual_hash(source)
+        close = self.find_duplicate(dhash, source, self.skip_distance) if self.duplicates == "skip" else None
+        original = close or self.find_duplicate(dhash, source)
+        entry.update(dhash=dhash, duplicate_of=original)
+        if close:
+            old_target = self.target_path(entry)
+            if old_target and os.path.exists(old_target):
+                os.remove(old_target)
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest, target=None, method=None)
+            entry.setdefault("serial", None)
+            self.entries[source] = entry
+            self._by_hash[digest] = source
+            return entry, "duplicate"
+        if not entry.get("serial"):
+            entry["serial"] = self.next_serial()
+
+        extension = os.path.splitext(source)[1].lower()
+        target_name = f"{entry['serial']}{extension}"
+        old_target = self.target_path(entry)
+        if old_target and entry["target"] != target_name and os.path.exists(old_target):
+            os.remove(old_target)
+
+        method = link_or_copy(source, os.path.join(self.target_folder, target_name))
+        entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest, target=target_name, method=method)
+        self.entries[source] = entry
+        self._by_hash[digest] = source
+        self._remember(source, entry)
+        return entry, status
+
+    def retain(self, source_paths):
+        """
+        Remove the target copies of every source not in source_paths.
+
+        The manifest entries are kept, so a source that comes back gets its old serial number.
+
+        Args:
+            source_paths (iterable of str): The sources that should stay in the target folder.
+
+        Returns:
+            list of dict: The entries whose copy was removed.
+        """
+        keep = {os.path.abspath(path) for path in source_paths}
+        removed = []
+        for source, entry in self.entries.items():
+            target = self.target_path(entry)
+            if source not in keep and target:
+                if os.path.exists(target):
+                    os.remove(target)
+                entry["target"] = None
+                removed.append(entry)
+        return removed
@@ -0,0 +1,112 @@
+"""
+File name:
+  ingest_progress.py
+
+Function:
+  Progress reporting and cancellation for ingest. IngestProgress counts scanned, copied, unchanged and
+  skipped files and the bytes behind them, and publishes throttled snapshots (with throughput and ETA)
+  to a callback; a CancellationToken lets another thread stop the run after the file being copied.
+
+Dependencies:
+  time
+  threading
+
+"""
+
+
+# ingest_progress.py
+
+import time
+import threading
+
+# Minimum seconds between two published progress events; the final event is always published
+PROGRESS_INTERVAL = 0.2
+
+class CancellationToken:
+    # Set from any thread (e.g. a Cancel button); the ingest loop checks it between files.
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+class IngestProgress:
+    """
+    Running counts of one ingest, published as plain dicts.
+
+    The scanner (possibly on its own thread) reports every file it finds with found() and
+    scan_finished(); the ingest loop reports every file it handled with handled(). Events are
+    dicts with the keys "state" ("scanning", "copying", "done", "cancelled" or "failed"),
+    "scanned", "total" (None until the scan is finished), "copied", "unchanged", "skipped",
+    "failed", "bytes_done", "bytes_total", "bytes_per_second", "elapsed" and "eta" (seconds,
+    None while unknown).
+    """
+
+    def __init__(self, callback, interval=PROGRESS_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.scanned = 0
+        self.total = None
+        self.bytes_total = 0
+        self.counts = {"copied": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+        self.bytes_done = 0
+        self.state = "scanning"
+        self._started = time.monotonic()
+        self._last_published = 0.0
+        self._lock = threading.Lock()
+
+    def found(self, size):
+        with self._lock:
+            self.scanned += 1
+            self.bytes_total += size or 0
+        self.publish()
+
+    def scan_finished(self):
+        with self._lock:
+            self.total = self.scanned
+        self.publish(force=True)
+
+    def handled(self, status, size):
+        # status as returned by IngestManifest.ingest, or "failed".
+        key = {"new": "copied", "changed": "copied", "duplicate": "skipped"}.get(status, status)
+        with self._lock:
+            self.counts[key] += 1
+            self.bytes_done += size or 0
+            self.state = "copying"
+        self.publish()
+
+    def finish(self, state):
+        with self._lock:
+            self.state = state
+        self.publish(force=True)
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            rate = self.bytes_done / elapsed if elapsed > 0 else 0.0
+            eta = None
+            if self.total is not None and rate > 0:
+                eta = max(0.0, (self.bytes_total - self.bytes_done) / rate)
+            return {
+                "state": self.state,
+                "scanned": self.scanned,
+                "total": self.total,
+                **self.counts,
+                "bytes_done": self.bytes_done,
+                "bytes_total": self.bytes_total,
+                "bytes_per_second": rate,
+                "elapsed": elapsed,
+                "eta": eta,
+            }
+
+    def publish(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_published < self.interval:
+                return
+            self._last_published = now
+        self.callback(self.snapshot())
@@ -0,0 +1,213 @@
+"""
+File name:
+  instrumentation.py
+
+Function:
+  Lightweight timing and logging for the pipeline: named spans around ingest, decode, crop, OCR and
+  markdown writes feed per-stage latency histograms, counters count events, and the "qbet" logger
+  replaces per-file prints (silent below WARNING by default). With tracing on, every span is also
+  recorded as a Chrome trace event and written to a JSON file viewable in chrome://tracing or Perfetto.
+
+  Environment:
+    QBET_LOG_LEVEL  DEBUG, INFO, WARNING (default) or ERROR, for configure_logging().
+    QBET_TRACE      Path of a trace file to write at exit; enables tracing on import.
+
+Dependencies:
+  os
+  json
+  time
+  atexit
+  logging
+  threading
+  contextlib
+
+"""
+
+
+# instrumentation.py
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+import contextlib
+
+LOGGER_NAME = "qbet"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Trace events kept in memory; later spans still feed the histograms
+MAX_TRACE_EVENTS = 1_000_000
+
+log = logging.getLogger(LOGGER_NAME)
+log.addHandler(logging.NullHandler())
+
+def get_logger(name=None):
+    # Child of the "qbet" logger, e.g. get_logger("ocr") -> "qbet.ocr".
+    return log.getChild(name) if name else log
+
+def configure_logging(level=None, stream=None):
+    """
+    Send "qbet" log records to stderr (or stream).
+
+    Args:
+        level (str or int): Log level; defaults to $QBET_LOG_LEVEL or WARNING.
+        stream: Text stream for the records.
+    """
+    level = level or os.environ.get("QBET_LOG_LEVEL", "WARNING")
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    for existing in [h for h in log.handlers if isinstance(h, logging.StreamHandler)]:
+        log.removeHandler(existing)
+    log.addHandler(handler)
+    log.setLevel(level)
+
+class Histogram:
+    """
+    Latency histogram with power-of-two microsecond buckets.
+
+    Percentiles are read from the bucket edges, so they are accurate to within a factor of two;
+    count, total, min and max are exact.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # Bucket index -> count; bucket b holds durations in [2**(b-1), 2**b) us
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        bucket = max(0, int(seconds * 1e6)).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, fraction):
+        # Upper edge of the bucket holding the given fraction of samples, in seconds.
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 3)
+        return {
+            "count": self.count,
+            "total_ms": ms(self.total),
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "min_ms": ms(self.min),
+            "p50_ms": ms(self.percentile(0.5)),
+            "p90_ms": ms(self.percentile(0.9)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "max_ms": ms(self.max),
+        }
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_trace_events = None  # List while tracing
+_trace_path = None
+_origin_ns = time.perf_counter_ns()
+
+def record(name, seconds, start_ns=None, **args):
+    """
+    Add one duration to the histogram called name (and to the trace, if start_ns is known).
+
+    Use this for work timed elsewhere, e.g. in a worker process.
+    """
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds)
+        if _trace_events is not None and start_ns is not None and len(_trace_events) < MAX_TRACE_EVENTS:
+            _trace_events.append({
+                "name": name, "cat": LOGGER_NAME, "ph": "X",
+                "ts": (start_ns - _origin_ns) / 1000, "dur": seconds * 1e6,
+                "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+            })
+
+@contextlib.contextmanager
+def span(name, **args):
+    """
+    Time a block of work as one sample of the histogram called name.
+
+    Args:
+        name (str): Stage name, e.g. "ingest", "decode", "crop", "ocr", "markdown_write".
+        **args: Extra details stored with the trace event (e.g. image=path).
+    """
+    start_ns = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter_ns() - start_ns) / 1e9, start_ns, **args)
+
+def count(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def summary():
+    """
+    Return the counters and a summary of every histogram.
+
+    Returns:
+        dict: {"counters": {name: int}, "spans": {name: histogram summary}}.
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "spans": {name: histogram.summary() for name, histogram in sorted(_histograms.items())},
+        }
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        if _trace_events is not None:
+            _trace_events.clear()
+
+def start_trace(path=None):
+    # Start recording trace events; with a path, they are written there at exit.
+    global _trace_events, _trace_path
+    with _lock:
+        if _trace_events is None:
+            _trace_events = []
+        if path:
+            if _trace_path is None:
+                atexit.register(_export_at_exit)
+            _trace_path = path
+
+def export_trace(path):
+    """
+    Write the recorded spans as a Chrome trace (JSON object format), with the summary as metadata.
+
+    Args:
+        path (str): Output file, e.g. "qbet-trace.json".
+    """
+    with _lock:
+        events = list(_trace_events or [])
+    metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread.ident, "args": {"name": thread.name}}
+                for thread in threading.enumerate()]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as trace_file:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms", "otherData": summary()}, trace_file)
+    log.info("Wrote %d trace events to %s", len(events), path)
+
+def _export_at_exit():
+    if _trace_path:
+        export_trace(_trace_path)
+
+if os.environ.get("QBET_TRACE"):
+    start_trace(os.environ["QBET_TRACE"])
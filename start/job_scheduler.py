@@ -0,0 +1,192 @@
+"""
+File name:
+  job_scheduler.py
+
+Function:
+  Central scheduler for work that must not run on the Tk thread. Jobs run on a pool of worker threads
+  in priority order (interactive before prefetch before background); their callbacks are queued and run
+  back on the GUI thread, a frame's worth at a time, by a root.after loop. Worker threads hand any other
+  GUI call (e.g. a messagebox) to the GUI thread with call_soon().
+
+Dependencies:
+  os
+  time
+  queue
+  heapq
+  itertools
+  threading
+  instrumentation
+
+"""
+
+
+# job_scheduler.py
+
+import os
+import time
+import heapq
+import queue
+import itertools
+import threading
+from instrumentation import get_logger, count
+
+# Job priorities, most urgent first
+INTERACTIVE = 0  # The operator is waiting on it: decoding the image on screen, detecting its boxes, cropping
+PREFETCH = 1     # Likely needed soon: neighbouring previews
+BACKGROUND = 2   # Ingest, OCR, cleanup
+
+DEFAULT_WORKERS = max(2, min(4, os.cpu_count() or 1))
+
+# GUI-thread time spent on callbacks per tick, in seconds (one frame at 60 Hz); the rest waits a tick
+FRAME_BUDGET = 0.016
+POLL_INTERVAL_MS = 15
+
+log = get_logger("scheduler")
+
+class Job:
+    # Handle of a submitted job; cancel() drops it if it has not started yet.
+    def __init__(self, fn, args, kwargs, priority, on_done, on_error):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self.result = None
+        self.error = None
+        self._finished = threading.Event()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def done(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        # Block until the job ran (or was dropped); returns its result or raises its error.
+        self._finished.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class JobScheduler:
+    """
+    Prioritized worker pool with a result queue drained on the GUI thread.
+
+    Within one priority jobs start in submission order. A running job is never interrupted,
+    so long jobs (ingest) should be BACKGROUND and there should be more workers than long jobs.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, frame_budget=FRAME_BUDGET):
+        self.frame_budget = frame_budget
+        self._jobs = []  # Heap of (priority, sequence, job)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._callbacks = queue.Queue()  # (callback, args) to run on the GUI thread
+        self._closed = False
+        self._root = None
+        self._interval_ms = POLL_INTERVAL_MS
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"job-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, *args, priority=BACKGROUND, on_done=None, on_error=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a worker thread.
+
+        Args:
+            fn (callable): The work; must not touch Tk widgets.
+            priority (int): INTERACTIVE, PREFETCH or BACKGROUND.
+            on_done (callable): Called on the GUI thread with the result.
+            on_error (callable): Called on the GUI thread with the exception; errors are logged if omitted.
+
+        Returns:
+            Job: Handle for cancelling or waiting.
+        """
+        job = Job(fn, args, kwargs, priority, on_done, on_error)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("JobScheduler is shut down")
+            heapq.heappush(self._jobs, (priority, next(self._sequence), job))
+            self._condition.notify()
+        return job
+
+    def call_soon(self, callback, *args):
+        # Run callback(*args) on the GUI thread at the next drain; safe to call from any thread.
+        self._callbacks.put((callback, args))
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._jobs and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._jobs)
+            if job.cancelled:
+                count("jobs.cancelled")
+                job._finished.set()
+                continue
+            try:
+                job.result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                job.error = e
+            finally:
+                job._finished.set()
+            count("jobs.done")
+            if job.cancelled:
+                continue
+            if job.error is not None:
+                if job.on_error is not None:
+                    self.call_soon(job.on_error, job.error)
+                else:
+                    log.warning("Job %s failed: %s", getattr(job.fn, "__name__", job.fn), job.error)
+            elif job.on_done is not None:
+                self.call_soon(job.on_done, job.result)
+
+    def drain(self, budget=None):
+        """
+        Run queued GUI callbacks until the queue is empty or the time budget is spent.
+
+        Returns:
+            bool: True if callbacks are still waiting.
+        """
+        deadline = time.perf_counter() + (self.frame_budget if budget is None else budget)
+        while time.perf_counter() < deadline:
+            try:
+                callback, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                return False
+            try:
+                callback(*args)
+            except Exception:
+                log.exception("GUI callback %s failed", getattr(callback, "__name__", callback))
+        return not self._callbacks.empty()
+
+    def attach(self, root, interval_ms=POLL_INTERVAL_MS):
+        # Drain the callbacks on root's event loop from now on.
+        self._root = root
+        self._interval_ms = interval_ms
+        self._tick()
+
+    def _tick(self):
+        if self._root is None or self._closed:
+            return
+        backlog = self.drain()
+        # Come back at once when callbacks are left over, so they go out over the next frames
+        self._root.after(1 if backlog else self._interval_ms, self._tick)
+
+    def shutdown(self, wait=False):
+        with self._condition:
+            self._closed = True
+            for _, _, job in self._jobs:
+                job.cancel()
+                job._finished.set()
+            self._jobs = []
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,146 @@
+"""
+File name:
+  layout_detector.py
+
+Function:
+  Proposes question and answer boxes on a page so the operator only has to correct them instead of
+  drawing every rectangle. The page is binarized, specks are dropped with connected components, text
+  lines are found from the row projection profile and grouped into blocks, and each block is trimmed
+  to its ink with the column profile. The first block is the question, the others are its answers.
+
+Dependencies:
+  numpy
+  cv2
+  lazy_import
+
+"""
+
+
+# layout_detector.py
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+cv2 = lazy_module("cv2")
+
+# Connected components smaller than this fraction of the page area are noise
+MIN_COMPONENT_FRACTION = 2e-5
+# Rows with at least this fraction of ink pixels count as text
+ROW_INK_FRACTION = 0.002
+# Row runs closer than this many median run heights are one line (i dots, accents, underscores)
+LINE_JOIN_GAP = 0.3
+# A gap between lines starts a new block if it is wider than this many median line heights...
+BLOCK_GAP_LINES = 0.5
+# ...and wider than this many times the page's line spacing (its narrowest gap, at most one line height)
+BLOCK_GAP_SPACING = 1.5
+# Blocks narrower or lower than this many pixels are dropped
+MIN_BLOCK_SIZE = 4
+# Margin added around each proposed box, in pixels
+BOX_PADDING = 3
+
+def to_gray(image):
+    # Accept a PIL image or a grayscale/BGR array.
+    if not isinstance(image, np.ndarray):
+        image = np.asarray(image.convert("L"))
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+def binarize(gray):
+    """
+    Otsu threshold with text as 1 and background as 0, with small connected components removed.
+
+    Args:
+        gray (numpy.ndarray): H x W uint8 page.
+
+    Returns:
+        numpy.ndarray: H x W uint8 mask.
+    """
+    _, mask = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    min_area = max(2, int(MIN_COMPONENT_FRACTION * mask.size))
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_area
+    keep[0] = False  # Label 0 is the background
+    return keep[labels].astype(np.uint8)
+
+def runs(flags):
+    """
+    Find the runs of True in a 1-D boolean array.
+
+    Returns:
+        numpy.ndarray: N x 2 array of [start, end) indices.
+    """
+    padded = np.concatenate(([False], flags, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges.reshape(-1, 2)
+
+def merge_runs(ranges, max_gap):
+    """
+    Merge consecutive [start, end) ranges separated by at most max_gap.
+
+    Returns:
+        numpy.ndarray: N x 2 array of the merged ranges.
+    """
+    if len(ranges) < 2:
+        return ranges
+    breaks = np.flatnonzero(ranges[1:, 0] - ranges[:-1, 1] > max_gap) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(ranges)])) - 1
+    return np.stack((ranges[starts, 0], ranges[ends, 1]), axis=1)
+
+def text_lines(mask):
+    # [start, end) row ranges of the text lines, from the row projection profile.
+    row_ink = mask.sum(axis=1)
+    threshold = max(1, int(ROW_INK_FRACTION * mask.shape[1]))
+    lines = runs(row_ink >= threshold)
+    if not len(lines):
+        return lines
+    return merge_runs(lines, LINE_JOIN_GAP * np.median(lines[:, 1] - lines[:, 0]))
+
+def group_lines(lines, block_gap=BLOCK_GAP_LINES):
+    """
+    Group consecutive text lines into blocks separated by wide vertical gaps.
+
+    Args:
+        lines (numpy.ndarray): N x 2 row ranges, top to bottom.
+        block_gap (float): Minimum gap, in median line heights, that separates two blocks.
+
+    Returns:
+        list of tuple: (top, bottom) row range of each block.
+    """
+    if not len(lines):
+        return []
+    line_height = np.median(lines[:, 1] - lines[:, 0])
+    gaps = lines[1:, 0] - lines[:-1, 1]
+    spacing = min(gaps.min(), line_height) if len(gaps) else line_height
+    blocks = merge_runs(lines, max(block_gap * line_height, BLOCK_GAP_SPACING * spacing))
+    return [(int(top), int(bottom)) for top, bottom in blocks]
+
+def detect_layout(image, padding=BOX_PADDING, block_gap=BLOCK_GAP_LINES):
+    """
+    Propose one box per text block, top to bottom.
+
+    Args:
+        image: PIL image or numpy array of the page (e.g. the preview shown in SelectionTool).
+        padding (int): Margin added around each box.
+        block_gap (float): Minimum gap, in median line heights, that separates two blocks.
+
+    Returns:
+        list of tuple: (x0, y0, x1, y1) boxes in the image's own coordinates; the first one is the
+        question, the rest are the answers.
+    """
+    gray = to_gray(image)
+    height, width = gray.shape
+    mask = binarize(gray)
+
+    boxes = []
+    for top, bottom in group_lines(text_lines(mask), block_gap):
+        columns = np.flatnonzero(mask[top:bottom].any(axis=0))
+        if not len(columns):
+            continue
+        x0, x1 = int(columns[0]), int(columns[-1]) + 1
+        if x1 - x0 < MIN_BLOCK_SIZE or bottom - top < MIN_BLOCK_SIZE:
+            continue
+        boxes.append((max(0, x0 - padding), max(0, top - padding),
+                      min(width, x1 + padding), min(height, bottom + padding)))
+    return boxes
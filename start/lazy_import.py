@@ -0,0 +1,56 @@
+"""
+File name:
+  lazy_import.py
+
+Function:
+  Deferred imports for the heavy third-party modules (numpy, cv2, PIL). lazy_module() returns a stand-in
+  that imports the real module on its first attribute access, so importing main.py does not pay for them
+  before the first window is on screen. Safe to touch from several threads at once: the real import goes
+  through importlib, which has its own per-module locks. preload() imports them ahead of time, off the Tk thread.
+
+Dependencies:
+  sys
+  types
+  importlib
+
+"""
+
+
+# lazy_import.py
+
+import sys
+import types
+import importlib
+
+class LazyModule(types.ModuleType):
+    # Stand-in for a module that is not imported yet; use it exactly like the module.
+    def __getattr__(self, attr):
+        # Only reached for names not copied over yet, i.e. before (or during) the first load.
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self.__name__!r}>"
+
+def lazy_module(name):
+    """
+    Return a module that is imported on first use.
+
+    Args:
+        name (str): Dotted module name, e.g. "numpy" or "PIL.ImageTk".
+
+    Returns:
+        module: The module itself if it is already imported, else a LazyModule.
+    """
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+def is_loaded(name):
+    # True once the real module has been imported (by anyone).
+    return name in sys.modules
+
+def preload(*names):
+    # Import modules ahead of their first use, e.g. on a worker thread once the GUI is up.
+    for name in names:
+        importlib.import_module(name)
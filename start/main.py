@@ -4,38 +4,111 @@ File name:
 
 Function:
   Main entry file; initializes the GUI and handles transitions between interfaces.
+  Ingest progress is drained from a queue on the Tk thread and shown in a status bar that can cancel it.
+  Ingest, preview decoding, box detection and cropping run as JobScheduler jobs; only widget updates run on Tk.
+  numpy, cv2 and PIL are not imported until the first window is up (see lazy_import.py); the time to that
+  window is measured against STARTUP_BUDGET, and startup_report.py breaks the import time down per module.
 
 Dependencies:
-  glob
-  threading
+  os
+  time
+  queue
   tkinter
+  job_scheduler
+  image_prefetcher
+  crop_engine
+  lazy_import
+  instrumentation
 
 """
 
 
 # main.py
 
-import glob
-import threading
+import time
+STARTUP_STARTED = time.perf_counter()  # Before the imports below, so their cost counts towards startup
+
+import os
+import queue
 import tkinter as tk
 from tkinter import messagebox
 from file_validator import validate_setup
-from image_processor import process_images
+from image_processor import iter_process_images
+from ingest_progress import CancellationToken
 from browse_handler import BrowseHandler
-from selection_tool import SelectionTool
+from image_prefetcher import ImagePrefetcher
+from crop_engine import crop_regions
+from temp_cleanup import clean_temp_folder
+from ocr_integration import TEMP_DIR
 from gui_interface import Interface1, Interface2, Interface3
+from lazy_import import preload
+from instrumentation import configure_logging, get_logger, record
+from job_scheduler import JobScheduler, INTERACTIVE, BACKGROUND
+
+# Seconds from the start of main.py to the first window on screen
+STARTUP_BUDGET = 0.5
+# Imported on a worker once the first window is up, so the first preview and ingest do not wait for them
+DEFERRED_MODULES = ("numpy", "cv2", "PIL.Image", "PIL.ImageTk")
+
+# How often the Tk thread picks up ingest progress events, in milliseconds
+PROGRESS_POLL_MS = 100
+FINAL_PROGRESS_STATES = ("done", "cancelled", "failed")
+
+log = get_logger("main")
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def describe_progress(progress):
+    # One line of status text for an ingest progress event (see ingest_progress.IngestProgress).
+    handled = progress["copied"] + progress["unchanged"] + progress["skipped"] + progress["failed"]
+    total = progress["total"] if progress["total"] is not None else f"{progress['scanned']}+"
+    text = (f"{handled}/{total} files, {progress['copied']} copied, {progress['skipped']} skipped"
+            f" - {progress['bytes_per_second'] / 1e6:.1f} MB/s")
+    if progress["failed"]:
+        text += f", {progress['failed']} failed"
+    if progress["state"] == "cancelled":
+        return f"Cancelled: {text}"
+    if progress["state"] in FINAL_PROGRESS_STATES:
+        return f"Finished: {text}"
+    if progress["eta"] is not None:
+        text += f", {format_duration(progress['eta'])} left"
+    return f"Ingesting: {text}"
 
 class MainApp:
     def __init__(self, root):
         self.root = root
         self.root.title("QBET v1.0")
         self.root.geometry("800x600")
-        if not validate_setup():
+        if not validate_setup(parent=self.root):
             messagebox.showerror("Error", "Some dependencies are missing.")
             print("Missing dependencies detected. Exiting application.")
             self.root.quit()
         self.current_frame = None
+        self.image_paths = []  # Ingested images, in order; grows while ingest is running
+        self.current_index = 0
+        self.scheduler = JobScheduler()  # Worker pool for everything heavy; results come back on the Tk thread
+        self.scheduler.attach(self.root)
+        self.prefetcher = ImagePrefetcher(scheduler=self.scheduler)  # Decodes the next images while the current one is on screen
+        self.preview_job = None
+        self.crop_job = None  # Latest crop into temp/; each crop job waits for the one before it
+        self.progress_events = None  # Filled by the ingest thread, drained on the Tk thread
+        self.cancel_token = None
+        self.status_bar = None
         self.show_interface1()
+        self.root.after_idle(self.on_first_window)  # Runs after the pending redraws, i.e. once the window is drawn
+
+    def on_first_window(self):
+        elapsed = time.perf_counter() - STARTUP_STARTED
+        record("startup", elapsed)
+        if elapsed > STARTUP_BUDGET:
+            log.warning("First window after %.0f ms, over the %.0f ms startup budget; run startup_report.py "
+                        "to see which imports are slow.", elapsed * 1000, STARTUP_BUDGET * 1000)
+        else:
+            log.info("First window after %.0f ms.", elapsed * 1000)
+        self.scheduler.submit(preload, *DEFERRED_MODULES, priority=BACKGROUND)
 
     def clear_current_frame(self):
         if self.current_frame is not None:
@@ -44,145 +117,176 @@ class MainApp:
 
     def show_interface1(self):
         self.clear_current_frame()
+        if self.status_bar is not None:
+            self.status_bar.destroy()
+            self.status_bar = None
         self.current_frame = Interface1(self.root, self.init_image_processing)
         self.current_frame.pack(fill="both", expand=True)
 
     def init_image_processing(self, selected_path):
         self.current_frame.display_initializing()
         self.root.update_idletasks()
-        print(f"Selected path for processing: {selected_path}")
-        processing_thread = threading.Thread(target=self.process_images_wrapper, args=(selected_path,))
-        processing_thread.start()
+        log.info("Selected path for processing: %s", selected_path)
+        self.image_paths = []
+        self.progress_events = queue.Queue()
+        self.cancel_token = CancellationToken()
+        self.show_status_bar()
+        self.scheduler.submit(self.process_images_wrapper, selected_path, self.progress_events, self.cancel_token,
+                              priority=BACKGROUND)
+        self.root.after(PROGRESS_POLL_MS, self.drain_progress_events)
+
+    def show_status_bar(self):
+        # Ingest progress and a Cancel button, kept below whichever interface is shown.
+        if self.status_bar is not None:
+            self.status_bar.destroy()
+        self.status_bar = tk.Frame(self.root)
+        self.status_label = tk.Label(self.status_bar, text="Scanning...", anchor="w")
+        self.status_label.pack(side=tk.LEFT, fill="x", expand=True, padx=5)
+        self.cancel_button = tk.Button(self.status_bar, text="Cancel", command=self.cancel_processing)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5, pady=2)
+        self.status_bar.pack(side=tk.BOTTOM, fill="x", before=self.current_frame)
+
+    def cancel_processing(self):
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.status_label.config(text="Cancelling...")
 
-    def process_images_wrapper(self, selected_path):
+    def drain_progress_events(self):
+        # Only the latest event matters for the display; keep polling until the final one arrives.
+        if self.status_bar is None:
+            return
+        latest = None
+        while True:
+            try:
+                latest = self.progress_events.get_nowait()
+            except queue.Empty:
+                break
+        if latest is not None:
+            finished = latest["state"] in FINAL_PROGRESS_STATES
+            if finished or not self.cancel_token.cancelled:  # Keep "Cancelling..." up until the run stops
+                self.status_label.config(text=describe_progress(latest))
+            if finished:
+                self.cancel_button.config(state=tk.DISABLED)
+                return
+        self.root.after(PROGRESS_POLL_MS, self.drain_progress_events)
+
+    def process_images_wrapper(self, selected_path, progress_events, cancel_token):
+        # Runs on a scheduler worker: open the first image as soon as it is ready, keep ingesting the rest.
+        # Anything touching Tk goes through scheduler.call_soon.
         try:
-            last_img_serial_num = process_images(selected_path)
-            self.root.after(100, self.finalize_processing, last_img_serial_num)
+            if not os.path.exists(selected_path):
+                raise FileNotFoundError(f"Source path '{selected_path}' does not exist.")
+            for _, image_path, _ in iter_process_images(selected_path, on_progress=progress_events.put,
+                                                        cancel=cancel_token):
+                self.image_paths.append(image_path)
+                if len(self.image_paths) == 1:
+                    self.scheduler.call_soon(self.show_image, 0)
+                elif len(self.image_paths) <= self.current_index + 1 + self.prefetcher.look_ahead:
+                    # The image after the current one just arrived; start decoding it
+                    self.prefetcher.prefetch(self.image_paths, self.current_index)
+            self.scheduler.call_soon(self.finalize_processing, len(self.image_paths))
         except Exception as e:
-            print(f"Error during image processing: {e}")
-            self.root.after(100, self.handle_processing_error)
+            log.exception("Error during image processing: %s", e)
+            self.scheduler.call_soon(self.handle_processing_error)
 
-    def finalize_processing(self, last_img_serial_num):
-        if last_img_serial_num is not None:
-            msg = f"The last serial number={last_img_serial_num} variable declaration succeeded, {last_img_serial_num} images have been selected."
-        else:
-            msg = "Image processing completed with no images selected."
-        if messagebox.showinfo("Processing Complete", msg):
-            image_files = glob.glob("input/*.[jp][np]g") + glob.glob("input/*.png") + glob.glob("input/*.heic") + glob.glob("input/*.gif")
-            if image_files:
-                self.show_interface2(image_files[0])
-            else:
+    def finalize_processing(self, image_count):
+        cancelled = self.cancel_token is not None and self.cancel_token.cancelled
+        if not image_count:
+            if not cancelled:
                 messagebox.showerror("Error", "No images found in the input folder.")
+            self.show_interface1()
+            return
+        if cancelled:
+            msg = f"Image processing cancelled, {image_count} images are ready."
+        else:
+            msg = f"Image processing completed, {image_count} images are ready."
+        log.info(msg)
+        self.root.title(f"QBET v1.0 - {image_count} images")
 
     def show_interface2(self, image_path):
+        self.show_image(self.image_paths.index(image_path) if image_path in self.image_paths else 0)
+
+    def show_image(self, index):
+        if not self.image_paths:
+            return
+        self.current_index = max(0, min(index, len(self.image_paths) - 1))
+        image_path = self.image_paths[self.current_index]
+        if self.preview_job is not None:
+            self.preview_job.cancel()  # The operator moved on before it was decoded
+            self.preview_job = None
+        preview = self.prefetcher.ready(image_path)
+        if preview is not None:
+            self.display_image(self.current_index, preview)
+        else:
+            # Not prefetched yet: decode it ahead of everything else and show it when it is ready
+            index = self.current_index
+            self.preview_job = self.scheduler.submit(
+                self.prefetcher.get, image_path, priority=INTERACTIVE,
+                on_done=lambda preview: self.display_image(index, preview),
+                on_error=lambda error: self.handle_processing_error())
+        self.prefetcher.prefetch(self.image_paths, self.current_index)
+
+    def display_image(self, index, preview):
+        if index != self.current_index:
+            return  # A later show_image call replaced it
+        self.preview_job = None
         self.clear_current_frame()
-        self.current_frame = Interface2(self.root, image_path, self.on_selection_made)
+        self.current_frame = Interface2(self.root, self.image_paths[index], self.on_selection_made,
+                                        self.show_next_image, self.show_previous_image, preview, self.scheduler)
         self.current_frame.pack(fill="both", expand=True)
 
+    def show_next_image(self):
+        if self.current_index + 1 < len(self.image_paths):
+            self.show_image(self.current_index + 1)
+
+    def show_previous_image(self):
+        if self.current_index > 0:
+            self.show_image(self.current_index - 1)
+
     def on_selection_made(self, selected_areas):
-        print(f"Selected areas: {selected_areas}")
+        log.debug("Selected areas: %s", selected_areas)
+        # Crop all areas of the current image at full resolution into temp/1..N/Q.png for OCR
+        image_path = self.image_paths[self.current_index]
+        scale_factor = self.current_frame.selection_tool.scale_factor
+        self.set_select_enabled(False)  # Until the crop is in temp/
+        previous = self.crop_job
+        if previous is not None:
+            previous.cancel()  # Superseded: temp/ only ever holds the latest selection
+        self.crop_job = self.scheduler.submit(self.crop_selection, previous, image_path, list(selected_areas),
+                                              scale_factor, priority=INTERACTIVE, on_done=self.on_regions_cropped,
+                                              on_error=self.on_crop_failed)
+
+    def crop_selection(self, previous, image_path, selected_areas, scale_factor):
+        # Runs on a scheduler worker. Every crop rewrites temp/, so it waits for the previous one to finish.
+        if previous is not None:
+            try:
+                previous.wait()
+            except Exception:
+                pass  # Only that it is over matters; a superseded crop is not reported
+        clean_temp_folder(TEMP_DIR)
+        return crop_regions(image_path, selected_areas, scale_factor)
+
+    def on_regions_cropped(self, region_numbers):
+        self.crop_job = None
+        self.region_numbers = region_numbers
+        self.set_select_enabled(True)
+
+    def on_crop_failed(self, error):
+        self.crop_job = None
+        self.handle_processing_error()
+
+    def set_select_enabled(self, enabled):
+        # The "Select answers" button of the image on screen, if there is one.
+        if isinstance(self.current_frame, Interface2):
+            self.current_frame.selection_tool.select_button.config(state=tk.NORMAL if enabled else tk.DISABLED)
 
     def handle_processing_error(self):
         messagebox.showerror("Error", "An error occurred during image processing.")
         self.show_interface1()
 
-class Interface1(tk.Frame):
-    def __init__(self, root, start_processing_callback):
-        super().__init__(root)
-        self.start_processing_callback = start_processing_callback
-        self.processing_started = False
-        self.selected_path = tk.StringVar()
-        
-        tk.Label(self, text="Please select a picture.").pack(pady=10)
-        self.browse_button = tk.Button(self, text="Browse...", command=self.browse_file)
-        self.browse_button.pack(pady=5)
-        
-        self.path_label = tk.Label(self, textvariable=self.selected_path)
-        self.path_label.pack(pady=5)
-        
-        self.next_button = tk.Button(self, text="Next", command=self.on_next)
-        self.next_button.pack(pady=10)
-        self.next_button.config(state=tk.DISABLED)
-
-        self.status_label = None
-        self.dot_count = 0
-
-    def browse_file(self):
-        browse_handler = BrowseHandler(self.path_label, self.set_selected_path)
-        browse_handler.open_file_dialog()
-
-    def set_selected_path(self, path):
-        self.selected_path.set(path)
-        self.next_button.config(state=tk.NORMAL)
-
-    def on_next(self):
-        if not self.processing_started:
-            self.processing_started = True
-            self.start_processing_callback(self.selected_path.get())
-            self.display_initializing()
-
-    def update_text_animation(self):
-        self.dot_count = (self.dot_count + 1) % 7
-        dots = '.' * self.dot_count
-        self.status_label.config(text=f"Initializing{dots}")
-        self.after(500, self.update_text_animation)
-
-    def display_initializing(self):
-        for widget in self.winfo_children():
-            widget.destroy()
-    
-        self.dot_count = 0
-        self.status_label = tk.Label(self, text="Initializing")
-        self.status_label.pack(pady=10)
-        self.update_text_animation()
-
-    def show_next_button(self, num_images):
-        for widget in self.winfo_children():
-            widget.destroy()
-        self.status_label = tk.Label(self, text=f"{num_images} images selected.")
-        self.status_label.pack(pady=10)
-        self.next_button = tk.Button(self, text="Next", command=self.on_next_interface)
-        self.next_button.pack(pady=10)
-
-    def on_next_interface(self):
-        self.start_processing_callback = None
-        self.pack_forget()
-
-class Interface2(tk.Frame):
-    def __init__(self, root, image_path, selection_callback):
-        super().__init__(root)
-        self.selection_callback = selection_callback
-        
-        tk.Label(self, text="Select the area you want to crop.").pack(pady=10)
-
-        self.selection_tool = SelectionTool(self, image_path, self.on_selection_made)
-        self.selection_tool.pack(fill="both", expand=True)
-
-    def on_selection_made(self, selected_areas):
-        self.selection_callback(selected_areas)
-
-class Interface3(tk.Frame):
-    def __init__(self, root, next_callback):
-        super().__init__(root)
-        self.next_callback = next_callback
-        tk.Label(self, text="OCR Result Display: QB.md").pack(pady=10)
-        self.qb_content = tk.Text(self, height=15, width=50, state=tk.DISABLED)
-        self.qb_content.pack(pady=5)
-        self.refresh_button = tk.Button(self, text="Refresh", command=self.refresh_content)
-        self.refresh_button.pack(pady=5)
-        self.next_button = tk.Button(self, text="Next", command=self.on_next)
-        self.next_button.pack(pady=10)
-
-    def refresh_content(self):
-        self.qb_content.config(state=tk.NORMAL)
-        self.qb_content.delete('1.0', tk.END)
-        self.qb_content.insert(tk.END, "Updated content from QB.md")
-        self.qb_content.config(state=tk.DISABLED)
-
-    def on_next(self):
-        self.next_callback()
-
 if __name__ == "__main__":
+    configure_logging()  # $QBET_LOG_LEVEL, WARNING by default; $QBET_TRACE writes a trace at exit
     root = tk.Tk()
     app = MainApp(root)
     root.mainloop()
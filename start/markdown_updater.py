@@ -4,9 +4,14 @@ File name:
 
 Function:
   Updates the QB.md file with OCR output for each selected area (questions, answers).
+  Answers are stored under their question in the question-bank database (see qb_store.py), which
+  writes QB.md in batches with an atomic replace. The helpers here define the QB.md format; OCR text
+  is collapsed to one line per question and answer so the file parses back into the same sections.
 
 Dependencies:
   os
+  threading
+  atexit
   markdown (maybe)
 
 """
@@ -15,11 +20,117 @@ Dependencies:
 # markdown_updater.py
 
 import os
+import atexit
+import tempfile
+import threading
+from collections import OrderedDict
+
+MARKDOWN_FILE_PATH = "output/QB.md"
+MARKDOWN_HEADER = "# Question Bank\n\n"
+
+# Number of added answers after which the question bank flushes on its own
+DEFAULT_BATCH_SIZE = 500
+
+def single_line(text):
+    # OCR text usually spans several lines; QB.md gives every question and answer exactly one.
+    return " ".join(line.strip() for line in text.splitlines() if line.strip())
+
+def format_question(question_text):
+    # Markdown heading that starts a question's section.
+    return f"## {single_line(question_text)}"
+
+def format_answer(answer_text, is_correct=False):
+    # Markdown line for one answer; correct answers are highlighted.
+    answer_text = single_line(answer_text)
+    if is_correct:
+        return f"* ==\"{answer_text}\"== "
+    return f"* \"{answer_text}\" "
+
+def parse_answer(line):
+    """
+    Parse an answer line written by format_answer.
+
+    Returns:
+        tuple: (answer text, is_correct), or None if the line is not an answer.
+    """
+    line = line.strip()
+    if line.startswith('* =="') and line.endswith('"=='):
+        return line[5:-3], True
+    if line.startswith('* "') and line.endswith('"') and len(line) >= 4:
+        return line[3:-1], False
+    return None
+
+def parse_markdown(text):
+    """
+    Split QB.md into the text before the first question and the lines of each question.
+
+    Returns:
+        tuple: (preamble str or None, OrderedDict of question -> list of non-blank lines, answers and other text).
+    """
+    preamble = []
+    sections = OrderedDict()
+    question = None
+    for line in text.splitlines():
+        if line.startswith("## "):
+            question = line[3:]
+            sections.setdefault(question, [])
+        elif question is None:
+            preamble.append(line)
+        elif line.strip():
+            sections[question].append(line)
+    if not preamble:
+        return None, sections
+    return "\n".join(preamble).rstrip("\n") + "\n\n", sections
+
+def atomic_write(path, text):
+    """
+    Replace a file's contents so readers see either the old or the new file, never a partial one.
+
+    Args:
+        path (str): The file to write.
+        text (str): Its new contents.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            tmp_file.write(text)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # Persist the rename itself
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+_default_writer = None
+_default_writer_lock = threading.Lock()
+
+def get_default_writer():
+    # Shared question bank for update_markdown_file (the SQLite store behind QB.md); flushed on interpreter exit.
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            from qb_store import QuestionBankStore
+            _default_writer = QuestionBankStore()
+            atexit.register(_default_writer.close)
+        return _default_writer
 
 def update_markdown_file(image_number, question_text, answer_text, is_correct=False):
     """
     Update the QB.md file with the given question and answer.
 
+    The answer is stored in the question bank database under its question; QB.md is
+    regenerated every DEFAULT_BATCH_SIZE answers, on flush_markdown_file() and at exit.
+
     Args:
         image_number (int): The number of the image being processed.
         question_text (str): The text of the question.
@@ -29,31 +140,15 @@ def update_markdown_file(image_number, question_text, answer_text, is_correct=Fa
     Returns:
         None
     """
-    markdown_file_path = "output/QB.md"
-    
-    # Ensure the markdown file exists
-    if not os.path.exists(markdown_file_path):
-        # Create a new markdown file if it doesn't exist
-        with open(markdown_file_path, 'w') as md_file:
-            md_file.write("# Question Bank\n\n")
-
-    # Prepare the new content to be added
-    if is_correct:
-        answer_entry = f"* ==\"{answer_text}\"== \n"
-    else:
-        answer_entry = f"* \"{answer_text}\" \n"
-
-    # Create the entry for the question and answer
-    entry = f"## {question_text}\n\n{answer_entry}\n"
-
-    # Append the entry to the markdown file
-    with open(markdown_file_path, 'a') as md_file:
-        md_file.write(entry)
+    get_default_writer().add(question_text, answer_text, is_correct, source_image=str(image_number))
 
-    print(f"Updated {markdown_file_path} with question and answer.")
+def flush_markdown_file():
+    # Commit point: write all buffered answers to QB.md now.
+    get_default_writer().flush()
 
 # Example usage
 if __name__ == "__main__":
     # Sample inputs for testing
     update_markdown_file(1, "What is the capital of France?", "Paris")
     update_markdown_file(1, "What is the capital of France?", "Berlin", is_correct=True)
+    flush_markdown_file()
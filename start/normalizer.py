@@ -0,0 +1,278 @@
+"""
+File name:
+  normalizer.py
+
+Function:
+  Normalizes every ingested image once, on a process pool: EXIF orientation applied, HEIC decoded,
+  the first frame of GIFs taken, transparency flattened onto white and the size capped. Photos (JPEG,
+  HEIC, WebP) are re-encoded as JPEG; lossless sources (PNG, GIF, BMP, TIFF) stay PNG, because they are
+  mostly screenshots whose text edges JPEG would smear right before OCR. Preview, crop and OCR then only
+  ever read these normalized copies. Each copy has a <copy>.source sidecar with the sha256 of the image
+  it was made from and the settings used, so it is redone when the content changes, not when a file is
+  merely touched or restored with an older mtime.
+  Worker time per image is recorded in the "normalize" histogram of instrumentation.py.
+
+Dependencies:
+  os
+  PIL
+  pillow_heif (optional, for HEIC)
+  time
+  concurrent.futures
+  ingest_manifest
+  instrumentation
+  lazy_import
+
+"""
+
+
+# normalizer.py
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from lazy_import import lazy_module
+from ingest_manifest import hash_file, link_or_copy
+from instrumentation import get_logger, record, count
+
+Image = lazy_module("PIL.Image")
+ImageOps = lazy_module("PIL.ImageOps")
+
+NORMALIZED_FOLDER = "normalized"  # Inside the ingest target folder
+NORMALIZED_MAX_DIMENSION = 4096
+NORMALIZED_QUALITY = 92
+NORMALIZED_PNG_COMPRESSION = 1  # zlib level; the copies are read back right away, speed beats size
+LOSSLESS_EXTENSIONS = (".png", ".gif", ".bmp", ".tif", ".tiff")
+STAMP_SUFFIX = ".source"
+
+EXIF_ORIENTATION = 0x0112
+
+log = get_logger("normalize")
+
+_heif_registered = False
+
+def register_heif():
+    # HEIC support is optional; pillow_heif imports PIL, so it is registered on first decode, not on import.
+    global _heif_registered
+    if not _heif_registered:
+        _heif_registered = True
+        try:
+            import pillow_heif # type: ignore
+            pillow_heif.register_heif_opener()
+        except ImportError:
+            pass
+
+def normalized_path(serial, normalized_folder, image_path=""):
+    # <serial>.png for lossless sources, <serial>.jpg for everything else.
+    extension = ".png" if os.path.splitext(image_path)[1].lower() in LOSSLESS_EXTENSIONS else ".jpg"
+    return os.path.join(normalized_folder, f"{serial}{extension}")
+
+def normalize_stamp(digest, max_dimension=NORMALIZED_MAX_DIMENSION, quality=NORMALIZED_QUALITY):
+    # What a normalized copy was made from; stored next to it in <copy>.source.
+    return f"{digest} {max_dimension} {quality}"
+
+def remove_normalized(serial, normalized_folder):
+    # Drop the normalized copy (either format) and its stamp of an image that is no longer ingested.
+    for extension in (".jpg", ".png"):
+        path = os.path.join(normalized_folder, f"{serial}{extension}")
+        for stale in (path, path + STAMP_SUFFIX):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+def is_up_to_date(target_path, stamp):
+    """
+    Check whether a normalized copy was made from the given content and settings.
+
+    Args:
+        target_path (str): The normalized copy.
+        stamp (str): normalize_stamp() of the ingested image.
+
+    Returns:
+        bool: True if the copy exists and its sidecar holds the same stamp.
+    """
+    try:
+        with open(target_path + STAMP_SUFFIX, "r", encoding="utf-8") as stamp_file:
+            return stamp_file.read() == stamp and os.path.exists(target_path)
+    except OSError:
+        return False
+
+def normalize_image(source_path, target_path, max_dimension=NORMALIZED_MAX_DIMENSION, quality=NORMALIZED_QUALITY,
+                    stamp=None):
+    """
+    Write an upright, size-capped RGB copy of an image, as JPEG or PNG by the extension of target_path.
+
+    Images that are already upright, small enough and in the target format are linked instead of re-encoded.
+
+    Args:
+        source_path (str): The ingested image.
+        target_path (str): Where the normalized copy goes, see normalized_path.
+        max_dimension (int): Longest side of the result, in pixels.
+        quality (int): JPEG quality.
+        stamp (str): normalize_stamp() of the source, written to the sidecar once the copy is in place.
+
+    Returns:
+        str: target_path.
+    """
+    register_heif()
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    stamp_path = target_path + STAMP_SUFFIX
+    if os.path.exists(stamp_path):
+        os.remove(stamp_path)  # A crash below must not leave the old stamp on a new copy
+    _write_normalized(source_path, target_path, max_dimension, quality)
+    if stamp is not None:
+        with open(stamp_path, "w", encoding="utf-8") as stamp_file:
+            stamp_file.write(stamp)
+    return target_path
+
+def _write_normalized(source_path, target_path, max_dimension, quality):
+    target_format = "PNG" if target_path.lower().endswith(".png") else "JPEG"
+    with Image.open(source_path) as image:
+        orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+        if (image.format == target_format and orientation == 1 and image.mode in ("RGB", "L")
+                and max(image.size) <= max_dimension):
+            link_or_copy(source_path, target_path)
+            return
+
+        if image.format == "JPEG" and max(image.size) > max_dimension:
+            # Decode at 1/2, 1/4 or 1/8 scale when that still covers the cap
+            ratio = max_dimension / max(image.size)
+            image.draft("RGB", (int(image.width * ratio), int(image.height * ratio)))
+        image.seek(0)  # First frame of animations
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, "white")
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        tmp_path = f"{target_path}.tmp"
+        try:
+            if target_format == "PNG":
+                image.save(tmp_path, "PNG", compress_level=NORMALIZED_PNG_COMPRESSION)
+            else:
+                image.save(tmp_path, "JPEG", quality=quality)
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+def _timed_normalize(*args):
+    # normalize_image in a worker process; its duration is sent back to be recorded here.
+    start = time.perf_counter()
+    target_path = normalize_image(*args)
+    return target_path, time.perf_counter() - start
+
+class NormalizePool:
+    """
+    Normalizes ingested images on a process pool, for iter_normalized and the async pipeline alike.
+
+    Images whose normalized copy was made from the same content (see is_up_to_date) are not
+    touched, and the pool is only started once an image actually needs work. If an image
+    cannot be normalized (unreadable, a decompression bomb, or its worker died) the ingested
+    file is used as it is; a pool broken by a dying worker is replaced.
+    """
+
+    def __init__(self, normalized_folder, max_workers=None, max_dimension=NORMALIZED_MAX_DIMENSION,
+                 quality=NORMALIZED_QUALITY):
+        self.normalized_folder = normalized_folder
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.pool = None
+
+    def submit(self, serial, image_path, digest=None):
+        """
+        Start normalizing one ingested image.
+
+        Args:
+            serial (int): Serial number of the image, names the normalized copy.
+            image_path (str): The ingested image.
+            digest (str): sha256 of the ingested file, as kept by IngestManifest. Computed here if None.
+
+        Returns:
+            Future: Settled with (normalized path, seconds), seconds being None if the copy was up to date.
+        """
+        target_path = normalized_path(serial, self.normalized_folder, image_path)
+        stamp = normalize_stamp(digest or hash_file(image_path), self.max_dimension, self.quality)
+        if is_up_to_date(target_path, stamp):
+            future = Future()
+            future.set_result((target_path, None))
+            return future
+        args = (image_path, target_path, self.max_dimension, self.quality, stamp)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.max_workers)
+        try:
+            return self.pool.submit(_timed_normalize, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); its images fall back, the rest get a new pool
+            self.pool.shutdown(wait=False)
+            self.pool = ProcessPoolExecutor(self.max_workers)
+            return self.pool.submit(_timed_normalize, *args)
+
+    def result(self, image_path, future):
+        """
+        Settle a finished submit.
+
+        Args:
+            image_path (str): The ingested image the future was submitted for.
+            future (Future): As returned by submit; must be done.
+
+        Returns:
+            tuple: (path of the image to work with, None), or (image_path, the error) if it could not be normalized.
+        """
+        try:
+            target_path, seconds = future.result()
+        except (OSError, ValueError, Image.DecompressionBombError, BrokenProcessPool) as e:
+            count("normalize.failed")
+            log.warning("Cannot normalize '%s', using it as is: %s", image_path, e)
+            return image_path, e
+        if seconds is None:
+            count("normalize.unchanged")
+        else:
+            count("normalize.written")
+            record("normalize", seconds)
+        return target_path, None
+
+    def shutdown(self, wait=True):
+        # Images still waiting are dropped; their callers are gone.
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=True)
+            self.pool = None
+
+def iter_normalized(images, normalized_folder, max_workers=None, max_in_flight=None,
+                    max_dimension=NORMALIZED_MAX_DIMENSION, quality=NORMALIZED_QUALITY):
+    """
+    Normalize ingested images on a NormalizePool, yielding them in their original order.
+
+    Args:
+        images (iterable of tuple): (serial, ingested path, source path, sha256 of the ingested file),
+            as yielded by image_processor._iter_ingest. A None sha256 is computed here.
+        normalized_folder (str): Folder for the <serial>.jpg and <serial>.png copies.
+        max_workers (int): Worker processes. Defaults to the CPU count.
+        max_in_flight (int): Images submitted ahead of the one being yielded.
+        max_dimension (int): Longest side of the normalized images.
+        quality (int): JPEG quality.
+
+    Yields:
+        tuple: (serial, normalized path, source path); the ingested path if it could not be normalized.
+    """
+    pool = NormalizePool(normalized_folder, max_workers, max_dimension, quality)
+    max_in_flight = max_in_flight or pool.max_workers * 2
+    pending = deque()
+
+    def collect():
+        serial, image_path, source_path, future = pending.popleft()
+        return serial, pool.result(image_path, future)[0], source_path
+
+    try:
+        for serial, image_path, source_path, digest in images:
+            pending.append((serial, image_path, source_path, pool.submit(serial, image_path, digest)))
+            while pending and (pending[0][3].done() or len(pending) > max_in_flight):
+                yield collect()
+        while pending:
+            yield collect()
+    finally:
+        pool.shutdown()
@@ -0,0 +1,168 @@
+"""
+File name:
+  ocr_cache.py
+
+Function:
+  Disk-backed OCR result cache keyed by the hash of the cropped image bytes and the OCR engine settings.
+
+Dependencies:
+  os
+  hashlib
+  threading
+
+"""
+
+
+# ocr_cache.py
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'cache', 'ocr')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 500000
+
+def cache_key(image_bytes, settings=None):
+    """
+    Compute the cache key for one crop.
+
+    Args:
+        image_bytes (bytes): The encoded crop, as written to Q.png.
+        settings (dict): OCR engine settings that can change the recognized text.
+
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    digest = hashlib.sha256(json.dumps(settings or {}, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+class OCRCache:
+    """
+    Recognized text stored as one file per key under cache_dir.
+
+    Entries are evicted least-recently-used first once the cache holds more than
+    max_bytes of text or more than max_entries files. Recency survives restarts
+    through the file modification times, which are refreshed on every hit.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def _load_index(self):
+        found = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".txt"):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime_ns, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def get(self, key):
+        """
+        Look up the text for a key.
+
+        Args:
+            key (str): A key from cache_key.
+
+        Returns:
+            str: The cached text, or None on a miss.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cached_file:
+                text = cached_file.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key, text):
+        # Store the text for a key, replacing the file atomically.
+        path = self._path(key)
+        data = text.encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._entries and (self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """
+        Report cache usage.
+
+        Returns:
+            dict: hits, misses, hit_rate, evictions, entries and bytes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+            }
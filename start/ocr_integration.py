@@ -4,10 +4,21 @@ File name:
 
 Function:
   Integrates the OCR command to process cropped images, handles OCR output text saving to QB.md.
+  Every run_ocr call is timed as an "ocr" span; progress goes to the "qbet.ocr" logger.
+  recognize_crop and batch_recognize take encoded crops in memory and return the text in memory: over the
+  engine's HTTP API with a session, else through OCR_STDIN_COMMAND's stdin/stdout when the engine has such a
+  mode. The temp/<n>/Q.png and Q.txt files are then only needed for debugging or keeping the crops.
+  Both paths (and async_pipeline) go through recognize_cached for the cache lookup and fill.
 
 Dependencies:
   subprocess
   os
+  concurrent.futures
+  threading
+  tempfile
+  urllib
+  lazy_import
+  instrumentation
 
 """
 
@@ -15,48 +26,430 @@ Dependencies:
 # ocr_integration.py
 
 import os
+import json
+import time
+import base64
+import tempfile
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from ocr_cache import cache_key
+from lazy_import import lazy_module
+from instrumentation import get_logger, span, count
+
+# Only the HTTP engine needs these, and urllib.request takes a noticeable part of the GUI's startup
+url_error = lazy_module("urllib.error")
+url_request = lazy_module("urllib.request")
 
 # Set the root directory as a configurable variable
 ROOT_DIR = os.path.join(os.path.dirname(__file__), '..')  # Assuming QBET_V1.0 as root directory
 TEMP_DIR = os.path.join(ROOT_DIR, 'temp')
 
-def run_ocr(image_number):
+# OCR executable and its leading arguments, run without a shell
+OCR_COMMAND = ["umi-ocr"]
+
+# OCR executable reading one encoded image on stdin and printing its text on stdout; None if the engine
+# has no such mode, in which case in-memory crops go through a private temporary file
+OCR_STDIN_COMMAND = None
+
+# Default number of OCR processes running at the same time
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+
+# Long-lived engine started by OCRSession; Umi-OCR serves its HTTP API on this port
+SESSION_COMMAND = ["umi-ocr", "--hide"]
+DEFAULT_OCR_HOST = "127.0.0.1"
+DEFAULT_OCR_PORT = 1224
+DEFAULT_OCR_OPTIONS = {"data.format": "text"}
+
+# Umi-OCR result codes: 100 is success, 101 means no text was found
+OCR_CODE_SUCCESS = 100
+OCR_CODE_NO_TEXT = 101
+
+log = get_logger("ocr")
+
+class OCRSessionError(RuntimeError):
+    pass
+
+class OCRSession:
+    """
+    A long-lived OCR engine that is started once and fed crops over its local HTTP API.
+
+    The session attaches to an engine that is already listening, or starts one with
+    `command`. A keep-alive thread checks its health and restarts it if it stops
+    answering, and `recognize` retries once after a restart.
+    """
+
+    def __init__(self, command=None, host=DEFAULT_OCR_HOST, port=DEFAULT_OCR_PORT,
+                 options=None, startup_timeout=60.0, request_timeout=60.0, keepalive_interval=10.0):
+        self.command = list(command or SESSION_COMMAND)
+        self.base_url = f"http://{host}:{port}"
+        self.options = dict(DEFAULT_OCR_OPTIONS if options is None else options)
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self.keepalive_interval = keepalive_interval
+        self.process = None
+        self.restarts = 0
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._keepalive_thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        # Start (or attach to) the engine and begin the keep-alive checks.
+        with self._lock:
+            self._launch()
+        if self.keepalive_interval and self._keepalive_thread is None:
+            self._stop_event.clear()
+            self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="ocr-keepalive", daemon=True)
+            self._keepalive_thread.start()
+        return self
+
+    def _launch(self):
+        if self.is_healthy():
+            return
+        if self.process is None or self.process.poll() is not None:
+            log.info("Starting OCR engine: %s", subprocess.list2cmdline(self.command))
+            self.process = subprocess.Popen(self.command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.is_healthy():
+                log.info("OCR engine is ready at %s", self.base_url)
+                return
+            if self.process.poll() is not None:
+                raise OCRSessionError(f"OCR engine exited during startup with code {self.process.returncode}")
+            time.sleep(0.1)
+        raise OCRSessionError(f"OCR engine did not answer at {self.base_url} within {self.startup_timeout}s")
+
+    def _terminate(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def is_healthy(self, timeout=2.0):
+        # Health check: the engine answers its options endpoint.
+        try:
+            with url_request.urlopen(f"{self.base_url}/api/ocr/get_options", timeout=timeout) as response:
+                return response.status == 200
+        except (url_error.URLError, OSError):
+            return False
+
+    def ensure_running(self):
+        # Restart the engine if it no longer answers.
+        with self._lock:
+            if not self.is_healthy():
+                self.restart()
+
+    def restart(self):
+        with self._lock:
+            log.warning("Restarting OCR engine at %s", self.base_url)
+            self._terminate()
+            self._launch()
+            self.restarts += 1
+
+    def _keepalive_loop(self):
+        while not self._stop_event.wait(self.keepalive_interval):
+            try:
+                self.ensure_running()
+            except OCRSessionError as e:
+                log.warning("OCR engine keep-alive failed: %s", e)
+
+    def _post_image(self, image_bytes):
+        payload = json.dumps({
+            "base64": base64.b64encode(image_bytes).decode("ascii"),
+            "options": self.options,
+        }).encode("utf-8")
+        request = url_request.Request(f"{self.base_url}/api/ocr", data=payload,
+                                         headers={"Content-Type": "application/json"})
+        with url_request.urlopen(request, timeout=self.request_timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def recognize(self, image_bytes):
+        """
+        Recognize the text in one encoded image.
+
+        Args:
+            image_bytes (bytes): The encoded image (PNG, JPEG, ...).
+
+        Returns:
+            str: The recognized text, empty if the engine found none.
+        """
+        try:
+            reply = self._post_image(image_bytes)
+        except (url_error.URLError, OSError):
+            # The engine may have died between keep-alive checks; restart and retry once
+            self.ensure_running()
+            reply = self._post_image(image_bytes)
+
+        code = reply.get("code")
+        if code == OCR_CODE_NO_TEXT:
+            return ""
+        if code != OCR_CODE_SUCCESS:
+            raise OCRSessionError(f"OCR engine returned code {code}: {reply.get('data')}")
+        data = reply.get("data")
+        if isinstance(data, list):
+            return "\n".join(block.get("text", "") for block in data)
+        return data or ""
+
+    def recognize_file(self, image_path):
+        with open(image_path, "rb") as image_file:
+            return self.recognize(image_file.read())
+
+    def close(self):
+        # Stop the keep-alive thread and the engine if this session started it.
+        self._stop_event.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join()
+            self._keepalive_thread = None
+        with self._lock:
+            self._terminate()
+
+def build_ocr_command(image_path, output_path):
+    """
+    Build the argument list for one OCR call.
+
+    Args:
+        image_path (str): Path of the cropped image to recognize.
+        output_path (str): Path of the text file the OCR engine writes.
+
+    Returns:
+        list of str: The command, ready for subprocess without a shell.
+    """
+    return [*OCR_COMMAND, "--path", image_path, "--output", output_path]
+
+def ocr_settings(session=None, in_memory=False):
+    # Engine settings that can change the recognized text; part of the OCR cache key.
+    if session is not None:
+        return {"engine": "session", "options": session.options}
+    if in_memory and OCR_STDIN_COMMAND:
+        return {"engine": "stdin", "command": OCR_STDIN_COMMAND}
+    return {"engine": "command", "command": OCR_COMMAND}
+
+def _write_text(path, text):
+    with open(path, "w", encoding="utf-8") as output_file:
+        output_file.write(text)
+
+def run_ocr(image_number, session=None, cache=None):
     """
     Run the OCR command using the provided image number.
 
     Args:
         image_number (int): The number of the image being processed.
+        session (OCRSession): A running engine to send the crop to instead of starting a new process.
+        cache (OCRCache): Result cache consulted before the engine and filled after it.
 
     Returns:
-        None
+        dict: The result with keys "image_number", "success", "cached", "output_path" and "error".
     """
+    with span("ocr", image=image_number):
+        result = _run_ocr(image_number, session, cache)
+    count("ocr.cached" if result["cached"] else "ocr.succeeded" if result["success"] else "ocr.failed")
+    return result
+
+def _run_ocr(image_number, session, cache):
     image_path = os.path.join(TEMP_DIR, str(image_number), "Q.png")
     output_path = os.path.join(TEMP_DIR, str(image_number), "Q.txt")
-    
-    # Construct the OCR command
-    command = f'umi-ocr --path "{image_path}" --output "{output_path}"'
-    print(f"Executing command: {command}")
-    
+    result = {"image_number": image_number, "success": False, "cached": False, "output_path": output_path, "error": None}
+
+    def recognize(image_bytes):
+        # The engine writes Q.txt itself; with a session it is written here
+        if session is not None:
+            text = session.recognize(image_bytes)
+            _write_text(output_path, text)
+            return text
+        command = build_ocr_command(image_path, output_path)
+        log.debug("Executing command: %s", subprocess.list2cmdline(command))
+        subprocess.run(command, check=True)
+        with open(output_path, "r", encoding="utf-8") as output_file:
+            return output_file.read()
+
     try:
-        # Execute the command
-        subprocess.run(command, shell=True, check=True)
-        print(f"OCR completed for image {image_number}. Output saved to {output_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"OCR failed for image {image_number}. Error: {e}")
+        with open(image_path, "rb") as image_file:
+            image_bytes = image_file.read()
+        text, result["cached"] = recognize_cached(image_bytes, recognize, ocr_settings(session), cache)
+        if result["cached"]:
+            _write_text(output_path, text)
+        result["success"] = True
+        log.debug("OCR completed for image %s. Output saved to %s", image_number, output_path)
+    except (OCRSessionError, subprocess.CalledProcessError, OSError, ValueError) as e:
+        result["error"] = str(e)
+        log.warning("OCR failed for image %s. Error: %s", image_number, e)
+    return result
+
+def recognize_cached(image_bytes, recognize, settings, cache=None):
+    """
+    Look an encoded crop up in the OCR cache, recognizing and caching it on a miss.
+
+    Args:
+        image_bytes (bytes): The encoded crop; its hash is the cache key.
+        recognize (callable): Called with image_bytes on a miss; returns the text.
+        settings (dict): Engine settings that are part of the key, see ocr_settings.
+        cache (OCRCache): Result cache, or None to always recognize.
+
+    Returns:
+        tuple: (text, cached).
+    """
+    key = None
+    if cache is not None:
+        key = cache_key(image_bytes, settings)
+        text = cache.get(key)
+        if text is not None:
+            return text, True
+    text = recognize(image_bytes)
+    if key is not None:
+        try:
+            cache.put(key, text)
+        except OSError as e:
+            log.warning("Could not cache an OCR result: %s", e)
+    return text, False
+
+def recognize_with_command(image_bytes):
+    """
+    Recognize one encoded image with the OCR command, without the temp folder.
+
+    Uses OCR_STDIN_COMMAND when it is set; otherwise OCR_COMMAND on a private temporary file.
+
+    Returns:
+        str: The recognized text.
+    """
+    if OCR_STDIN_COMMAND:
+        log.debug("Executing command: %s", subprocess.list2cmdline(OCR_STDIN_COMMAND))
+        completed = subprocess.run(OCR_STDIN_COMMAND, input=image_bytes, stdout=subprocess.PIPE, check=True)
+        return completed.stdout.decode("utf-8", errors="replace")
+    with tempfile.TemporaryDirectory(prefix="qbet-ocr-") as folder:
+        image_path = os.path.join(folder, "Q.png")
+        output_path = os.path.join(folder, "Q.txt")
+        with open(image_path, "wb") as image_file:
+            image_file.write(image_bytes)
+        command = build_ocr_command(image_path, output_path)
+        log.debug("Executing command: %s", subprocess.list2cmdline(command))
+        subprocess.run(command, check=True)
+        with open(output_path, "r", encoding="utf-8") as output_file:
+            return output_file.read()
+
+def recognize_crop(image_number, image_bytes, session=None, cache=None):
+    """
+    Recognize one crop held in memory.
+
+    Args:
+        image_number (int): Region number, for results and messages.
+        image_bytes (bytes): The encoded crop, e.g. from crop_engine.crop_region_buffers.
+        session (OCRSession): A running engine to send the crop to over HTTP.
+        cache (OCRCache): Result cache consulted before the engine and filled after it.
+
+    Returns:
+        dict: The result with keys "image_number", "success", "cached", "text" and "error".
+    """
+    with span("ocr", image=image_number):
+        result = _recognize_crop(image_number, image_bytes, session, cache)
+    count("ocr.cached" if result["cached"] else "ocr.succeeded" if result["success"] else "ocr.failed")
+    return result
+
+def _recognize_crop(image_number, image_bytes, session, cache):
+    result = {"image_number": image_number, "success": False, "cached": False, "text": None, "error": None}
+    recognize = session.recognize if session is not None else recognize_with_command
+    try:
+        text, cached = recognize_cached(image_bytes, recognize, ocr_settings(session, in_memory=True), cache)
+    except (OCRSessionError, subprocess.CalledProcessError, OSError, ValueError) as e:
+        result["error"] = str(e)
+        log.warning("OCR failed for image %s. Error: %s", image_number, e)
+        return result
+    result.update(success=True, cached=cached, text=text)
+    return result
+
+def _run_batch(run, jobs, max_workers, max_in_flight, on_result, result_keys=()):
+    # Run run(*job) for every job on a bounded thread pool; results come back in job order.
+    # jobs may be a generator: the next job is only pulled once fewer than max_in_flight are pending.
+    # An unexpected error in one job (a cache database error, say) fails that image, not the batch;
+    # its result gets the usual keys plus result_keys, set to None.
+    max_workers = max(1, max_workers or DEFAULT_MAX_WORKERS)
+    max_in_flight = max(max_workers, max_in_flight or 2 * max_workers)
+    results = []
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            index, image_number = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                count("ocr.failed")
+                log.warning("OCR failed for image %s. Error: %s", image_number, e, exc_info=True)
+                result = {"image_number": image_number, "success": False, "cached": False, "error": str(e),
+                          **dict.fromkeys(result_keys)}
+            results[index] = result
+            if on_result is not None:
+                on_result(result)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr") as executor:
+        for index, job in enumerate(jobs):
+            # Keep the queue bounded so huge batches do not pile up futures
+            if len(pending) >= max_in_flight:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            results.append(None)
+            pending[executor.submit(run, *job)] = index, job[0]
+        collect(wait(pending).done)
+
+    failed = sum(1 for result in results if not result["success"])
+    log.info("OCR batch finished: %d succeeded, %d failed.", len(results) - failed, failed)
+    return results
+
+def _log_cache_stats(cache):
+    if cache is not None:
+        stats = cache.stats()
+        log.info("OCR cache: %d hits, %d misses, %d entries.", stats["hits"], stats["misses"], stats["entries"])
+
+def batch_recognize(crops, max_workers=None, max_in_flight=None, session=None, cache=None, on_result=None):
+    """
+    Recognize a batch of in-memory crops on a pool of concurrent workers.
+
+    Args:
+        crops (iterable of tuple): (region number, encoded crop bytes) pairs. A generator is only
+            advanced as workers free up, so it can cut crops while earlier ones are recognized.
+        max_workers (int): Number of recognitions running at once. Defaults to the CPU count.
+        max_in_flight (int): Upper bound on submitted but unfinished jobs. Defaults to twice max_workers.
+        session (OCRSession): A running engine shared by all workers.
+        cache (OCRCache): Result cache shared by all workers.
+        on_result (callable): Called with each result as soon as it is collected, e.g. for progress.
+
+    Returns:
+        list of dict: One result per crop (see recognize_crop), in the order of crops.
+    """
+    results = _run_batch(lambda number, image_bytes: recognize_crop(number, image_bytes, session, cache),
+                         crops, max_workers, max_in_flight, on_result, ("text",))
+    _log_cache_stats(cache)
+    return results
 
-def batch_run_ocr(image_numbers):
+def batch_run_ocr(image_numbers, max_workers=None, max_in_flight=None, session=None, cache=None, on_result=None):
     """
-    Run OCR for a batch of images.
+    Run OCR for a batch of images on a pool of concurrent workers.
 
     Args:
-        image_numbers (list of int): List of image numbers to process.
+        image_numbers (iterable of int): Image numbers to process; a generator is advanced as workers free up.
+        max_workers (int): Number of OCR processes running at once. Defaults to the CPU count.
+        max_in_flight (int): Upper bound on submitted but unfinished jobs. Defaults to twice max_workers.
+        session (OCRSession): A running engine shared by all workers, see run_ocr.
+        cache (OCRCache): Result cache shared by all workers, see run_ocr.
+        on_result (callable): Called with each result as soon as it is collected, e.g. for progress.
 
     Returns:
-        None
+        list of dict: One result per image, in the order of image_numbers.
     """
-    for image_number in image_numbers:
-        run_ocr(image_number)
+    results = _run_batch(lambda image_number: run_ocr(image_number, session, cache),
+                         ((image_number,) for image_number in image_numbers), max_workers, max_in_flight, on_result,
+                         ("output_path",))
+    _log_cache_stats(cache)
+    return results
 
 # Example usage
 if __name__ == "__main__":
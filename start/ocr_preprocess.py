@@ -0,0 +1,171 @@
+"""
+File name:
+  ocr_preprocess.py
+
+Function:
+  Cleans up crops before OCR: grayscale, denoising, adaptive binarization, deskew, margin trim and rescaling so
+  the text has a fixed height. OCR time grows with the pixel count and noise hurts accuracy, so the
+  engine gets small, upright, black-on-white crops. Each step can be switched off in the options.
+
+Dependencies:
+  numpy
+  cv2
+  layout_detector
+  lazy_import
+
+"""
+
+
+# ocr_preprocess.py
+
+from lazy_import import lazy_module
+from layout_detector import text_lines
+
+np = lazy_module("numpy")
+cv2 = lazy_module("cv2")
+
+# Used by crop_engine.crop_regions; set "enabled" to False to hand the engine the raw crops
+PREPROCESS_OPTIONS = {
+    "enabled": True,
+    "denoise": True,        # Median filter before and speck removal after binarization
+    "min_speck_area": 6,    # Ink components smaller than this many pixels are removed
+    "binarize": True,
+    "block_size": 31,       # Adaptive threshold neighbourhood, odd, in pixels
+    "threshold_offset": 15, # Subtracted from the local mean; higher keeps less faint ink
+    "deskew": True,
+    "max_skew": 8.0,        # Degrees searched either way
+    "skew_step": 0.25,
+    "trim": True,
+    "margin": 8,            # White border kept around the ink after trimming, in pixels
+    "text_height": 32,      # Target median line height in pixels; None keeps the size
+    "min_scale": 0.25,
+    "max_scale": 3.0,
+}
+
+# Ink pixels sampled for the skew estimate
+SKEW_SAMPLE_POINTS = 20000
+
+def options_with(**overrides):
+    return {**PREPROCESS_OPTIONS, **overrides}
+
+def to_gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+def binarize(gray, block_size, offset):
+    # Black text on white, robust to uneven lighting across a photographed page.
+    block_size = max(3, block_size | 1)
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, block_size, offset)
+
+def remove_specks(binary, min_area):
+    # Whiten ink components smaller than min_area pixels.
+    count, labels, stats, _ = cv2.connectedComponentsWithStats((binary < 128).astype(np.uint8), connectivity=8)
+    small = stats[:, cv2.CC_STAT_AREA] < min_area
+    small[0] = False  # Label 0 is the background
+    if not small.any():
+        return binary
+    cleaned = binary.copy()
+    cleaned[small[labels]] = 255
+    return cleaned
+
+def estimate_skew(ink, max_skew, step):
+    """
+    Estimate the text angle from the ink pixels of a crop.
+
+    Every candidate angle is scored at once: the ink coordinates are projected onto the rotated
+    vertical axis for all angles in one matrix product, and the angle whose row histogram is the
+    most peaked (text lines lined up with rows) wins.
+
+    Args:
+        ink (numpy.ndarray): H x W boolean mask of ink pixels.
+        max_skew (float): Largest angle tried, in degrees, either way.
+        step (float): Angle step in degrees.
+
+    Returns:
+        float: The skew in degrees, in rotate()'s convention; rotate by its negative to level the lines.
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 2:
+        return 0.0
+    if len(ys) > SKEW_SAMPLE_POINTS:
+        picked = np.random.default_rng(0).choice(len(ys), SKEW_SAMPLE_POINTS, replace=False)
+        ys, xs = ys[picked], xs[picked]
+    angles = np.deg2rad(np.arange(-max_skew, max_skew + step / 2, step))
+    # rows[a, p] = row of point p after rotating by angle a
+    rows = np.outer(np.cos(angles), ys) - np.outer(np.sin(angles), xs)
+    rows = np.round(rows - rows.min(axis=1, keepdims=True)).astype(np.int64)
+    size = int(rows.max()) + 1
+    offsets = np.arange(len(angles))[:, None] * size
+    histograms = np.bincount((rows + offsets).ravel(), minlength=len(angles) * size).reshape(len(angles), size)
+    scores = (histograms.astype(np.float64) ** 2).sum(axis=1)
+    return float(np.rad2deg(angles[int(np.argmax(scores))]))
+
+def rotate(image, angle):
+    # Rotate around the centre, growing the canvas so no corner is cut off; new area is white.
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), -angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width, new_height = int(height * sin + width * cos + 0.5), int(height * cos + width * sin + 0.5)
+    matrix[0, 2] += new_width / 2 - width / 2
+    matrix[1, 2] += new_height / 2 - height / 2
+    return cv2.warpAffine(image, matrix, (new_width, new_height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+def trim(image, ink, margin):
+    rows = np.flatnonzero(ink.any(axis=1))
+    columns = np.flatnonzero(ink.any(axis=0))
+    if not len(rows):
+        return image
+    height, width = image.shape[:2]
+    y0, y1 = max(0, rows[0] - margin), min(height, rows[-1] + 1 + margin)
+    x0, x1 = max(0, columns[0] - margin), min(width, columns[-1] + 1 + margin)
+    return image[y0:y1, x0:x1]
+
+def rescale(image, ink, text_height, min_scale, max_scale):
+    lines = text_lines(ink.astype(np.uint8))
+    if not text_height or not len(lines):
+        return image
+    heights = lines[:, 1] - lines[:, 0]
+    # Stray specks and underlines make short "lines"; measure the real text lines only
+    scale = text_height / float(np.median(heights[heights >= heights.max() / 2]))
+    scale = min(max(scale, min_scale), max_scale)
+    if abs(scale - 1.0) < 0.1:
+        return image
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+def preprocess(crop, options=None):
+    """
+    Prepare one crop for OCR.
+
+    Args:
+        crop (numpy.ndarray): BGR or grayscale crop.
+        options (dict): See PREPROCESS_OPTIONS; defaults to it.
+
+    Returns:
+        numpy.ndarray: The processed grayscale crop, or crop unchanged if preprocessing is disabled.
+    """
+    options = PREPROCESS_OPTIONS if options is None else options
+    if not options.get("enabled", True) or crop.size == 0:
+        return crop
+
+    image = to_gray(crop)
+    if options["denoise"]:
+        image = cv2.medianBlur(image, 3)
+    if options["binarize"]:
+        image = binarize(image, options["block_size"], options["threshold_offset"])
+        if options["denoise"]:
+            image = remove_specks(image, options["min_speck_area"])
+        ink = image < 128
+    else:
+        _, mask = cv2.threshold(image, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        ink = mask.astype(bool)
+
+    if options["deskew"]:
+        angle = estimate_skew(ink, options["max_skew"], options["skew_step"])
+        if abs(angle) >= options["skew_step"]:
+            image = rotate(image, -angle)
+            ink = image < 128
+    if options["trim"]:
+        image = trim(image, ink, options["margin"])
+        ink = image < 128
+    return rescale(image, ink, options["text_height"], options["min_scale"], options["max_scale"])
@@ -0,0 +1,166 @@
+"""
+File name:
+  ocr_stub_engine.py
+
+Function:
+  A local stand-in for the Umi-OCR HTTP API, so OCRSession can be exercised without the real binary.
+  With --path and --output it instead behaves like the one-shot `umi-ocr` command line (see stub_cli_command),
+  and with --stdin it reads one image on stdin and prints its text (for ocr_integration.OCR_STDIN_COMMAND).
+
+Dependencies:
+  http.server
+  threading
+  argparse
+
+"""
+
+
+# ocr_stub_engine.py
+
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Images whose bytes start with this prefix are "recognized" as the text that follows it
+TEXT_PREFIX = b"TEXT:"
+
+def stub_recognize(image_bytes):
+    """
+    Produce deterministic text for an image.
+
+    Args:
+        image_bytes (bytes): The image sent to the engine.
+
+    Returns:
+        str: The text after TEXT_PREFIX, or a digest-based placeholder for real images.
+    """
+    if image_bytes.startswith(TEXT_PREFIX):
+        return image_bytes[len(TEXT_PREFIX):].decode("utf-8", errors="replace")
+    return f"stub-{hashlib.sha1(image_bytes).hexdigest()[:12]}"
+
+class StubOCRHandler(BaseHTTPRequestHandler):
+    # Answers the two Umi-OCR endpoints OCRSession uses; latency and counters live on the server.
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/ocr/get_options":
+            self._send_json(200, {"data.format": {"default": "dict"}})
+        else:
+            self._send_json(404, {"code": 404, "data": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/ocr":
+            self._send_json(404, {"code": 404, "data": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            image_bytes = base64.b64decode(request["base64"])
+        except (ValueError, KeyError) as e:
+            self._send_json(200, {"code": 204, "data": f"bad request: {e}"})
+            return
+
+        time.sleep(self.server.latency)
+        with self.server.requests_lock:  # One handler thread per request
+            self.server.requests += 1
+        text = stub_recognize(image_bytes)
+        if not text:
+            self._send_json(200, {"code": 101, "data": ""})
+        elif request.get("options", {}).get("data.format") == "text":
+            self._send_json(200, {"code": 100, "data": text})
+        else:
+            self._send_json(200, {"code": 100, "data": [{"text": line, "score": 1.0} for line in text.split("\n")]})
+
+    def log_message(self, format, *args):
+        pass
+
+def create_stub_server(host="127.0.0.1", port=0, latency=0.0):
+    """
+    Create a stub engine server without starting it.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on; 0 picks a free one (see server.server_address).
+        latency (float): Seconds to sleep per recognition, to mimic a real engine.
+
+    Returns:
+        ThreadingHTTPServer: The server; call serve_forever() or use start_stub_server.
+    """
+    server = ThreadingHTTPServer((host, port), StubOCRHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.requests = 0
+    server.requests_lock = threading.Lock()
+    return server
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0):
+    # Run a stub engine on a background thread and return the server.
+    server = create_stub_server(host, port, latency)
+    threading.Thread(target=server.serve_forever, name="ocr-stub", daemon=True).start()
+    return server
+
+def stub_engine_command(port, latency=0.0, startup_delay=0.0):
+    # Command line for running the stub as a separate engine process, e.g. for OCRSession(command=...).
+    return [sys.executable, os.path.abspath(__file__), "--port", str(port),
+            "--latency", str(latency), "--startup-delay", str(startup_delay)]
+
+def stub_cli_command(latency=0.0):
+    # Drop-in for ocr_integration.OCR_COMMAND: recognizes one image per process, like `umi-ocr --path ... --output ...`.
+    return [sys.executable, os.path.abspath(__file__), "--latency", str(latency)]
+
+def stub_stdin_command(latency=0.0):
+    # Drop-in for ocr_integration.OCR_STDIN_COMMAND: image bytes on stdin, text on stdout.
+    return [*stub_cli_command(latency), "--stdin"]
+
+def recognize_file(image_path, output_path, latency=0.0):
+    with open(image_path, "rb") as image_file:
+        image_bytes = image_file.read()
+    time.sleep(latency)
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        output_file.write(stub_recognize(image_bytes))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub Umi-OCR HTTP engine for testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1224)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per recognition.")
+    parser.add_argument("--startup-delay", type=float, default=0.0, help="Seconds before listening, like a model load.")
+    parser.add_argument("--path", help="Recognize this image once and exit instead of serving.")
+    parser.add_argument("--output", help="Text file written for --path.")
+    parser.add_argument("--stdin", action="store_true", help="Recognize the image on stdin once, print the text and exit.")
+    args = parser.parse_args(argv)
+
+    if args.stdin:
+        image_bytes = sys.stdin.buffer.read()
+        time.sleep(args.latency)
+        sys.stdout.write(stub_recognize(image_bytes))
+        return
+    if args.path:
+        if not args.output:
+            parser.error("--path needs --output")
+        recognize_file(args.path, args.output, args.latency)
+        return
+
+    time.sleep(args.startup_delay)
+    server = create_stub_server(args.host, args.port, args.latency)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
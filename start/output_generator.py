@@ -7,16 +7,20 @@ Function:
 
 Dependencies:
   os
-  shutil
+  ingest_manifest
+  qb_store
+  instrumentation
 
 """
 
-#it cannot generation a QB.md   !!!
-
 # output_generator.py
 
 import os
-import shutil
+from ingest_manifest import IngestManifest
+from qb_store import QuestionBankStore
+from instrumentation import get_logger, span, count
+
+log = get_logger("ingest")
 
 class OutputGenerator:
     def __init__(self, root_dir):
@@ -26,6 +30,7 @@ class OutputGenerator:
         self.input_dir = os.path.join(root_dir, "input")
         self.output_dir = os.path.join(root_dir, "output")
         self.qb_md_path = os.path.join(self.output_dir, "QB.md")
+        self.qb_store_path = os.path.join(self.output_dir, "QB.sqlite3")
         self.supported_formats = (".jpg", ".jpeg", ".png", ".heic", ".gif")
 
         # Ensure the output directory and QB.md file exist
@@ -37,18 +42,18 @@ class OutputGenerator:
         if not os.path.exists(self.qb_md_path):
             with open(self.qb_md_path, "w") as qb_md_file:
                 qb_md_file.write("# Image Selection Log\n\n")
-            print(f"QB.md file created at {self.qb_md_path}")
+            log.info("QB.md file created at %s", self.qb_md_path)
 
     def generate_sorted_images(self, selected_folder):
         # Copies, sorts, and renames images from the selected folder into the input directory.
+        # Only new or changed images are copied; known images keep their serial numbers.
+        # Near duplicates of an image already copied in this run are skipped.
         # :param selected_folder: The folder containing images to process.
         # :return: The number of images processed.
-        # Ensure input directory exists and is cleared before processing
         os.makedirs(self.input_dir, exist_ok=True)
-        for file in os.listdir(self.input_dir):
-            os.remove(os.path.join(self.input_dir, file))
+        manifest = IngestManifest(self.input_dir)
 
-        # Find and copy supported images, sorting by modification time
+        # Find supported images, sorting by modification time
         images = [
             os.path.join(selected_folder, file) 
             for file in os.listdir(selected_folder) 
@@ -56,12 +61,17 @@ class OutputGenerator:
         ]
         images.sort(key=os.path.getmtime)
 
-        # Copy images to input folder and rename them sequentially
-        for i, image_path in enumerate(images, start=1):
-            new_name = f"{i}{os.path.splitext(image_path)[1].lower()}"
-            destination = os.path.join(self.input_dir, new_name)
-            shutil.copy2(image_path, destination)
-            print(f"Copied {image_path} to {destination}")
+        # Drop input copies of images that are no longer selected, then bring the rest up to date
+        manifest.retain(images)
+        for image_path in images:
+            with span("ingest", image=image_path):
+                entry, status = manifest.ingest(image_path)
+            count(f"ingest.{status}")
+            if status == "duplicate":
+                log.debug("Skipped '%s': duplicate of '%s'", image_path, entry["duplicate_of"])
+            elif status != "unchanged":
+                log.debug("Copied '%s' to '%s' (%s)", image_path, manifest.target_path(entry), entry["method"])
+        manifest.save()
 
         # Write the number of images selected in QB.md
         self._update_qb_md(len(images))
@@ -70,6 +80,7 @@ class OutputGenerator:
     def _update_qb_md(self, image_count):
         # Updates the QB.md file with the total number of selected images.
         # :param image_count: The number of images processed and stored in the input folder.
-        with open(self.qb_md_path, "a") as qb_md_file:
-            qb_md_file.write(f"{image_count} images selected.\n\n")
-        print(f"Updated QB.md with image count: {image_count}")
+        # The line goes into the question bank store, which regenerates QB.md from it.
+        with QuestionBankStore(self.qb_store_path, self.qb_md_path) as store:
+            store.add_note(f"{image_count} images selected.")
+        log.info("Updated QB.md with image count: %d", image_count)
@@ -0,0 +1,142 @@
+"""
+File name:
+  perceptual_hash.py
+
+Function:
+  Perceptual hashes for spotting the same page photographed twice or re-exported. dHash compares
+  neighbouring pixels of a tiny grayscale thumbnail, so it survives re-encoding, resizing and small
+  exposure changes; near duplicates are found by Hamming distance with a multi-index hash table.
+
+Dependencies:
+  numpy
+  PIL
+  lazy_import
+
+"""
+
+
+# perceptual_hash.py
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+Image = lazy_module("PIL.Image")
+
+HASH_SIZE = 16  # 16 x 16 = 256-bit hashes; 8 x 8 is too coarse to tell similar text pages apart
+# Hashes at most this many bits apart are reported as the same page
+DUPLICATE_DISTANCE = 12
+# ...but only dropped at most this many bits apart. Re-encoded or resized copies of a page land within
+# a few bits, while distinct pages sharing a layout can be as close as 7 bits (or identical at 16 x 16).
+SKIP_DISTANCE = 4
+
+# Fixed shuffle of the 256 hash bits. Distances are unchanged, but the blank margins of a page no
+# longer turn whole runs of bits into zeros, which keeps HashIndex's chunk buckets small. Spelled
+# out rather than drawn from a seeded RNG: the hashes are stored in ingest manifests, so the order
+# must never change with a library upgrade.
+BIT_ORDER_256 = (
+    182, 110,  13, 123,  46,  95, 250, 112, 185, 208, 100,  88, 167, 204,  83,  14,
+     20, 198,  49, 248, 228, 133, 203, 241, 229,  47,  73,  12, 168, 235, 246, 251,
+     99,  26,  60, 200,  55, 206,  57, 142, 116, 136,  48, 242,  53,  75,  25, 159,
+     97,  33,  90, 180, 134, 183, 160, 105, 101,  44, 210, 127, 220,  71,  84, 120,
+    152, 227,  36,  70,  38,  35,  16, 172, 170,  67, 145, 236, 131,   9,  27,  24,
+     51,  39, 219, 190,  80, 217, 132, 247, 238, 138,  40,  77, 161, 231, 177,   5,
+      8, 108, 114,  78,  68, 119, 129, 239,  45, 192,  94,  74,  10, 188, 128,  15,
+    147, 176, 197, 143,  52, 154, 233, 212, 171, 215, 106,  28,  17,  79,  37, 223,
+    117, 199,  58, 163,  54, 230, 214,  34,  23,  19, 226, 202, 140, 111,   4,  18,
+    104,  41, 218,  56, 118, 184, 255,  91,  82,  11, 252, 213,  81, 135,  66,  92,
+    201, 196,   2, 122,  32, 173,   1, 211, 150, 205,  50, 103,  22, 245, 165,  96,
+     72,  89, 121, 207, 113, 156,   3,  64, 115,  63,   6,  21, 149, 194, 195, 141,
+     98,  43, 166,  85, 237, 186, 153, 232, 155, 193,  59, 102, 189,  62, 221, 109,
+    125, 254,  42, 175, 157,  65, 164,   0, 187, 139, 158,  93, 178, 162,  86, 174,
+    224, 148, 209, 249, 169, 225, 137, 151, 130,  69, 181,   7, 234, 253, 124,  87,
+    243,  61, 222, 179, 107, 146, 191, 126,  31,  29, 244, 216, 240,  76, 144,  30,
+)
+
+def _bit_order(bit_count):
+    # Other hash sizes keep their bits in order.
+    return np.asarray(BIT_ORDER_256 if bit_count == len(BIT_ORDER_256) else range(bit_count))
+
+def dhash_image(image, hash_size=HASH_SIZE):
+    """
+    Difference hash of a PIL image.
+
+    Args:
+        image (PIL.Image.Image): The image.
+        hash_size (int): Hash side; the hash has hash_size ** 2 bits.
+
+    Returns:
+        int: The hash.
+    """
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()[_bit_order(hash_size * hash_size)]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def dhash_file(path, hash_size=HASH_SIZE):
+    """
+    Difference hash of an image file.
+
+    JPEGs are decoded in draft mode at a reduced scale, so hashing costs a fraction of a full decode.
+
+    Returns:
+        int: The hash.
+    """
+    with Image.open(path) as image:
+        image.draft("L", (hash_size * 8, hash_size * 8))
+        return dhash_image(image, hash_size)
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+class HashIndex:
+    """
+    Multi-index hashing for near-duplicate lookup under Hamming distance.
+
+    Each hash is cut into max_distance + 1 chunks and filed under every chunk. Two hashes at
+    most max_distance bits apart must agree on at least one whole chunk (pigeonhole), so a
+    lookup only checks the hashes sharing a chunk with the query instead of the whole index.
+    """
+
+    def __init__(self, bits=HASH_SIZE * HASH_SIZE, max_distance=DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        chunk_count = max_distance + 1
+        # (shift, mask) per chunk; chunk widths differ by at most one bit
+        self._chunks = []
+        start = 0
+        for index in range(chunk_count):
+            width = bits // chunk_count + (index < bits % chunk_count)
+            self._chunks.append((start, (1 << width) - 1))
+            start += width
+        self._tables = [{} for _ in self._chunks]  # Chunk value -> positions in _items
+        self._items = []  # (hash, value)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, hash_value, value):
+        position = len(self._items)
+        self._items.append((hash_value, value))
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((hash_value >> shift) & mask, []).append(position)
+
+    def search(self, hash_value, max_distance=None):
+        """
+        Find every stored value whose hash is within max_distance of hash_value.
+
+        Args:
+            hash_value (int): The query hash.
+            max_distance (int): At most the index's max_distance; defaults to it.
+
+        Returns:
+            list of tuple: (distance, value), nearest first.
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        found = {}
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for position in table.get((hash_value >> shift) & mask, ()):
+                if position in found:
+                    continue
+                candidate, value = self._items[position]
+                distance = hamming(hash_value, candidate)
+                found[position] = (distance, value) if distance <= max_distance else None
+        return sorted((match for match in found.values() if match), key=lambda match: match[0])
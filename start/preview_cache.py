@@ -0,0 +1,173 @@
+"""
+File name:
+  preview_cache.py
+
+Function:
+  Persistent cache of downscaled preview images for the selection screen, keyed by the source image hash.
+  JPEG sources are decoded at reduced size (draft mode) on a cache miss instead of a full decode.
+
+Dependencies:
+  os
+  threading
+  PIL
+  ingest_manifest
+  instrumentation
+  lazy_import
+
+"""
+
+
+# preview_cache.py
+
+import os
+import tempfile
+import threading
+from lazy_import import lazy_module
+from ingest_manifest import hash_file
+from instrumentation import get_logger, span, count
+
+Image = lazy_module("PIL.Image")
+PngImagePlugin = lazy_module("PIL.PngImagePlugin")
+
+PREVIEW_CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'cache', 'previews')
+PREVIEW_MAX_HEIGHT = 500
+
+# PNG text chunk holding the preview/original scale factor
+SCALE_KEY = "qbet_scale"
+
+log = get_logger("preview")
+
+def decode_preview(image_path, max_height=PREVIEW_MAX_HEIGHT):
+    """
+    Decode an image scaled down to at most max_height pixels high.
+
+    Args:
+        image_path (str): The source image.
+        max_height (int): Height limit of the preview.
+
+    Returns:
+        tuple: (PIL.Image preview, scale factor from original to preview coordinates).
+    """
+    with span("decode.preview", image=image_path):
+        return _decode_preview(image_path, max_height)
+
+def _decode_preview(image_path, max_height):
+    image = Image.open(image_path)
+    width, height = image.size
+
+    if height > max_height:
+        scale_factor = max_height / height
+        new_width, new_height = max(1, int(width * scale_factor)), max_height
+    else:
+        scale_factor = 1.0
+        new_width, new_height = width, height
+
+    if image.format == "JPEG" and scale_factor < 1.0:
+        # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while staying above the target size
+        image.draft("RGB", (new_width, new_height))
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    if image.size != (new_width, new_height):
+        image = image.resize((new_width, new_height), Image.LANCZOS)
+    else:
+        image.load()
+    return image, scale_factor
+
+class PreviewCache:
+    """
+    Previews stored as PNG files named after the SHA-256 of their source and the height limit.
+
+    The scale factor travels inside the PNG as a text chunk. Source hashes are memoized by
+    path, size and mtime, so an image that has not changed is only hashed once per run.
+    """
+
+    def __init__(self, cache_dir=PREVIEW_CACHE_DIR, max_height=PREVIEW_MAX_HEIGHT):
+        self.cache_dir = cache_dir
+        self.max_height = max_height
+        self.hits = 0
+        self.misses = 0
+        self._hashes = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def source_hash(self, image_path):
+        stat = os.stat(image_path)
+        memo_key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(memo_key)
+        if digest is None:
+            digest = hash_file(image_path)
+            with self._lock:
+                self._hashes[memo_key] = digest
+        return digest
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}-{self.max_height}.png")
+
+    def load(self, image_path):
+        """
+        Return the preview of an image, decoding and caching it on a miss.
+
+        Args:
+            image_path (str): The source image.
+
+        Returns:
+            tuple: (PIL.Image preview, scale factor from original to preview coordinates).
+        """
+        path = self._path(self.source_hash(image_path))
+        try:
+            preview = Image.open(path)
+            preview.load()
+            scale_factor = float(preview.info[SCALE_KEY])
+            with self._lock:
+                self.hits += 1
+            count("preview.hit")
+            return preview, scale_factor
+        except (OSError, KeyError, ValueError):
+            pass
+
+        preview, scale_factor = decode_preview(image_path, self.max_height)
+        with self._lock:
+            self.misses += 1
+        count("preview.miss")
+        try:
+            self._store(path, preview, scale_factor)
+        except OSError as e:
+            log.warning("Could not cache preview of '%s': %s", image_path, e)
+        return preview, scale_factor
+
+    def _store(self, path, preview, scale_factor):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        info = PngImagePlugin.PngInfo()
+        info.add_text(SCALE_KEY, repr(scale_factor))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                preview.save(tmp_file, format="PNG", pnginfo=info, compress_level=1)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def load_preview(image_path, max_height=PREVIEW_MAX_HEIGHT):
+    """
+    Load a preview through the shared cache.
+
+    Args:
+        image_path (str): The source image.
+        max_height (int): Height limit of the preview.
+
+    Returns:
+        tuple: (PIL.Image preview, scale factor from original to preview coordinates).
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.max_height != max_height:
+            _default_cache = PreviewCache(max_height=max_height)
+        cache = _default_cache
+    return cache.load(image_path)
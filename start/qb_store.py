@@ -0,0 +1,378 @@
+"""
+File name:
+  qb_store.py
+
+Function:
+  Indexed SQLite store for the question bank (questions, answers, correct flags, source image and region),
+  with a full-text index for fast lookup. QB.md is generated from the store, re-rendering only changed sections
+  and rewriting the file only from the first changed section on.
+  An existing QB.md is imported once, in one transaction; lines that are not answers are kept as the
+  question's notes, so nothing in a hand-edited file is lost when the store rewrites it.
+
+Dependencies:
+  os
+  sqlite3
+  threading
+  markdown_updater
+  instrumentation
+
+"""
+
+
+# qb_store.py
+
+import os
+import time
+import sqlite3
+import threading
+from markdown_updater import (MARKDOWN_FILE_PATH, MARKDOWN_HEADER, DEFAULT_BATCH_SIZE,
+                              single_line, format_question, format_answer, parse_answer, parse_markdown,
+                              atomic_write)
+from instrumentation import get_logger, span, count
+
+STORE_FILE_PATH = "output/QB.sqlite3"
+
+log = get_logger("store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE,
+    source_image TEXT,
+    region INTEGER,
+    created_at REAL NOT NULL,
+    notes TEXT,
+    rendered TEXT,
+    exported INTEGER NOT NULL DEFAULT 0,
+    md_offset INTEGER
+);
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    question_id INTEGER NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+    text TEXT NOT NULL,
+    is_correct INTEGER NOT NULL DEFAULT 0,
+    source_image TEXT,
+    region INTEGER,
+    created_at REAL NOT NULL,
+    UNIQUE (question_id, text)
+);
+CREATE INDEX IF NOT EXISTS answers_by_question ON answers(question_id);
+CREATE INDEX IF NOT EXISTS questions_stale ON questions(id) WHERE rendered IS NULL;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS qb_fts USING fts5(text, kind UNINDEXED, question_id UNINDEXED);
+"""
+
+def _encode(text):
+    # The bytes text mode writes for text, so section offsets match the file on every platform.
+    return text.replace("\n", os.linesep).encode("utf-8")
+
+class QuestionBankStore:
+    """
+    The question bank in SQLite, with QB.md as an export.
+
+    add() takes a question, an answer and its provenance, and batches: changes are committed
+    and exported every batch_size answers and on flush()/close(). Texts are stored on one line
+    (see markdown_updater.single_line), as QB.md shows them. A question's markdown is cached in
+    its row and cleared when the question changes.
+
+    Each exported section's byte offset in QB.md is kept in its row. If QB.md is untouched since
+    the last export, the file is rewritten in place from the first changed section on (new
+    questions alone are just appended), so adding an answer to a recent question costs about the
+    size of that section. The file is rebuilt and atomically replaced when it was edited outside
+    the store, when the preamble changed, or when a changed section's offset is unknown (sections
+    imported from a hand-written QB.md).
+    """
+
+    def __init__(self, db_path=STORE_FILE_PATH, markdown_file_path=MARKDOWN_FILE_PATH, batch_size=DEFAULT_BATCH_SIZE):
+        self.db_path = db_path
+        self.markdown_file_path = markdown_file_path
+        self.batch_size = batch_size
+        self._pending = 0
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        # Stores created before these columns existed
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(questions)")}
+        for column in ("notes TEXT", "md_offset INTEGER"):
+            if column.split()[0] not in columns:
+                self.conn.execute(f"ALTER TABLE questions ADD COLUMN {column}")
+        try:
+            self.conn.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; search falls back to LIKE scans
+            self.has_fts = False
+        self.conn.commit()
+
+        # An import that did not finish left nothing behind (it is one transaction), so it simply runs again
+        if (self.get_meta("imported") is None and os.path.exists(markdown_file_path)
+                and self.conn.execute("SELECT 1 FROM questions LIMIT 1").fetchone() is None):
+            self.import_markdown(markdown_file_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, None if value is None else str(value)))
+
+    @property
+    def preamble(self):
+        return self.get_meta("preamble", MARKDOWN_HEADER)
+
+    def add_note(self, text):
+        # Append a line to the text above the first question (e.g. "12 images selected.").
+        with self._lock:
+            self.set_meta("preamble", f"{self.preamble}{text}\n\n")
+            self.set_meta("preamble_changed", 1)  # It is at the top, so the whole file is rewritten
+            self._pending += 1
+
+    def _index(self, text, kind, question_id):
+        if self.has_fts:
+            self.conn.execute("INSERT INTO qb_fts (text, kind, question_id) VALUES (?, ?, ?)", (text, kind, question_id))
+
+    def question_id(self, question_text):
+        row = self.conn.execute("SELECT id FROM questions WHERE text = ?", (single_line(question_text),)).fetchone()
+        return row[0] if row else None
+
+    def add(self, question_text, answer_text, is_correct=False, source_image=None, region=None, answer_region=None):
+        """
+        Add an answer under its question, creating the question if needed.
+
+        Args:
+            question_text (str): The text of the question.
+            answer_text (str): The text of the answer.
+            is_correct (bool): Flag indicating if the answer is marked as correct.
+            source_image (str): The image the question and answer were cropped from.
+            region (int): Region number of the question crop.
+            answer_region (int): Region number of the answer crop.
+
+        Returns:
+            bool: True if the bank changed.
+        """
+        question_text, answer_text = single_line(question_text), single_line(answer_text)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT id FROM questions WHERE text = ?", (question_text,)).fetchone()
+            question_id = row[0] if row else None
+            if question_id is None:
+                cursor = self.conn.execute(
+                    "INSERT INTO questions (text, source_image, region, created_at) VALUES (?, ?, ?, ?)",
+                    (question_text, source_image, region, now))
+                question_id = cursor.lastrowid
+                self._index(question_text, "question", question_id)
+
+            row = self.conn.execute("SELECT id, is_correct FROM answers WHERE question_id = ? AND text = ?",
+                                    (question_id, answer_text)).fetchone()
+            if row is None:
+                self.conn.execute(
+                    "INSERT INTO answers (question_id, text, is_correct, source_image, region, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (question_id, answer_text, int(is_correct), source_image, answer_region, now))
+                self._index(answer_text, "answer", question_id)
+            elif bool(row[1]) != bool(is_correct):
+                self.conn.execute("UPDATE answers SET is_correct = ? WHERE id = ?", (int(is_correct), row[0]))
+            else:
+                return False
+
+            self.conn.execute("UPDATE questions SET rendered = NULL WHERE id = ?", (question_id,))
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self.flush()
+            return True
+
+    def answers(self, question_text):
+        """
+        Return the answers of a question.
+
+        Returns:
+            list of tuple: (answer text, is_correct) in insertion order.
+        """
+        return [(text, bool(is_correct)) for text, is_correct in self.conn.execute(
+            "SELECT a.text, a.is_correct FROM answers a JOIN questions q ON q.id = a.question_id "
+            "WHERE q.text = ? ORDER BY a.id", (single_line(question_text),))]
+
+    def search(self, query, limit=20):
+        """
+        Find questions whose text or answers match a full-text query.
+
+        Args:
+            query (str): FTS5 query, e.g. "capital France" or "capit*".
+            limit (int): Maximum number of questions returned.
+
+        Returns:
+            list of str: Matching question texts, best match first.
+        """
+        if self.has_fts:
+            rows = self.conn.execute(
+                "SELECT q.text FROM qb_fts f JOIN questions q ON q.id = f.question_id "
+                "WHERE qb_fts MATCH ? GROUP BY q.id ORDER BY min(f.rank) LIMIT ?", (query, limit))
+        else:
+            pattern = f"%{query}%"
+            rows = self.conn.execute(
+                "SELECT DISTINCT q.text FROM questions q LEFT JOIN answers a ON a.question_id = q.id "
+                "WHERE q.text LIKE ? OR q.notes LIKE ? OR a.text LIKE ? LIMIT ?", (pattern, pattern, pattern, limit))
+        return [row[0] for row in rows]
+
+    def import_markdown(self, markdown_file_path):
+        """
+        Seed the store from an existing QB.md.
+
+        The preamble, every question (with or without answers) and every answer are inserted in
+        one transaction, without the batched flushes of add(). Lines of a section that are not
+        answers are kept as the question's notes. The file itself is not rewritten: it is
+        recorded as exported, so later questions are appended to it.
+
+        Args:
+            markdown_file_path (str): The QB.md to import.
+        """
+        with open(markdown_file_path, "r", encoding="utf-8") as md_file:
+            text = md_file.read()
+            size = os.fstat(md_file.fileno()).st_size
+        if not text.strip():
+            return
+        preamble, sections = parse_markdown(text)
+        now = time.time()
+        with self._lock, span("markdown_import", questions=len(sections)):
+            try:
+                self.set_meta("preamble", preamble or "")
+                for question_text, lines in sections.items():
+                    answers, notes = [], []
+                    for line in lines:
+                        parsed = parse_answer(line)
+                        if parsed is not None:
+                            answers.append(parsed)
+                        else:
+                            notes.append(line)
+                    question_text = single_line(question_text)
+                    notes = "\n".join(notes) or None
+                    cursor = self.conn.execute("INSERT OR IGNORE INTO questions (text, created_at) VALUES (?, ?)",
+                                               (question_text, now))
+                    question_id = self.question_id(question_text)
+                    if cursor.rowcount:
+                        self._index(question_text, "question", question_id)
+                    if notes is not None:
+                        # Headings that only differ in whitespace are one question; their notes are joined
+                        self.conn.execute("UPDATE questions SET notes = coalesce(notes || char(10), '') || ? WHERE id = ?",
+                                          (notes, question_id))
+                        self._index(notes, "note", question_id)
+                    for answer_text, is_correct in answers:
+                        cursor = self.conn.execute(
+                            "INSERT OR IGNORE INTO answers (question_id, text, is_correct, created_at) VALUES (?, ?, ?, ?)",
+                            (question_id, answer_text, int(is_correct), now))
+                        if cursor.rowcount:
+                            self._index(answer_text, "answer", question_id)
+                self._render_stale_sections()
+                self.conn.execute("UPDATE questions SET exported = 1")
+                self.set_meta("exported_size", size)
+                self.set_meta("imported", markdown_file_path)
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+        count("markdown.imported_questions", len(sections))
+        log.info("Imported %d questions from %s.", len(sections), markdown_file_path)
+
+    def _render_stale_sections(self):
+        stale = self.conn.execute("SELECT id, text, notes FROM questions WHERE rendered IS NULL").fetchall()
+        for question_id, question_text, notes in stale:
+            notes = "".join(f"{line}\n" for line in notes.splitlines()) if notes else ""
+            answers = "".join(f"{format_answer(text, is_correct)}\n" for text, is_correct in self.conn.execute(
+                "SELECT text, is_correct FROM answers WHERE question_id = ? ORDER BY id", (question_id,)))
+            self.conn.execute("UPDATE questions SET rendered = ? WHERE id = ?",
+                              (f"{format_question(question_text)}\n\n{notes}{answers}\n", question_id))
+        return len(stale)
+
+    def export_markdown(self):
+        """
+        Bring QB.md up to date with the store.
+
+        Returns:
+            str: "unchanged", "appended", "patched" (rewritten from the first changed section on)
+            or "rewritten".
+        """
+        with self._lock:
+            # Sections are in the file in id order; the first exported one that changed is where writing starts
+            first_changed = self.conn.execute(
+                "SELECT id, md_offset FROM questions WHERE rendered IS NULL AND exported = 1 ORDER BY id LIMIT 1").fetchone()
+            stale = self._render_stale_sections()
+            exported_size = self.get_meta("exported_size")
+            preamble_changed = self.get_meta("preamble_changed") is not None
+            if not stale and not preamble_changed and exported_size is not None:
+                return "unchanged"
+
+            try:
+                current_size = os.path.getsize(self.markdown_file_path)
+            except OSError:
+                current_size = None
+            untouched = exported_size is not None and current_size == int(exported_size) and not preamble_changed
+
+            if untouched and first_changed is None:
+                mode, start, first_id = "appended", int(exported_size), None
+            elif untouched and first_changed[1] is not None:
+                mode, start, first_id = "patched", first_changed[1], first_changed[0]
+            else:
+                mode, start, first_id = "rewritten", len(_encode(self.preamble)), None
+
+            if mode == "appended":
+                rows = self.conn.execute("SELECT id, rendered FROM questions WHERE exported = 0 ORDER BY id")
+            elif mode == "patched":
+                rows = self.conn.execute("SELECT id, rendered FROM questions WHERE id >= ? ORDER BY id", (first_id,))
+            else:
+                rows = self.conn.execute("SELECT id, rendered FROM questions ORDER BY id")
+            sections, placed, position = [], [], start
+            for question_id, rendered in rows:
+                sections.append(rendered)
+                placed.append((position, question_id))
+                position += len(_encode(rendered))
+
+            if mode == "rewritten":
+                atomic_write(self.markdown_file_path, self.preamble + "".join(sections))
+            else:
+                # Not atomic: if this is interrupted, the unknown size forces a full rewrite next time
+                self.set_meta("exported_size", None)
+                self.conn.commit()
+                with open(self.markdown_file_path, "r+b") as md_file:
+                    md_file.seek(start)
+                    md_file.write(_encode("".join(sections)))
+                    md_file.truncate()
+                    md_file.flush()
+                    os.fsync(md_file.fileno())
+
+            self.conn.executemany("UPDATE questions SET md_offset = ?, exported = 1 WHERE id = ?", placed)
+            self.conn.execute("DELETE FROM meta WHERE key = 'preamble_changed'")
+            self.set_meta("exported_size", os.path.getsize(self.markdown_file_path))
+            self.conn.commit()
+            return mode
+
+    def flush(self):
+        # Commit point: commit the database and export the changed sections to QB.md.
+        with self._lock, span("markdown_write", changes=self._pending):
+            self.conn.commit()
+            mode = self.export_markdown()
+            count(f"markdown.{mode}")
+            if mode != "unchanged":
+                log.info("Updated %s (%s) with %d changes.", self.markdown_file_path, mode, self._pending)
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.conn.close()
@@ -0,0 +1,125 @@
+"""
+File name:
+  qb_viewer.py
+
+Function:
+  Line index over QB.md for the viewer in Interface3. The file is memory-mapped, only the bytes added
+  since the last refresh are indexed, and only the requested window of lines is decoded.
+
+Dependencies:
+  os
+  mmap
+  array
+  hashlib
+
+"""
+
+
+# qb_viewer.py
+
+import os
+import mmap
+import hashlib
+from array import array
+
+# Bytes before the previous end of file that must be unchanged for a refresh to count as an append
+TAIL_CHECK_BYTES = 4096
+
+class LineIndex:
+    """
+    Offsets of the line starts in a text file that mostly grows at the end.
+
+    refresh() compares size, mtime and a digest of the bytes just before the old end of file. If
+    the old content is intact (the file was appended to, or atomically replaced by a longer copy
+    with the same prefix) only the new bytes are scanned; otherwise the index is rebuilt.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.mtime_ns = None
+        self._offsets = array("Q", [0])  # Start offset of every line, plus one for a line in progress
+        self._tail_digest = None
+
+    def _reset(self):
+        self.size = 0
+        self.mtime_ns = None
+        self._offsets = array("Q", [0])
+        self._tail_digest = None
+
+    @staticmethod
+    def _digest(data):
+        return hashlib.sha1(data).digest()
+
+    def _tail_range(self):
+        return max(0, self.size - TAIL_CHECK_BYTES), self.size
+
+    def refresh(self):
+        """
+        Bring the index up to date with the file.
+
+        Returns:
+            str: "unchanged", "appended", "reloaded" or "missing".
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return "missing"
+        if stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns:
+            return "unchanged"
+
+        with open(self.path, "rb") as qb_file:
+            if stat.st_size == 0:
+                self._reset()
+                self.mtime_ns = stat.st_mtime_ns
+                return "reloaded"
+            with mmap.mmap(qb_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                start, end = self._tail_range()
+                intact = len(mapped) >= self.size and self._tail_digest == self._digest(mapped[start:end])
+                if not intact:
+                    self._reset()
+                mode = "appended" if intact else "reloaded"
+                self._scan(mapped, self.size, len(mapped))
+                self.size = len(mapped)
+                start, end = self._tail_range()
+                self._tail_digest = self._digest(mapped[start:end])
+        self.mtime_ns = stat.st_mtime_ns
+        return mode
+
+    def _scan(self, mapped, start, end):
+        offsets = self._offsets
+        position = mapped.find(b"\n", start, end)
+        while position != -1:
+            offsets.append(position + 1)
+            position = mapped.find(b"\n", position + 1, end)
+
+    @property
+    def line_count(self):
+        # A trailing newline does not start another line.
+        if self._offsets[-1] == self.size:
+            return len(self._offsets) - 1
+        return len(self._offsets)
+
+    def lines(self, first, count):
+        """
+        Decode a window of lines.
+
+        Args:
+            first (int): Index of the first line.
+            count (int): Number of lines wanted.
+
+        Returns:
+            list of str: The lines, without line endings.
+        """
+        total = self.line_count
+        first = max(0, min(first, total))
+        last = min(total, first + count)
+        if last <= first:
+            return []
+        start = self._offsets[first]
+        end = self._offsets[last] if last < len(self._offsets) else self.size
+        with open(self.path, "rb") as qb_file:
+            with mmap.mmap(qb_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped[start:min(end, len(mapped))]
+        return data.decode("utf-8", errors="replace").splitlines()
@@ -4,10 +4,19 @@ File name:
 
 Function:
   Provides pixel selection and cropping tools for images, handles the cropping of selected areas.
+  Question and answer boxes are proposed by layout_detector; the operator only corrects them
+  (drag to add, right-click to remove, Ctrl+Z to undo). With a JobScheduler, detection runs off the Tk thread.
+  If detection fails or finds no text blocks, a status line under the image says so.
 
 Dependencies:
   tkinter
   PIL
+  preview_cache
+  canvas_scene
+  layout_detector
+  job_scheduler
+  instrumentation
+  lazy_import
   
 """
 
@@ -15,43 +24,47 @@ Dependencies:
 # celection_tool.py
 
 import tkinter as tk
-from PIL import Image, ImageTk # type: ignore
+from lazy_import import lazy_module
+from preview_cache import load_preview
+from canvas_scene import SelectionScene
+from layout_detector import detect_layout
+from job_scheduler import INTERACTIVE
+from instrumentation import get_logger
+
+ImageTk = lazy_module("PIL.ImageTk")
+
+log = get_logger("layout")
 
 class SelectionTool(tk.Frame):
-    def __init__(self, parent, image_path, callback):
+    def __init__(self, parent, image_path, callback, preview=None, auto_detect=True, scheduler=None):
         super().__init__(parent)
         self.image_path = image_path
+        self.preview = preview  # (image, scale factor) already decoded, e.g. by the prefetcher
         self.callback = callback
+        self.scheduler = scheduler
         self.selected_areas = []  # Store selected areas
-        self.start_x = self.start_y = 0
-        self.rect = None
         self.load_image()  # Load and scale image
         self.setup_tool()  # Initialize selection tool components
+        if auto_detect:
+            self.propose_areas()  # Pre-populate with detected question/answer boxes
 
     def load_image(self):
-        original_image = Image.open(self.image_path)
-        width, height = original_image.size
-        new_height = 500  # Set height limit
-
-        if height > new_height:
-            scale_factor = new_height / height
-            new_width = int(width * scale_factor)
-            new_height = new_height
-        else:
-            new_width, new_height = width, height
-
-        self.image = original_image.resize((new_width, new_height), Image.LANCZOS)
+        # Downscaled preview (height limit 500) from the preview cache; scale_factor maps original to preview coordinates
+        self.image, self.scale_factor = self.preview or load_preview(self.image_path)
         self.image_tk = ImageTk.PhotoImage(self.image)
 
     def setup_tool(self):
         self.canvas = tk.Canvas(self, width=self.image.width, height=self.image.height)
         self.canvas.pack()
-        self.canvas.create_image(0, 0, anchor="nw", image=self.image_tk)
+        self.status_label = tk.Label(self, text="")  # Why no boxes were proposed, if none were
+        self.status_label.pack()
+        self.scene = SelectionScene(self.canvas, self.image_tk)  # Background, rubber band and one item per area
 
         # Bind mouse events for selection
         self.canvas.bind("<ButtonPress-1>", self.start_selection)
         self.canvas.bind("<B1-Motion>", self.update_selection)
         self.canvas.bind("<ButtonRelease-1>", self.end_selection)
+        self.canvas.bind("<Button-3>", self.remove_selection)  # Right-click drops a wrong box
 
         self.select_button = tk.Button(self, text="Select answers", command=self.on_select_answers)
         self.select_button.pack(pady=10)
@@ -60,34 +73,66 @@ class SelectionTool(tk.Frame):
         # Bind Ctrl+Z for undo
         self.master.bind("<Control-z>", self.undo_selection)
 
+    def propose_areas(self):
+        # Boxes are detected on the preview, so they are already in canvas coordinates.
+        self.status_label.config(text="Detecting question and answer boxes...")
+        if self.scheduler is not None:
+            self.scheduler.submit(detect_layout, self.image, priority=INTERACTIVE, on_done=self.add_proposed_areas,
+                                  on_error=self.on_detect_failed)
+            return
+        try:
+            areas = detect_layout(self.image)
+        except Exception as e:
+            self.on_detect_failed(e)
+            return
+        self.add_proposed_areas(areas)
+
+    def on_detect_failed(self, error):
+        log.warning("Box detection failed for '%s': %s", self.image_path, error)
+        if self.winfo_exists():
+            self.status_label.config(text="Box detection failed; drag to select the question and answers.")
+
+    def add_proposed_areas(self, areas):
+        # Detection may finish after the widget is gone or the operator has started drawing; then it is dropped.
+        if not self.winfo_exists():
+            return
+        no_boxes = not areas and not self.selected_areas
+        self.status_label.config(text="No text blocks found; drag to select the question and answers." if no_boxes else "")
+        if not areas or self.selected_areas:
+            return
+        for area in areas:
+            self.selected_areas.append(area)
+            self.scene.add(area)
+        self.update_select_button()
+
     def start_selection(self, event):
-        self.start_x, self.start_y = event.x, event.y
-        if self.rect:
-            self.canvas.delete(self.rect)
+        self.scene.begin(event.x, event.y)
 
     def update_selection(self, event):
-        cur_x, cur_y = event.x, event.y
-        if self.rect:
-            self.canvas.delete(self.rect)
-        self.rect = self.canvas.create_rectangle(self.start_x, self.start_y, cur_x, cur_y, outline="red")
+        self.scene.drag(event.x, event.y)
 
     def end_selection(self, event):
-        end_x, end_y = event.x, event.y
-        selected_area = (self.start_x, self.start_y, end_x, end_y)
+        selected_area = self.scene.end(event.x, event.y)  # Show the selected area on canvas
         self.selected_areas.append(selected_area)
-        self.redraw_canvas()  # Show the selected area on canvas
-        self.select_button.pack()
+        self.update_select_button()
 
     def undo_selection(self, event=None):
         if self.selected_areas:
             self.selected_areas.pop()
-            self.redraw_canvas()
-
-    def redraw_canvas(self):
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor="nw", image=self.image_tk)
-        for area in self.selected_areas:
-            self.canvas.create_rectangle(area, outline="red", width=2)
+            self.scene.pop()
+            self.update_select_button()
+
+    def remove_selection(self, event):
+        # Remove the most recent area under the pointer.
+        for index in reversed(range(len(self.selected_areas))):
+            x0, y0, x1, y1 = self.selected_areas[index]
+            if min(x0, x1) <= event.x <= max(x0, x1) and min(y0, y1) <= event.y <= max(y0, y1):
+                del self.selected_areas[index]
+                self.scene.remove(index)
+                self.update_select_button()
+                return
+
+    def update_select_button(self):
         self.select_button.pack() if self.selected_areas else self.select_button.pack_forget()
 
     def on_select_answers(self):
@@ -0,0 +1,90 @@
+"""
+File name:
+  startup_report.py
+
+Function:
+  Import-time report for the GUI's startup. Runs `python -X importtime -c "import main"` in a fresh
+  interpreter (a few times, keeping the fastest run), prints the slowest modules by cumulative and by own
+  time, and fails if importing main.py takes more than its share of STARTUP_BUDGET or pulls in one of
+  the modules that are meant to load only after the first window (DEFERRED_MODULES in main.py).
+
+Dependencies:
+  os
+  sys
+  argparse
+  subprocess
+  main
+
+"""
+
+
+# startup_report.py
+
+import os
+import sys
+import argparse
+import subprocess
+from main import STARTUP_BUDGET, DEFERRED_MODULES
+
+DEFAULT_RUNS = 3
+DEFAULT_TOP = 15
+# Share of STARTUP_BUDGET that importing main.py may take; the rest is for building and drawing the window
+IMPORT_SHARE = 0.5
+
+def measure_imports(module="main"):
+    """
+    Import a module in a new interpreter with -X importtime.
+
+    Returns:
+        list: (name, own seconds, cumulative seconds) per imported module, in import order.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Column header
+        imports.append((fields[2].strip(), int(fields[0]) / 1e6, int(fields[1]) / 1e6))
+    return imports
+
+def total_time(imports, module="main"):
+    return next(cumulative for name, _, cumulative in imports if name == module)
+
+def print_table(title, rows):
+    print(title)
+    for name, own, cumulative in rows:
+        print(f"  {cumulative * 1000:8.1f} ms  {own * 1000:8.1f} ms  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Show which imports slow down the start of main.py.")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="Measurements; the fastest one is reported.")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="Modules listed per table.")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET * IMPORT_SHARE,
+                        help="Seconds importing main.py may take.")
+    args = parser.parse_args()
+
+    imports = min((measure_imports() for _ in range(max(1, args.runs))), key=total_time)
+    total = total_time(imports)
+    print(f"import main: {total * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms), {len(imports)} modules")
+    print_table("Slowest by cumulative time (cumulative, own, module):",
+                sorted(imports, key=lambda row: row[2], reverse=True)[:args.top])
+    print_table("Slowest by own time (cumulative, own, module):",
+                sorted(imports, key=lambda row: row[1], reverse=True)[:args.top])
+
+    deferred = {name.split(".")[0] for name in DEFERRED_MODULES}
+    early = [name for name, _, _ in imports if name.split(".")[0] in deferred]
+    failed = False
+    if early:
+        print(f"Imported before the first window, should be deferred: {', '.join(early[:args.top])}")
+        failed = True
+    if total > args.budget:
+        print(f"Over budget by {(total - args.budget) * 1000:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
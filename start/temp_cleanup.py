@@ -3,11 +3,18 @@ File name:
   temp_cleanup.py
 
 Function:
-  Clears the /temp folder when moving to the next question.
+  Clears the /temp folder when moving to the next question. The current temp "generation" is renamed
+  into a trash folder next to it and an empty folder takes its place at once; a low-priority background
+  thread deletes the old generations. If the trash grows past a size cap, cleaning waits for the reaper
+  to bring it back under the cap. Generations left behind by an earlier run are reclaimed as well.
 
 Dependencies:
   os
+  time
+  queue
   shutil
+  threading
+  instrumentation
 
 """
 
@@ -15,38 +22,190 @@ Dependencies:
 # temp_cleanup
 
 import os
+import time
+import queue
 import shutil
+import threading
+from instrumentation import get_logger, span, count
 
-def clean_temp_folder(folder_path):
+# Old generations wait in <parent>/.<name>-trash, on the same filesystem so the rename is atomic
+TRASH_SUFFIX = "-trash"
+# Trash size above which clean_temp_folder blocks until the reaper has caught up
+TRASH_MAX_BYTES = 1024 * 1024 * 1024
+# The reaper yields the CPU and the disk for REAP_PAUSE seconds every REAP_BATCH deleted files
+REAP_BATCH = 64
+REAP_PAUSE = 0.005
+
+log = get_logger("temp")
+
+def trash_folder(folder_path):
+    parent, name = os.path.split(os.path.abspath(folder_path))
+    return os.path.join(parent, f".{name}{TRASH_SUFFIX}")
+
+def _lower_thread_priority():
+    # Linux threads have their own nice value; elsewhere the reaper's pauses have to do.
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+class TempReaper:
+    """
+    Background deleter for renamed-away temp generations.
+
+    Each generation is measured when it is submitted, so pending_bytes counts all trash that
+    is queued or being deleted. reclaim() makes the reaper skip its pauses until pending_bytes
+    is down to a target; the thread keeps its low priority (raising it back needs privileges).
+    """
+
+    def __init__(self, max_bytes=TRASH_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.pending_bytes = 0
+        self._generations = queue.Queue()
+        self._queued = 0
+        self._urgent = 0  # Number of reclaim() calls waiting
+        self._condition = threading.Condition()
+        self._trash_folders = set()  # Trash folders already searched for leftovers
+        self._thread = threading.Thread(target=self._run, name="temp-reaper", daemon=True)
+        self._thread.start()
+
+    def submit(self, path):
+        files, size = _measure(path)
+        with self._condition:
+            self._queued += 1
+            self.pending_bytes += size
+        self._generations.put((path, files, size))
+
+    def adopt_leftovers(self, trash):
+        # Queue generations an earlier run renamed away but did not get to delete.
+        with self._condition:
+            if trash in self._trash_folders:
+                return
+            self._trash_folders.add(trash)
+        try:
+            with os.scandir(trash) as it:
+                leftovers = [entry.path for entry in it]
+        except OSError:
+            return
+        for path in leftovers:
+            self.submit(path)
+
+    def reclaim(self, target_bytes=0):
+        # Block until at most target_bytes of measured trash is left (0: until all trash is gone).
+        with self._condition:
+            self._urgent += 1
+            try:
+                while self.pending_bytes > target_bytes or (target_bytes == 0 and self._queued):
+                    self._condition.wait()
+            finally:
+                self._urgent -= 1
+
+    def _run(self):
+        _lower_thread_priority()
+        while True:
+            path, files, size = self._generations.get()
+            try:
+                self._delete_generation(path, files, size)
+            finally:
+                with self._condition:
+                    self._queued -= 1
+                    self._condition.notify_all()
+
+    def _delete_generation(self, path, files, size):
+        for index, (file_path, file_size) in enumerate(files, 1):
+            try:
+                os.remove(file_path)
+            except OSError as e:
+                log.debug("Error deleting %s: %s", file_path, e)
+            with self._condition:
+                self.pending_bytes -= file_size
+                urgent = self._urgent
+                self._condition.notify_all()
+            if not urgent and index % REAP_BATCH == 0:
+                time.sleep(REAP_PAUSE)
+        shutil.rmtree(path, ignore_errors=True)  # The emptied folders
+        count("temp.reclaimed_bytes", size)
+        log.debug("Deleted old temp generation %s (%d files, %d bytes)", path, len(files), size)
+
+def _measure(path):
+    # Files of a generation with their sizes, and the total; nothing is added to a renamed-away folder.
+    files, size = [], 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            file_path = os.path.join(root, name)
+            try:
+                file_size = os.lstat(file_path).st_size
+            except OSError:
+                file_size = 0
+            files.append((file_path, file_size))
+            size += file_size
+    return files, size
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+def get_reaper():
+    global _reaper
+    with _reaper_lock:
+        if _reaper is None:
+            _reaper = TempReaper()
+        return _reaper
+
+def _delete_contents(folder_path):
+    # Synchronous fallback when the folder cannot be renamed (e.g. a file in it is open on Windows).
+    for filename in os.listdir(folder_path):
+        file_path = os.path.join(folder_path, filename)
+        try:
+            if os.path.isdir(file_path) and not os.path.islink(file_path):
+                shutil.rmtree(file_path)
+            else:
+                os.remove(file_path)
+        except Exception as e:
+            log.warning("Error deleting %s: %s", file_path, e)
+
+def clean_temp_folder(folder_path, wait=False):
     """
-    Clean the temporary folder by deleting all image files.
+    Empty the temporary folder, leaving the actual deletion to a background thread.
 
     Args:
         folder_path (str): The path to the temporary folder.
+        wait (bool): Also wait until every old generation is deleted.
 
     Returns:
         None
     """
-    if os.path.exists(folder_path):
-        # List all files in the temporary folder
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
+    with span("temp_clean"):
+        reaper = get_reaper()
+        trash = trash_folder(folder_path)
+        reaper.adopt_leftovers(trash)
+        try:
+            with os.scandir(folder_path) as it:
+                empty = next(it, None) is None
+        except FileNotFoundError:
+            log.info("The folder %s does not exist.", folder_path)
+            os.makedirs(folder_path, exist_ok=True)
+            empty = True
+
+        if not empty:
+            generation = os.path.join(trash, f"{time.time_ns()}-{os.getpid()}")
             try:
-                # Remove the file
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                    print(f"Deleted file: {file_path}")
-                # If there are directories, remove them
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-                    print(f"Deleted directory: {file_path}")
-            except Exception as e:
-                print(f"Error deleting {file_path}: {e}")
-    else:
-        print(f"The folder {folder_path} does not exist.")
+                os.makedirs(trash, exist_ok=True)
+                os.rename(folder_path, generation)
+                os.makedirs(folder_path, exist_ok=True)
+                reaper.submit(generation)
+            except OSError as e:
+                log.info("Cannot move %s aside (%s); deleting its contents now.", folder_path, e)
+                os.makedirs(folder_path, exist_ok=True)
+                _delete_contents(folder_path)
+
+        if wait:
+            reaper.reclaim(0)
+        elif reaper.pending_bytes > reaper.max_bytes:
+            log.info("Temp trash is over %d bytes; waiting for it to be deleted.", reaper.max_bytes)
+            reaper.reclaim(reaper.max_bytes)
 
 # Example usage
 if __name__ == "__main__":
     # Specify the path to the temp folder
     temp_folder_path = "temp"
-    clean_temp_folder(temp_folder_path)
+    clean_temp_folder(temp_folder_path, wait=True)
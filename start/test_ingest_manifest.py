@@ -0,0 +1,91 @@
+"""
+File name:
+  test_ingest_manifest.py
+
+Function:
+  Tests for near-duplicate handling in IngestManifest: by default distinct pages that share a layout
+  are never dropped, and the "skip" policy only drops close copies. Run with `python -m pytest` or `python -m unittest`.
+
+Dependencies:
+  os
+  shutil
+  tempfile
+  unittest
+  PIL
+  ingest_manifest
+
+"""
+
+
+# test_ingest_manifest.py
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from PIL import Image, ImageDraw
+from ingest_manifest import IngestManifest
+
+ANSWERS = ["Paris", "Berlin", "Madrid", "Rome", "Vienna", "Lisbon", "Oslo", "Prague"]
+
+def question_page(number):
+    # Same layout on every page; only the question number and the answers differ.
+    page = Image.new("RGB", (800, 1000), "white")
+    draw = ImageDraw.Draw(page)
+    draw.text((60, 80), f"Question {number}: which city is the capital?", fill="black")
+    for line in range(3):
+        draw.text((90, 200 + 110 * line), f"{'ABC'[line]}) {ANSWERS[(number + line * 3) % len(ANSWERS)]}", fill="black")
+    return page
+
+class DuplicateTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="qbet-ingest-")
+        self.source = os.path.join(self.folder, "source")
+        self.target = os.path.join(self.folder, "input")
+        os.makedirs(self.source)
+        os.makedirs(self.target)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write_pages(self, count):
+        paths = []
+        for number in range(count):
+            path = os.path.join(self.source, f"page{number:03d}.png")
+            question_page(number).save(path)
+            paths.append(path)
+        return paths
+
+    def test_similar_distinct_pages_are_all_ingested(self):
+        paths = self.write_pages(40)
+        manifest = IngestManifest(self.target)
+        statuses = [manifest.ingest(path)[1] for path in paths]
+        self.assertEqual(statuses.count("new"), len(paths))
+        self.assertEqual(len({entry["serial"] for entry in manifest.entries.values()}), len(paths))
+        # They do hash alike, so they are flagged; nothing is left out of the target folder
+        self.assertTrue(any(entry["duplicate_of"] for entry in manifest.entries.values()))
+        self.assertEqual(len([name for name in os.listdir(self.target) if name.endswith(".png")]), len(paths))
+
+    def test_skip_drops_close_copies_and_flags_look_alikes(self):
+        original, copy, look_alike = self.write_pages(3)
+        hashes = {original: 0, copy: 0b111, look_alike: 0b1111111}  # 3 and 7 bits from the original
+        with mock.patch("ingest_manifest.dhash_file", side_effect=lambda path: hashes[path]):
+            manifest = IngestManifest(self.target, "skip")
+            self.assertEqual(manifest.ingest(original)[1], "new")
+            entry, status = manifest.ingest(copy)
+            self.assertEqual((status, entry["duplicate_of"], entry["target"]), ("duplicate", original, None))
+            entry, status = manifest.ingest(look_alike)
+            self.assertEqual((status, entry["duplicate_of"]), ("new", original))
+            self.assertTrue(os.path.exists(manifest.target_path(entry)))
+
+    def test_flag_is_the_default(self):
+        original, copy = self.write_pages(2)
+        shutil.copy(original, copy)  # Byte-identical second file
+        manifest = IngestManifest(self.target)
+        manifest.ingest(original)
+        entry, status = manifest.ingest(copy)
+        self.assertEqual((status, entry["duplicate_of"]), ("new", original))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+File name:
+  test_ocr_session.py
+
+Function:
+  Tests for OCRSession against ocr_stub_engine: attaching to a running engine, starting one as a
+  process, restarting it after it is killed, and recognizing through it. Run with `python -m pytest`
+  or `python -m unittest`.
+
+Dependencies:
+  socket
+  unittest
+  concurrent.futures
+  ocr_integration
+  ocr_stub_engine
+
+"""
+
+
+# test_ocr_session.py
+
+import socket
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from ocr_integration import OCRSession
+from ocr_stub_engine import start_stub_server, stub_engine_command, TEXT_PREFIX
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+class RecognizeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = start_stub_server()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_attaches_to_a_running_engine(self):
+        with OCRSession(port=self.port, keepalive_interval=0) as session:
+            self.assertIsNone(session.process)
+            self.assertEqual(session.recognize(TEXT_PREFIX + b"Question 1"), "Question 1")
+            self.assertEqual(session.recognize(TEXT_PREFIX), "")  # Engine found no text
+        self.assertEqual(self.server.requests, 2)
+
+    def test_joins_text_blocks(self):
+        with OCRSession(port=self.port, keepalive_interval=0, options={"data.format": "dict"}) as session:
+            self.assertEqual(session.recognize(TEXT_PREFIX + b"A) Paris\nB) Rome"), "A) Paris\nB) Rome")
+
+    def test_counts_concurrent_requests(self):
+        with OCRSession(port=self.port, keepalive_interval=0) as session:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                texts = list(executor.map(session.recognize, (TEXT_PREFIX + str(n).encode() for n in range(64))))
+        self.assertEqual(texts, [str(n) for n in range(64)])
+        self.assertEqual(self.server.requests, 64)
+
+class EngineProcessTest(unittest.TestCase):
+    def setUp(self):
+        self.port = free_port()
+        self.session = OCRSession(command=stub_engine_command(self.port), port=self.port, startup_timeout=30,
+                                  keepalive_interval=0)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_start_launches_the_engine(self):
+        self.session.start()
+        self.assertIsNotNone(self.session.process)
+        self.assertTrue(self.session.is_healthy())
+        self.assertEqual(self.session.recognize(TEXT_PREFIX + b"ready"), "ready")
+
+    def test_recognize_restarts_a_killed_engine(self):
+        self.session.start()
+        first = self.session.process
+        first.kill()
+        first.wait()
+        self.assertEqual(self.session.recognize(TEXT_PREFIX + b"again"), "again")
+        self.assertEqual(self.session.restarts, 1)
+        self.assertIsNot(self.session.process, first)
+
+    def test_close_stops_the_engine(self):
+        self.session.start()
+        process = self.session.process
+        self.session.close()
+        self.assertIsNotNone(process.poll())
+        self.assertFalse(self.session.is_healthy(timeout=0.5))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+File name:
+  test_qb_store.py
+
+Function:
+  Tests for importing an existing QB.md into QuestionBankStore (nothing in the file may be lost, and
+  opening the store must not rewrite it) and for exporting edits without rewriting the whole file.
+  Run with `python -m pytest` or `python -m unittest`.
+
+Dependencies:
+  os
+  shutil
+  tempfile
+  unittest
+  qb_store
+
+"""
+
+
+# test_qb_store.py
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from qb_store import QuestionBankStore
+
+HAND_EDITED = """# Question Bank
+
+Collected by hand.
+
+## What is the capital of France?
+
+* =="Paris"==
+* "Berlin"
+Note: Lyon was accepted in 2019.
+
+## Which planet is largest?
+
+## 2 + 2 = ?
+
+* =="4"==
+
+"""
+
+def numbered_sections(count):
+    return "# Question Bank\n\n" + "".join(f"## Question {i}?\n\n* ==\"Answer {i}\"== \n* \"Wrong {i}\" \n\n"
+                                           for i in range(count))
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="qbet-store-")
+        self.md_path = os.path.join(self.folder, "QB.md")
+        self.db_path = os.path.join(self.folder, "QB.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write_markdown(self, text):
+        with open(self.md_path, "w", encoding="utf-8") as md_file:
+            md_file.write(text)
+
+    def read_markdown(self):
+        with open(self.md_path, "r", encoding="utf-8") as md_file:
+            return md_file.read()
+
+class ImportMarkdownTest(StoreTestCase):
+    def test_notes_and_unanswered_questions_survive(self):
+        self.write_markdown(HAND_EDITED)
+        QuestionBankStore(self.db_path, self.md_path).close()
+        self.assertEqual(self.read_markdown(), HAND_EDITED)  # Opening alone does not touch the file
+
+        # A change to an exported question forces a full rewrite from the store
+        with QuestionBankStore(self.db_path, self.md_path) as store:
+            self.assertTrue(store.add("What is the capital of France?", "Madrid"))
+        text = self.read_markdown()
+        for line in ("Collected by hand.", "Note: Lyon was accepted in 2019.", "## Which planet is largest?",
+                     '* =="Paris"== ', '* "Madrid" ', '* =="4"== '):
+            self.assertIn(line, text)
+
+    def test_large_file_is_imported_whole_without_rewrite(self):
+        text = numbered_sections(1200)
+        self.write_markdown(text)
+        with mock.patch("qb_store.atomic_write") as atomic_write:
+            store = QuestionBankStore(self.db_path, self.md_path, batch_size=500)
+            store.flush()
+        atomic_write.assert_not_called()  # Neither the import nor a flush without changes rewrites QB.md
+        try:
+            self.assertEqual(store.conn.execute("SELECT count(*) FROM questions").fetchone()[0], 1200)
+            self.assertEqual(store.conn.execute("SELECT count(*) FROM answers").fetchone()[0], 2400)
+            self.assertEqual(self.read_markdown(), text)
+
+            store.add("Question 7?", "Another answer")
+            store.flush()
+        finally:
+            store.close()
+        rewritten = self.read_markdown()
+        self.assertEqual(rewritten.count("\n## "), 1200)
+        self.assertIn('* "Another answer" ', rewritten)
+
+    def test_interrupted_import_runs_again(self):
+        text = numbered_sections(50)
+        self.write_markdown(text)
+        with mock.patch.object(QuestionBankStore, "_render_stale_sections", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                QuestionBankStore(self.db_path, self.md_path)
+        with QuestionBankStore(self.db_path, self.md_path) as store:
+            self.assertEqual(store.conn.execute("SELECT count(*) FROM questions").fetchone()[0], 50)
+        self.assertEqual(self.read_markdown(), text)
+
+    def test_multi_line_ocr_text_is_one_line(self):
+        with QuestionBankStore(self.db_path, self.md_path) as store:
+            store.add("What is\nthe capital?", "Paris\nFrance", True)
+        os.remove(self.db_path)
+        with QuestionBankStore(self.db_path, self.md_path) as store:
+            self.assertEqual(store.answers("What is the capital?"), [("Paris France", True)])
+
+class ExportMarkdownTest(StoreTestCase):
+    def test_edit_rewrites_only_from_the_changed_section(self):
+        with QuestionBankStore(self.db_path, self.md_path) as store:
+            for i in range(200):
+                store.add(f"Question {i}?", f"Answer {i}", True)
+        before = self.read_markdown()
+
+        with QuestionBankStore(self.db_path, self.md_path) as store:
+            with mock.patch("qb_store.atomic_write") as atomic_write, \
+                    mock.patch.object(store, "_render_stale_sections", wraps=store._render_stale_sections) as render:
+                store.add("Question 190?", "Another answer")
+                store.add("Question 250?", "Brand new")
+                self.assertEqual(store.export_markdown(), "patched")
+            atomic_write.assert_not_called()
+            render.assert_called_once()
+            after = self.read_markdown()
+            offset = store.conn.execute("SELECT md_offset FROM questions WHERE text = 'Question 190?'").fetchone()[0]
+        # Everything before the changed section is byte for byte what was there
+        self.assertEqual(after.encode()[:offset], before.encode()[:offset])
+        self.assertIn('## Question 190?\n\n* =="Answer 190"== \n* "Another answer" \n\n## Question 191?', after)
+        self.assertTrue(after.endswith('## Question 250?\n\n* "Brand new" \n\n'))
+
+        # The patched file is exactly what a full rebuild from the store produces
+        os.remove(self.md_path)
+        with QuestionBankStore(self.db_path, self.md_path) as store:
+            store.set_meta("exported_size", None)
+            self.assertEqual(store.export_markdown(), "rewritten")
+        self.assertEqual(self.read_markdown(), after)
+
+if __name__ == "__main__":
+    unittest.main()